@@ -1,16 +1,34 @@
 import streamlit as st
-import pandas as pd
 from pathlib import Path
+import os
+import re
+import secrets
 import sys
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, TYPE_CHECKING
 
-# 添加 utils 目錄到路徑
-sys.path.append(str(Path(__file__).parent / "utils"))
+# 添加應用目錄到路徑，以包的形式導入 utils
+sys.path.insert(0, str(Path(__file__).parent))
 
-from csv_parser import load_schools
-from filters import apply_filters, get_filter_options
-from sorting import sort_schools
-from i18n import convert_text
+from utils.filters import apply_filters, get_filter_options
+from utils.feature_query import FeatureIndex, query_error
+from utils.tags import POPULAR_TAGS, TagIndex
+from utils.flags import FLAG_FILTERS, FlagIndex
+from utils.geo import GeoIndex, place_names, place_location, distance_km
+from utils.entities import EntityIndex
+from utils.typeahead import Typeahead, build_typeahead, SOURCE_FIELDS, KIND_NAME, KIND_SPONSOR, KIND_MOTTO, KIND_TERM
+from utils.sorting import sort_schools
+from utils.i18n import convert_text, localize
+from utils.store import SchoolStore, load_store
+from utils.saved_searches import SavedSearchStore, dataset_fingerprint, canonical_spec, describe_spec
+from utils.fields import HOT_FIELDS, DETAIL_FIELDS, LOADED_FIELDS, EXPORT_FIELDS, DEFAULT_EXPORT_FIELDS
+from utils.export import EXPORT_FORMATS, available_formats, deferred_export
+from utils.session_memory import SessionCache, SessionRegistry, deep_size
+
+# 以下模組依賴 pandas / numpy / PIL 或只在特定視圖使用，在使用的函數內導入，
+# 冷啟動渲染第一頁時不需要加載
+if TYPE_CHECKING:
+    from utils.analytics import FacetCube
+    from utils.sqlite_store import SQLiteSchoolStore
 
 # 頁面配置
 st.set_page_config(
@@ -20,22 +38,6 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# 熱門標籤
-POPULAR_TAGS = [
-    'STEAM',
-    'AI/人工智能',
-    '愉快/Happy School',
-    '關愛',
-    '兩文三語/英語教育',
-    '中華文化',
-    '電子學習',
-    '創意',
-    '自主學習',
-    '音樂',
-    '體育',
-    '藝術'
-]
-
 # 固定篩選選項
 FIXED_FILTER_OPTIONS = {
     '資助類型': ['資助', '官立', '私立', '直資'],
@@ -43,27 +45,40 @@ FIXED_FILTER_OPTIONS = {
     '宗教': ['基督教', '天主教', '佛教', '道教', '伊斯蘭教', '不適用'],
     '教學語言': ['中文', '中文及英文', '中文（包括：普通話）', '中文（包括：普通話）及英文'],
     '關聯學校': ['一條龍', '直屬', '聯繫'],
-    '課業安排': ['下午安排導修時間', '小一不設測考', '小一上學期以評估代替測考'],
+    '課業安排': FLAG_FILTERS['課業安排'],
+    '校車及家校組織': FLAG_FILTERS['校車及家校組織'],
 }
 
 # 初始化 session state
-if 'schools' not in st.session_state:
-    st.session_state.schools = []
+# 會話狀態只保存學校 ID 及篩選條件，學校資料從所有會話共用的列表讀取
 if 'language' not in st.session_state:
     st.session_state.language = 'tc'  # 'tc' = 繁體, 'sc' = 簡體
 if 'filter_open' not in st.session_state:
     st.session_state.filter_open = True
-if 'selected_schools' not in st.session_state:
-    st.session_state.selected_schools = []
-if 'detail_school' not in st.session_state:
-    st.session_state.detail_school = None
+if 'selected_ids' not in st.session_state:
+    st.session_state.selected_ids = []
+if 'detail_school_id' not in st.session_state:
+    st.session_state.detail_school_id = None
 if 'show_comparison' not in st.session_state:
     st.session_state.show_comparison = False
+if 'main_view' not in st.session_state:
+    st.session_state.main_view = '學校列表'
 
-# 加載數據
-@st.cache_data
-def load_data():
-    """加載學校數據"""
+# 歷年數據目錄：文件名（不含擴展名）即年度標籤，例如 data/history/2023-24.csv
+HISTORY_DIR = Path(__file__).parent / "data" / "history"
+
+# 本地緩存目錄（詳細資料存儲等）
+CACHE_DIR = Path(__file__).parent / ".cache"
+
+# 設施卡片目錄，由 python -m utils.facility_cards 批量生成
+FACILITY_CARD_DIR = CACHE_DIR / "facility_cards"
+
+# 可單獨重新運行的片段（按鈕及複選框回調用 st.rerun(scope=...) 指定）
+COMPARISON_TRAY_KEY = 'comparison_tray'
+RESULT_LIST_KEY = 'result_list'
+
+def find_csv_path() -> Path:
+    """查找本學年 CSV 文件"""
     # 嘗試多個可能的路徑
     possible_paths = [
         Path(__file__).parent.parent / "attached_assets" / "database_school_info_1763020452726.csv",
@@ -71,19 +86,221 @@ def load_data():
         Path(__file__).parent / "data" / "database_school_info_1763020452726.csv",
     ]
     
-    csv_path = None
     for path in possible_paths:
         if path.exists():
-            csv_path = path
-            break
+            return path
     
+    st.error(f"找不到 CSV 文件。請檢查以下路徑：")
+    for path in possible_paths:
+        st.write(f"- {path.absolute()}")
+    return None
+
+def find_versions() -> Dict[str, Path]:
+    """年度標籤 -> CSV 路徑（由舊到新，最後為本學年）；找不到本學年數據時返回空字典"""
+    csv_path = find_csv_path()
     if not csv_path:
-        st.error(f"找不到 CSV 文件。請檢查以下路徑：")
-        for path in possible_paths:
-            st.write(f"- {path.absolute()}")
-        return []
+        return {}
     
-    return load_schools(csv_path)
+    versions = {}
+    if HISTORY_DIR.exists():
+        for path in sorted(HISTORY_DIR.glob("*.csv")):
+            versions[path.stem] = path
+    versions['本學年'] = csv_path
+    return versions
+
+# 加載數據
+@st.cache_resource
+def load_school_store() -> SchoolStore:
+    """加載所有年度的學校數據（所有會話共用）"""
+    versions = find_versions()
+    if not versions:
+        return SchoolStore()
+    
+    # 列表和篩選欄位常駐內存，詳細資料欄位按需從壓縮存儲讀取；
+    # 快照比 CSV 新時直接讀取快照，不需要解析 CSV
+    return load_store(
+        versions,
+        columns=HOT_FIELDS,
+        detail_fields=DETAIL_FIELDS,
+        detail_path=CACHE_DIR / "details.bin",
+        snapshot_path=CACHE_DIR / "schools.snapshot"
+    )
+
+@st.cache_resource
+def load_sqlite_backend() -> 'SQLiteSchoolStore':
+    """設置 SCHOOL_STORE_BACKEND=sqlite 時，學校數據、篩選選項及篩選結果都從 SQLite 文件讀取
+
+    此時不加載內存中的學校列表、索引及歷年數據：SQLite 文件只有最新年度的學校，
+    「與上學年比較」及每個年度的分析數據立方在建立文件時預先計算並保存在文件中。
+    """
+    if os.environ.get('SCHOOL_STORE_BACKEND', '').lower() != 'sqlite':
+        return None
+    from utils.sqlite_store import build_from_csv, open_sqlite_store
+    versions = find_versions()
+    if not versions:
+        return None
+    db_path = CACHE_DIR / "schools.sqlite"
+    backend = open_sqlite_store(db_path, LOADED_FIELDS, versions=versions)
+    if backend is None:
+        backend = build_from_csv(db_path, versions, LOADED_FIELDS)
+    return backend
+
+@st.cache_resource
+def load_data() -> List[Dict[str, Any]]:
+    """加載學校數據（最新年度，所有會話共用，不可修改）"""
+    return load_school_store().get_schools()
+
+@st.cache_resource
+def load_schools_by_id() -> Dict[Any, Dict[str, Any]]:
+    """學校 ID -> 共用的學校字典"""
+    return {school.get('id'): school for school in load_data()}
+
+@st.cache_resource
+def load_shared_ids() -> frozenset:
+    """所有會話共用的學校列表及學校字典的 id()，統計會話內存時不計入"""
+    if load_sqlite_backend() is not None:
+        return frozenset()
+    schools = load_data()
+    return frozenset([id(schools)] + [id(school) for school in schools])
+
+@st.cache_resource
+def load_session_registry() -> SessionRegistry:
+    """所有會話的內存統計及閒置清除；SESSION_IDLE_TIMEOUT 設置閒置秒數"""
+    return SessionRegistry(float(os.environ.get('SESSION_IDLE_TIMEOUT', 15 * 60)))
+
+def get_session_cache() -> SessionCache:
+    """本會話的派生數據（篩選結果等），閒置超時後會被清除，取不到時重新計算"""
+    if 'derived' not in st.session_state:
+        st.session_state.derived = SessionCache()
+    return st.session_state.derived
+
+def track_session():
+    """記錄本會話的活動及狀態大小，並清除其他閒置會話的派生數據"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    session_id = ctx.session_id if ctx is not None else 'local'
+    state = {key: value for key, value in st.session_state.to_dict().items() if key != 'derived'}
+    registry = load_session_registry()
+    registry.touch(session_id, get_session_cache(), deep_size(state, load_shared_ids()))
+    registry.sweep()
+
+def load_record_store():
+    """按學校 ID 讀取欄位的存儲（導出、比較表、詳細資料、與上學年比較及年度標籤）：SQLite 後端或內存存儲"""
+    backend = load_sqlite_backend()
+    return backend if backend is not None else load_school_store()
+
+def count_schools() -> int:
+    """最新年度的學校數目"""
+    backend = load_sqlite_backend()
+    return len(backend) if backend is not None else len(load_data())
+
+def get_schools_by_ids(school_ids: List[Any]) -> List[Dict[str, Any]]:
+    """按 ID 的次序取得學校（常駐欄位），不存在的 ID 會被跳過
+
+    SQLite 後端每次從文件讀取並帶有座標列，否則直接使用共用列表中的學校字典。
+    """
+    backend = load_sqlite_backend()
+    if backend is not None:
+        from utils.sqlite_store import LOCATION_COLUMNS
+        return backend.get_schools(list(school_ids), HOT_FIELDS + LOCATION_COLUMNS)
+    schools_by_id = load_schools_by_id()
+    return [schools_by_id[school_id] for school_id in school_ids if school_id in schools_by_id]
+
+def get_school(school_id: Any) -> Optional[Dict[str, Any]]:
+    """一所學校；不存在時返回 None"""
+    schools = get_schools_by_ids([school_id]) if school_id is not None else []
+    return schools[0] if schools else None
+
+def get_selected_schools() -> List[Dict[str, Any]]:
+    """已選比較的學校（按加入次序）"""
+    return get_schools_by_ids(st.session_state.selected_ids)
+
+def get_school_distance(school: Dict[str, Any], center: tuple) -> Optional[float]:
+    """學校與中心點的大約距離（公里）；無法定位時返回 None"""
+    if 'lat' in school:
+        # SQLite 後端的結果帶有建立文件時估計的座標
+        return None if school['lat'] is None else distance_km(school['lat'], school['lng'], *center)
+    return load_geo_index().distance(school, *center)
+
+@st.cache_resource
+def load_feature_index() -> FeatureIndex:
+    """學校特色文本索引（所有會話共用，按學校 ID 對應）"""
+    return FeatureIndex(load_data())
+
+@st.cache_resource
+def load_tag_index() -> TagIndex:
+    """熱門標籤的學校位圖（每個數據集計算一次，所有會話共用）"""
+    return TagIndex(load_data(), POPULAR_TAGS)
+
+@st.cache_resource
+def load_flag_index() -> FlagIndex:
+    """有 / 無欄位的學校位圖（每個數據集計算一次，所有會話共用）"""
+    return FlagIndex(load_data())
+
+@st.cache_resource
+def load_entity_index() -> EntityIndex:
+    """辦學團體及關聯中學的規範化實體 ID（每個數據集計算一次，所有會話共用）"""
+    return EntityIndex(load_data())
+
+@st.cache_resource
+def load_geo_index() -> GeoIndex:
+    """學校座標的網格索引（按地址離線估計，每個數據集計算一次，所有會話共用）"""
+    return GeoIndex(load_data())
+
+@st.cache_resource
+def load_facet_cube(label: str) -> 'FacetCube':
+    """指定年度的分析數據立方（每個年度計算一次，所有會話共用；SQLite 後端讀取文件中保存的格子）"""
+    from utils.analytics import FacetCube
+    backend = load_sqlite_backend()
+    if backend is not None:
+        return backend.get_facet_cube(label)
+    return FacetCube(load_school_store().get_schools(label))
+
+@st.cache_resource
+def load_typeahead() -> Typeahead:
+    """輸入補全索引（首次需要補全時建立，所有會話共用）"""
+    backend = load_sqlite_backend()
+    if backend is not None:
+        return build_typeahead(backend.load_schools(SOURCE_FIELDS))
+    return build_typeahead(load_data(), entity_index=load_entity_index())
+
+@st.cache_resource
+def load_dataset_version() -> str:
+    """最新年度數據的內容指紋，用於判斷保存的搜尋是否需要重新計算"""
+    backend = load_sqlite_backend()
+    if backend is not None:
+        # 按 ID 排列，與內存存儲（CSV 次序）得到相同的指紋
+        return dataset_fingerprint(sorted(backend.load_schools(HOT_FIELDS), key=lambda school: school['id']))
+    return dataset_fingerprint(load_data())
+
+def load_search_indexes() -> Dict[str, Any]:
+    """apply_filters 使用的預建索引"""
+    return {
+        'index': load_feature_index(),
+        'tag_index': load_tag_index(),
+        'flag_index': load_flag_index(),
+        'geo_index': load_geo_index(),
+        'entity_index': load_entity_index(),
+    }
+
+@st.cache_resource
+def load_saved_searches() -> SavedSearchStore:
+    """保存的搜尋存儲（按擁有者區分）；數據更新後首次加載時批量重新計算所有搜尋"""
+    saved = SavedSearchStore(CACHE_DIR / "saved_searches.json")
+    backend = load_sqlite_backend()
+    if backend is not None:
+        saved.refresh([], load_dataset_version(), backend=backend)
+    else:
+        saved.refresh(load_data(), load_dataset_version(), **load_search_indexes())
+    return saved
+
+@st.cache_resource
+def load_filter_options() -> Dict[str, List[str]]:
+    """從最新年度數據提取篩選選項（所有會話共用）"""
+    backend = load_sqlite_backend()
+    if backend is not None:
+        return backend.get_filter_options()
+    return get_filter_options(load_data(), entity_index=load_entity_index())
 
 def get_text(key: str, tc: str, sc: str = None) -> str:
     """獲取雙語文本"""
@@ -92,8 +309,82 @@ def get_text(key: str, tc: str, sc: str = None) -> str:
     else:
         return sc or convert_text(tc, 'sc')
 
-def render_filter_section(schools: List[Dict[str, Any]], filter_options: Dict[str, List[str]]):
-    """渲染篩選區域"""
+def toggle_tag(tag: str):
+    """切換熱門標籤（按鈕回調）"""
+    selected_tags = list(st.session_state.get('selected_tags', []))
+    if tag in selected_tags:
+        selected_tags.remove(tag)
+    else:
+        selected_tags.append(tag)
+    st.session_state.selected_tags = selected_tags
+
+def clear_filters():
+    """清除所有篩選（按鈕回調）"""
+    st.session_state.search_query = ''
+    st.session_state.feature_search_query = ''
+    st.session_state.filters_區域 = []
+    st.session_state.filters_校網 = []
+    st.session_state.filters_辦學團體 = []
+    st.session_state.filters_資助類型 = []
+    st.session_state.filters_學生性別 = []
+    st.session_state.filters_宗教 = []
+    st.session_state.filters_教學語言 = []
+    st.session_state.filters_關聯學校 = []
+    st.session_state.filters_關聯中學 = []
+    st.session_state.filters_課業安排 = []
+    st.session_state.filters_校車及家校組織 = []
+    st.session_state.filters_附近地點 = ''
+    st.session_state.selected_tags = []
+    # 地點選擇框按新的值重新創建
+    st.session_state.pop('filter_附近地點', None)
+
+# 特色搜索最後一個詞（可帶欄位前綴），用於補全
+LAST_TERM_PATTERN = re.compile(r'(?:([^\s()"]+)[:：])?([^\s()":：]+)$')
+
+def apply_name_completion(display: str, kind: str):
+    """選擇學校名稱輸入框的補全（按鈕回調）"""
+    if kind == KIND_SPONSOR:
+        bodies = list(st.session_state.get('filters_辦學團體', []))
+        if display not in bodies:
+            bodies.append(display)
+        st.session_state.filters_辦學團體 = bodies
+        st.session_state.pop('filter_辦學團體', None)
+        display = ''
+    st.session_state.search_query = display
+    st.session_state.pop('input_search_name', None)
+
+def apply_feature_completion(display: str, kind: str):
+    """選擇學校特色輸入框的補全：替換最後一個詞（按鈕回調）"""
+    query = st.session_state.get('feature_search_query', '').rstrip()
+    match = LAST_TERM_PATTERN.search(query)
+    head = query[:match.start()] if match else query
+    prefix = f"{match.group(1)}:" if match and match.group(1) else ''
+    if kind == KIND_MOTTO and not prefix:
+        prefix = '校訓:'
+    st.session_state.feature_search_query = head + prefix + display
+    st.session_state.pop('input_search_features', None)
+
+def render_completions(completions: List[tuple], on_click, key: str):
+    """在輸入框下方顯示補全按鈕"""
+    if not completions:
+        return
+    cols = st.columns(2)
+    for i, (display, kind) in enumerate(completions):
+        with cols[i % 2]:
+            st.button(
+                localize(display, st.session_state.language),
+                key=f'{key}_{i}',
+                use_container_width=True,
+                on_click=on_click,
+                args=(display, kind)
+            )
+
+@st.fragment
+def render_filter_section(filter_options: Dict[str, List[str]]):
+    """渲染篩選區域
+    
+    作為獨立片段運行：篩選條件改變時才重新運行整個應用以更新結果列表。
+    """
     lang = st.session_state.language
     
     # 使用 expander 實現可摺疊
@@ -110,6 +401,16 @@ def render_filter_section(schools: List[Dict[str, Any]], filter_options: Dict[st
         )
         st.session_state.search_query = search_query
         
+        # 輸入補全：學校名稱及辦學團體
+        if search_query.strip():
+            completions = [
+                (display, kind) for display, kind in load_typeahead().complete(
+                    search_query, k=6, kinds=[KIND_NAME, KIND_SPONSOR]
+                )
+                if display != search_query.strip()
+            ]
+            render_completions(completions, apply_name_completion, 'complete_name')
+        
         st.divider()
         
         # 2. 區域
@@ -192,6 +493,16 @@ def render_filter_section(schools: List[Dict[str, Any]], filter_options: Dict[st
         )
         st.session_state.filters_關聯學校 = selected_linked
         
+        # 關聯的中學：與所選中學有一條龍、直屬或聯繫關係
+        selected_secondaries = st.multiselect(
+            get_text("linked_secondary", "關聯中學", "关联中学"),
+            options=filter_options.get('關聯中學', []),
+            default=st.session_state.get('filters_關聯中學', []),
+            format_func=lambda name: localize(name, lang),
+            key='filter_關聯中學'
+        )
+        st.session_state.filters_關聯中學 = selected_secondaries
+        
         # 10. 課業安排
         homework_options = FIXED_FILTER_OPTIONS['課業安排']
         selected_homework = st.multiselect(
@@ -202,55 +513,167 @@ def render_filter_section(schools: List[Dict[str, Any]], filter_options: Dict[st
         )
         st.session_state.filters_課業安排 = selected_homework
         
+        # 11. 校車及家校組織
+        selected_services = st.multiselect(
+            get_text("school_services", "校車及家校組織:", "校车及家校组织:"),
+            options=FIXED_FILTER_OPTIONS['校車及家校組織'],
+            default=st.session_state.get('filters_校車及家校組織', []),
+            key='filter_校車及家校組織'
+        )
+        st.session_state.filters_校車及家校組織 = selected_services
+        
+        # 12. 離家距離：地點附近若干公里內，或最近的若干所
+        place_options = place_names()
+        current_place = st.session_state.get('filters_附近地點', '')
+        selected_place = st.selectbox(
+            get_text("near_place", "離家距離（地區或屋苑）:", "离家距离（地区或屋苑）:"),
+            options=place_options,
+            index=place_options.index(current_place) if current_place in place_options else None,
+            format_func=lambda name: localize(name, lang),
+            placeholder=get_text("any_place", "不限", "不限"),
+            key='filter_附近地點',
+            help=get_text(
+                "near_place_help",
+                "學校位置按地址中的地區或屋苑估計，距離為大約數字",
+                "学校位置按地址中的地区或屋苑估计，距离为大约数字"
+            )
+        )
+        st.session_state.filters_附近地點 = selected_place or ''
+        if selected_place:
+            distance_cols = st.columns(2)
+            with distance_cols[0]:
+                st.session_state.filters_距離 = st.slider(
+                    get_text("distance_km", "距離（公里，0 為不限）", "距离（公里，0 为不限）"),
+                    min_value=0.0,
+                    max_value=10.0,
+                    value=float(st.session_state.get('filters_距離', 2.0)),
+                    step=0.5,
+                    key='filter_距離'
+                )
+            with distance_cols[1]:
+                st.session_state.filters_最近數目 = st.number_input(
+                    get_text("nearest_count", "最近的學校數目（0 為不限）", "最近的学校数目（0 为不限）"),
+                    min_value=0,
+                    max_value=100,
+                    value=int(st.session_state.get('filters_最近數目', 0)),
+                    step=1,
+                    key='filter_最近數目'
+                )
+        
         st.divider()
         
-        # 11. 學校特色
+        # 13. 學校特色
         st.write(get_text("school_features", "學校特色:", "学校特色:"))
         feature_search_query = st.text_input(
             "",
             value=st.session_state.get('feature_search_query', ''),
             key='input_search_features',
             placeholder=get_text("search_features", "搜索學校特色...", "搜索学校特色..."),
+            help=get_text(
+                "search_features_help",
+                "可使用 AND、OR、NOT 及括號組合關鍵詞，例如 `STEAM AND (音樂 OR 藝術) NOT 寄宿`；"
+                "用「欄位:關鍵詞」只搜索指定欄位，例如 `校風:關愛`（可用欄位：特色、教學、課程、能力、價值觀、照顧、宗旨、校風）",
+                "可使用 AND、OR、NOT 及括号组合关键词，例如 `STEAM AND (音乐 OR 艺术) NOT 寄宿`；"
+                "用「栏位:关键词」只搜索指定栏位，例如 `校风:关爱`（可用栏位：特色、教学、课程、能力、价值观、照顾、宗旨、校风）"
+            ),
             label_visibility="collapsed"
         )
         st.session_state.feature_search_query = feature_search_query
         
+        # 語法錯誤時仍按整句文字搜索，並提示錯誤所在
+        error = query_error(feature_search_query)
+        if error is not None:
+            st.warning(get_text("query_error", f"查詢語法有誤：{error}。現按整句文字搜索。"))
+        
+        # 輸入補全：特色詞及校訓（補全最後一個詞）
+        match = LAST_TERM_PATTERN.search(feature_search_query.strip())
+        if match and match.group(2) not in ['AND', 'OR', 'NOT']:
+            completions = [
+                (display, kind) for display, kind in load_typeahead().complete(
+                    match.group(2), k=6, kinds=[KIND_TERM, KIND_MOTTO]
+                )
+                if display.lower() != match.group(2).lower()
+            ]
+            render_completions(completions, apply_feature_completion, 'complete_feature')
+        
         # 熱門標籤
         selected_tags = st.session_state.get('selected_tags', [])
         tag_cols = st.columns(4)
         for i, tag in enumerate(POPULAR_TAGS):
             col_idx = i % 4
             with tag_cols[col_idx]:
-                tag_display = convert_text(tag, st.session_state.language)
+                tag_display = localize(tag, st.session_state.language)
                 is_selected = tag in selected_tags
-                if st.button(
+                st.button(
                     tag_display,
                     key=f'tag_{tag}',
                     use_container_width=True,
-                    type="primary" if is_selected else "secondary"
-                ):
-                    if is_selected:
-                        selected_tags.remove(tag)
-                    else:
-                        selected_tags.append(tag)
-                    st.session_state.selected_tags = selected_tags
-                    st.rerun()
+                    type="primary" if is_selected else "secondary",
+                    on_click=toggle_tag,
+                    args=(tag,)
+                )
         
         # 清除所有篩選
-        if st.button(get_text("clear_all", "清除所有篩選", "清除所有筛选"), use_container_width=True):
-            st.session_state.search_query = ''
-            st.session_state.feature_search_query = ''
-            st.session_state.filters_區域 = []
-            st.session_state.filters_校網 = []
-            st.session_state.filters_辦學團體 = []
-            st.session_state.filters_資助類型 = []
-            st.session_state.filters_學生性別 = []
-            st.session_state.filters_宗教 = []
-            st.session_state.filters_教學語言 = []
-            st.session_state.filters_關聯學校 = []
-            st.session_state.filters_課業安排 = []
-            st.session_state.selected_tags = []
-            st.rerun()
+        st.button(
+            get_text("clear_all", "清除所有篩選", "清除所有筛选"),
+            use_container_width=True,
+            on_click=clear_filters
+        )
+    
+    # 篩選條件改變時重新運行整個應用，否則只重新運行本片段
+    if get_filters_key(get_current_filters()) != st.session_state.get('applied_filters_key'):
+        st.rerun()
+
+def get_current_filters() -> Dict[str, Any]:
+    """從 session state 讀取當前篩選條件"""
+    return {
+        'search_query': st.session_state.get('search_query', ''),
+        'feature_search_query': st.session_state.get('feature_search_query', ''),
+        '區域': st.session_state.get('filters_區域', []),
+        '校網': st.session_state.get('filters_校網', []),
+        '辦學團體': st.session_state.get('filters_辦學團體', []),
+        '資助類型': st.session_state.get('filters_資助類型', []),
+        '學生性別': st.session_state.get('filters_學生性別', []),
+        '宗教': st.session_state.get('filters_宗教', []),
+        '教學語言': st.session_state.get('filters_教學語言', []),
+        '關聯學校': st.session_state.get('filters_關聯學校', []),
+        '關聯中學': st.session_state.get('filters_關聯中學', []),
+        '課業安排': st.session_state.get('filters_課業安排', []),
+        '校車及家校組織': st.session_state.get('filters_校車及家校組織', []),
+        '附近地點': st.session_state.get('filters_附近地點', ''),
+        '距離': st.session_state.get('filters_距離', 2.0),
+        '最近數目': st.session_state.get('filters_最近數目', 0),
+        'feature_tags': st.session_state.get('selected_tags', []),
+    }
+
+def get_filters_key(filters: Dict[str, Any]) -> tuple:
+    """篩選條件的可比較鍵"""
+    return tuple(
+        (key, tuple(value) if isinstance(value, list) else value)
+        for key, value in sorted(filters.items())
+    )
+
+def get_filtered_schools(filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """篩選並排序學校；篩選條件不變時直接使用上次的結果"""
+    filters_key = get_filters_key(filters)
+    cache = get_session_cache()
+    school_ids = cache.get(filters_key)
+    if school_ids is not None:
+        return get_schools_by_ids(school_ids)
+    
+    backend = load_sqlite_backend()
+    if backend is not None:
+        from utils.sqlite_store import LOCATION_COLUMNS
+        # 選擇了地點時由 SQLite 直接按距離由近到遠排列
+        sorted_schools = backend.apply_filters(filters, HOT_FIELDS + LOCATION_COLUMNS, by_distance=True)
+    else:
+        sorted_schools = sort_schools(apply_filters(load_data(), filters, **load_search_indexes()))
+        # 選擇了地點時按距離由近到遠排列
+        if filters.get('附近地點'):
+            sorted_schools = load_geo_index().sort(sorted_schools, filters['附近地點'])
+    # 只緩存學校 ID（學校字典與共用列表中的相同，或可以按 ID 從 SQLite 重新讀取）
+    cache.put(filters_key, tuple(school.get('id') for school in sorted_schools))
+    return sorted_schools
 
 def has_any_filter() -> bool:
     """檢查是否有任何篩選條件"""
@@ -274,16 +697,106 @@ def has_any_filter() -> bool:
         return True
     if st.session_state.get('filters_關聯學校', []):
         return True
+    if st.session_state.get('filters_關聯中學', []):
+        return True
     if st.session_state.get('filters_課業安排', []):
         return True
+    if st.session_state.get('filters_校車及家校組織', []):
+        return True
+    if st.session_state.get('filters_附近地點') and (
+        st.session_state.get('filters_距離', 2.0) or st.session_state.get('filters_最近數目', 0)
+    ):
+        return True
     if st.session_state.get('selected_tags', []):
         return True
     return False
 
+def get_filter_widget_options(key: str) -> List[str]:
+    """篩選器的可選值"""
+    return FIXED_FILTER_OPTIONS.get(key) or load_filter_options().get(key, [])
+
+def open_in_list(filters: Dict[str, List[str]]):
+    """以鑽取的條件打開學校列表（按鈕回調）"""
+    clear_filters()
+    for key in ['區域', '校網', '辦學團體', '資助類型', '學生性別', '宗教', '教學語言', '關聯學校', '關聯中學', '課業安排', '校車及家校組織']:
+        st.session_state[f'filters_{key}'] = filters.get(key, [])
+        # 移除篩選器的狀態，讓它按新的條件重新創建
+        st.session_state.pop(f'filter_{key}', None)
+    st.session_state.main_view = '學校列表'
+
+def get_search_owner(create: bool = False) -> str:
+    """本用戶保存的搜尋的擁有者標記
+
+    標記是隨機生成的，保存在網址參數 owner 中：重新載入或收藏網址後仍能找回自己保存的搜尋，
+    其他用戶看不到。還沒有保存過搜尋且 create 為 False 時返回空字符串。
+    """
+    owner = st.session_state.get('search_owner') or st.query_params.get('owner', '')
+    if not owner and create:
+        owner = secrets.token_urlsafe(16)
+    if owner:
+        st.session_state.search_owner = owner
+        st.query_params['owner'] = owner
+    return owner
+
+def save_current_search():
+    """保存當前的篩選條件，以當前結果作為之後比較的基準（按鈕回調）"""
+    filters = get_current_filters()
+    load_saved_searches().add(
+        get_search_owner(create=True),
+        st.session_state.get('saved_search_name', ''),
+        filters,
+        get_filtered_schools(filters),
+        load_dataset_version()
+    )
+    st.session_state.saved_search_name = ''
+
+def open_saved_search(spec: Dict[str, Any]):
+    """以保存的搜尋條件打開學校列表（按鈕回調）"""
+    open_in_list(spec)
+    st.session_state.search_query = spec.get('search_query', '')
+    st.session_state.feature_search_query = spec.get('feature_search_query', '')
+    st.session_state.selected_tags = list(spec.get('feature_tags', []))
+    st.session_state.filters_附近地點 = spec.get('附近地點', '')
+    st.session_state.filters_距離 = float(spec.get('距離', 0.0))
+    st.session_state.filters_最近數目 = int(spec.get('最近數目', 0))
+    # 輸入框及距離篩選器按新的值重新創建
+    for key in ['input_search_name', 'input_search_features', 'filter_距離', 'filter_最近數目']:
+        st.session_state.pop(key, None)
+
+def delete_saved_search(search_id: str):
+    """刪除保存的搜尋（按鈕回調）"""
+    load_saved_searches().remove(get_search_owner(), search_id)
+
+def toggle_compare(school_id: Any):
+    """切換學校是否加入比較（複選框回調）
+
+    複選框的狀態已在瀏覽器中，只需重新運行比較欄片段，不重新渲染結果列表；
+    已選滿 4 所時取消勾選，需要連同結果列表一起重新運行。
+    """
+    key = f'compare_{school_id}'
+    if st.session_state.get(key):
+        if len(st.session_state.selected_ids) >= 4:
+            st.session_state[key] = False
+            st.rerun(scope=[COMPARISON_TRAY_KEY, RESULT_LIST_KEY])
+        st.session_state.selected_ids.append(school_id)
+    else:
+        st.session_state.selected_ids = [
+            selected_id for selected_id in st.session_state.selected_ids
+            if selected_id != school_id
+        ]
+    st.rerun(scope=COMPARISON_TRAY_KEY)
+
+def clear_comparison():
+    """清除所有已選比較的學校（按鈕回調），學校卡片上的複選框也要更新"""
+    for school_id in st.session_state.selected_ids:
+        st.session_state[f'compare_{school_id}'] = False
+    st.session_state.selected_ids = []
+    st.rerun(scope=[COMPARISON_TRAY_KEY, RESULT_LIST_KEY])
+
 def render_school_card(school: Dict[str, Any], index: int):
     """渲染學校卡片"""
     lang = st.session_state.language
-    school_name = convert_text(str(school.get('學校名稱', '')), lang)
+    school_name = localize(str(school.get('學校名稱', '')), lang)
     
     with st.container():
         col1, col2 = st.columns([1, 0.2])
@@ -291,46 +804,52 @@ def render_school_card(school: Dict[str, Any], index: int):
         with col1:
             st.subheader(school_name)
             
+            # 與所選地點的大約距離
+            place = st.session_state.get('filters_附近地點')
+            center = place_location(place) if place else None
+            if center is not None:
+                distance = get_school_distance(school, center)
+                if distance is not None:
+                    st.caption(get_text(
+                        "distance_from",
+                        f"距離{place}約 {distance:.1f} 公里",
+                        f"距离{convert_text(place, 'sc')}约 {distance:.1f} 公里"
+                    ))
+            
             # 基本信息
             info_cols = st.columns(3)
             with info_cols[0]:
-                region = convert_text(str(school.get('區域', '-')), lang)
+                region = localize(str(school.get('區域', '-')), lang)
                 st.write(f"**{get_text('region', '區域', '区域')}:** {region}")
             with info_cols[1]:
                 school_net = str(school.get('小一學校網', '-'))
                 st.write(f"**{get_text('school_net', '校網', '校网')}:** {school_net}")
             with info_cols[2]:
-                school_type = convert_text(str(school.get('學校類別1', '-')), lang)
+                school_type = localize(str(school.get('學校類別1', '-')), lang)
                 st.write(f"**{get_text('type', '類型', '类型')}:** {school_type}")
             
             # 更多信息
             more_cols = st.columns(3)
             with more_cols[0]:
-                gender = convert_text(str(school.get('學生性別', '-')), lang)
+                gender = localize(str(school.get('學生性別', '-')), lang)
                 st.write(f"**{get_text('gender', '性別', '性别')}:** {gender}")
             with more_cols[1]:
-                religion = convert_text(str(school.get('宗教', '-')), lang)
+                religion = localize(str(school.get('宗教', '-')), lang)
                 st.write(f"**{get_text('religion', '宗教', '宗教')}:** {religion}")
             with more_cols[2]:
-                teaching_lang = convert_text(str(school.get('教學語言', '-')), lang)
+                teaching_lang = localize(str(school.get('教學語言', '-')), lang)
                 st.write(f"**{get_text('language', '教學語言', '教学语言')}:** {teaching_lang}")
         
         with col2:
             # 比較複選框
-            is_selected = any(s.get('id') == school.get('id') for s in st.session_state.selected_schools)
-            if st.checkbox(
+            is_selected = school.get('id') in st.session_state.selected_ids
+            st.checkbox(
                 get_text("compare", "比較", "比较"),
                 value=is_selected,
-                key=f'compare_{school.get("id")}'
-            ):
-                if not is_selected and len(st.session_state.selected_schools) < 4:
-                    st.session_state.selected_schools.append(school)
-            else:
-                if is_selected:
-                    st.session_state.selected_schools = [
-                        s for s in st.session_state.selected_schools
-                        if s.get('id') != school.get('id')
-                    ]
+                key=f'compare_{school.get("id")}',
+                on_change=toggle_compare,
+                args=(school.get('id'),)
+            )
             
             # 詳細資料按鈕
             if st.button(
@@ -338,14 +857,172 @@ def render_school_card(school: Dict[str, Any], index: int):
                 key=f'details_{school.get("id")}',
                 use_container_width=True
             ):
-                st.session_state.detail_school = school
+                st.session_state.detail_school_id = school.get('id')
                 st.rerun()
         
         st.divider()
 
+@st.fragment(key=COMPARISON_TRAY_KEY)
+def render_comparison_tray():
+    """渲染比較欄：顯示已選學校及比較按鈕
+
+    與結果列表是兩個獨立片段，勾選比較時只重新運行本片段。
+    """
+    selected = get_selected_schools()
+    if not selected:
+        return
+    
+    lang = st.session_state.language
+    names = '、'.join(localize(str(s.get('學校名稱', '')), lang) for s in selected)
+    st.write(f"**{get_text('selected_for_comparison', '已選比較', '已选比较')} ({len(selected)}/4):** {names}")
+    col1, col2, col3 = st.columns([1, 1, 3])
+    with col1:
+        if st.button(
+            get_text("compare_selected", "比較已選", "比较已选"),
+            key='compare_selected',
+            use_container_width=True
+        ):
+            st.session_state.show_comparison = True
+            st.rerun()
+    with col2:
+        st.button(
+            get_text("clear_selection", "清除已選", "清除已选"),
+            key='clear_selection',
+            use_container_width=True,
+            on_click=clear_comparison
+        )
+
+def render_export_controls(school_ids: List[Any], key: str, file_name: str):
+    """渲染導出控件：選擇欄位及格式，按下載時才從存儲逐批生成文件"""
+    lang = st.session_state.language
+    fields = st.multiselect(
+        get_text("export_fields", "欄位", "栏位"),
+        EXPORT_FIELDS,
+        default=DEFAULT_EXPORT_FIELDS,
+        key=f'{key}_fields',
+        format_func=lambda field: localize(field, lang)
+    )
+    export_format = st.radio(
+        get_text("export_format", "格式", "格式"),
+        available_formats(),
+        horizontal=True,
+        key=f'{key}_format'
+    )
+    _, extension, mime = EXPORT_FORMATS[export_format]
+    st.download_button(
+        get_text("download", "下載", "下载"),
+        data=deferred_export(load_record_store(), school_ids, fields, export_format, lang),
+        file_name=f"{file_name}.{extension}",
+        mime=mime,
+        key=f'{key}_download',
+        on_click='ignore',
+        disabled=not fields or not school_ids,
+        use_container_width=True
+    )
+
+@st.fragment(key=RESULT_LIST_KEY)
+def render_result_list():
+    """渲染結果列表
+    
+    導出、儲存搜尋等操作只重新運行本片段，篩選及排序結果按篩選條件緩存，不會重新計算。
+    """
+    # 檢查是否有篩選條件
+    if not has_any_filter():
+        st.info(get_text("no_filter", "請輸入搜尋條件或選擇篩選器", "请输入搜索条件或选择筛选器"))
+        return
+    
+    sorted_schools = get_filtered_schools(get_current_filters())
+    
+    # 顯示結果數量
+    count_col, export_col, save_col = st.columns([2, 1, 1])
+    with count_col:
+        st.write(f"**{len(sorted_schools)} {get_text('schools_found', '所學校符合條件', '所学校符合条件')}**")
+    with export_col:
+        with st.popover(get_text("export", "⬇️ 匯出", "⬇️ 导出"), use_container_width=True):
+            render_export_controls([school.get('id') for school in sorted_schools], 'export_results', 'schools')
+    with save_col:
+        with st.popover(get_text("save_search", "💾 儲存搜尋", "💾 保存搜索"), use_container_width=True):
+            st.text_input(
+                get_text("saved_search_name", "名稱", "名称"),
+                key='saved_search_name',
+                placeholder=localize(describe_spec(canonical_spec(get_current_filters())), st.session_state.language)
+            )
+            st.button(
+                get_text("save", "儲存", "保存"),
+                key='save_search',
+                on_click=save_current_search,
+                help=get_text(
+                    "save_search_help",
+                    "只有你能看到自己儲存的搜尋，收藏儲存後的網址即可在之後找回。"
+                    "數據更新後，已儲存搜尋的結果會自動重新計算，並列出新增及減少的學校",
+                    "只有你能看到自己保存的搜索，收藏保存后的网址即可在之后找回。"
+                    "数据更新后，已保存搜索的结果会自动重新计算，并列出新增及减少的学校"
+                )
+            )
+    
+    # 顯示學校列表
+    for i, school in enumerate(sorted_schools):
+        render_school_card(school, i)
+
+def render_saved_searches():
+    """渲染已儲存的搜尋：條件、結果數目及最近一次數據更新後的變化"""
+    lang = st.session_state.language
+    owner = get_search_owner()
+    searches = load_saved_searches().list(owner) if owner else []
+    if not searches:
+        st.info(get_text(
+            "no_saved_searches",
+            "還沒有已儲存的搜尋。在學校列表中選擇篩選條件後按「💾 儲存搜尋」。",
+            "还没有已保存的搜索。在学校列表中选择筛选条件后按「💾 保存搜索」。"
+        ))
+        return
+    
+    for search in reversed(searches):
+        with st.container(border=True):
+            st.markdown(f"**{localize(search['name'], lang)}**")
+            st.caption(localize(describe_spec(search['spec']), lang))
+            st.write(f"{len(search['results'])} {get_text('schools', '所學校', '所学校')}")
+            added, removed = search.get('added') or [], search.get('removed') or []
+            if added or removed:
+                with st.expander(
+                    get_text("search_changes", "數據更新後", "数据更新后")
+                    + f"：+{len(added)} / −{len(removed)}"
+                ):
+                    for name in added:
+                        st.write(f"➕ {localize(name, lang)}")
+                    for name in removed:
+                        st.write(f"➖ {localize(name, lang)}")
+            col1, col2, _ = st.columns([1, 1, 3])
+            with col1:
+                st.button(
+                    get_text("open_search", "打開", "打开"),
+                    key=f"open_search_{search['id']}",
+                    use_container_width=True,
+                    on_click=open_saved_search,
+                    args=(search['spec'],)
+                )
+            with col2:
+                st.button(
+                    get_text("delete_search", "刪除", "删除"),
+                    key=f"delete_search_{search['id']}",
+                    use_container_width=True,
+                    on_click=delete_saved_search,
+                    args=(search['id'],)
+                )
+
+@st.fragment
+def render_detail_pane():
+    """渲染詳細資料頁"""
+    render_school_detail(get_school(st.session_state.detail_school_id))
+
+@st.fragment
 def render_comparison_view():
     """渲染比較視圖"""
-    schools = st.session_state.selected_schools
+    from utils.comparison import (
+        build_comparison_matrix, differing_rows, style_matrix,
+        has_xlsx_support, matrix_to_csv, matrix_to_xlsx
+    )
+    schools = get_selected_schools()
     lang = st.session_state.language
     
     st.title(get_text("comparison", "學校比較", "学校比较"))
@@ -358,13 +1035,44 @@ def render_comparison_view():
         st.warning(get_text("no_schools_selected", "請選擇要比較的學校", "请选择要比较的学校"))
         return
     
-    # 使用 tabs 顯示每所學校
-    tabs = st.tabs([convert_text(str(s.get('學校名稱', '')), lang) for s in schools])
+    # 所有學校並排顯示在同一個表格中
+    matrix = build_comparison_matrix(load_record_store(), [s.get('id') for s in schools])
+    if st.toggle(get_text("differences_only", "只顯示差異", "只显示差异"), key='comparison_differences_only'):
+        matrix = differing_rows(matrix)
     
-    for i, tab in enumerate(tabs):
-        with tab:
-            school = schools[i]
-            render_school_detail(school, show_back=False)
+    def to_display(value) -> str:
+        return localize(str(value), lang)
+    
+    st.dataframe(style_matrix(matrix, formatter=to_display), use_container_width=True)
+    st.caption(get_text("comparison_legend", "綠色為較佳數值，紅色為較差數值", "绿色为较佳数值，红色为较差数值"))
+    
+    # 導出比較表
+    export_matrix = matrix
+    if lang != 'tc':
+        export_matrix = matrix.apply(lambda column: column.map(to_display))
+        export_matrix.index = [to_display(field) for field in matrix.index]
+        export_matrix.columns = [to_display(name) for name in matrix.columns]
+    export_cols = st.columns(4)
+    with export_cols[0]:
+        st.download_button(
+            get_text("download_csv", "下載 CSV", "下载 CSV"),
+            data=matrix_to_csv(export_matrix),
+            file_name="school_comparison.csv",
+            mime="text/csv",
+            use_container_width=True
+        )
+    if has_xlsx_support():
+        with export_cols[1]:
+            st.download_button(
+                get_text("download_xlsx", "下載 XLSX", "下载 XLSX"),
+                data=matrix_to_xlsx(export_matrix),
+                file_name="school_comparison.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                use_container_width=True
+            )
+    with export_cols[2]:
+        with st.popover(get_text("export_schools", "匯出學校資料", "导出学校资料"), use_container_width=True):
+            render_export_controls([s.get('id') for s in schools], 'export_selected', 'selected_schools')
     
     # 移除按鈕
     st.divider()
@@ -377,23 +1085,108 @@ def render_comparison_view():
                 key=f'remove_{schools[i].get("id")}',
                 use_container_width=True
             ):
-                st.session_state.selected_schools = [
-                    s for s in st.session_state.selected_schools
-                    if s.get('id') != schools[i].get('id')
+                st.session_state.selected_ids = [
+                    school_id for school_id in st.session_state.selected_ids
+                    if school_id != schools[i].get('id')
                 ]
-                if len(st.session_state.selected_schools) == 0:
+                if len(st.session_state.selected_ids) == 0:
                     st.session_state.show_comparison = False
                 st.rerun()
 
+@st.fragment
+def render_analytics_view():
+    """渲染數據分析：從預先聚合的數據立方生成透視表，可鑽取到學校列表"""
+    from utils.analytics import DIMENSIONS, MEASURES, selection_filters
+    lang = st.session_state.language
+    store = load_record_store()
+    
+    def to_display(value) -> str:
+        return localize(str(value), lang)
+    
+    dimensions = list(DIMENSIONS)
+    cols = st.columns(4)
+    with cols[0]:
+        label = store.latest
+        if len(store.labels) > 1:
+            label = st.selectbox(get_text("year", "年度", "年度"), store.labels[::-1], key='analytics_label',
+                                 format_func=to_display)
+    with cols[1]:
+        rows = st.selectbox(get_text("analytics_rows", "行", "行"), dimensions, key='analytics_rows',
+                            format_func=to_display)
+    with cols[2]:
+        columns = st.selectbox(get_text("analytics_columns", "列", "列"), ['-'] + dimensions, index=3,
+                               key='analytics_columns', format_func=to_display)
+    with cols[3]:
+        measure = st.selectbox(get_text("analytics_measure", "指標", "指标"), list(MEASURES), key='analytics_measure',
+                               format_func=to_display)
+    columns = None if columns in ['-', rows] else columns
+    
+    cube = load_facet_cube(label)
+    
+    # 鑽取：按其他維度切片
+    selection = {}
+    with st.expander(get_text("analytics_slice", "篩選範圍", "筛选范围")):
+        slice_cols = st.columns(2)
+        for i, dimension in enumerate(d for d in dimensions if d not in [rows, columns]):
+            with slice_cols[i % 2]:
+                selection[dimension] = st.multiselect(
+                    to_display(dimension),
+                    cube.values(dimension),
+                    key=f'analytics_slice_{dimension}',
+                    format_func=to_display
+                )
+    
+    table = cube.pivot(rows, measure=measure, columns=columns, selection=selection)
+    display = table.copy()
+    display.index = [to_display(value) for value in table.index]
+    display.columns = [to_display(value) for value in table.columns]
+    st.dataframe(display, use_container_width=True)
+    
+    # 鑽取到學校列表
+    drill_cols = st.columns([2, 2, 1])
+    with drill_cols[0]:
+        row_value = st.selectbox(to_display(rows), list(table.index), key='analytics_drill_row', format_func=to_display)
+    column_value = None
+    if columns:
+        with drill_cols[1]:
+            column_value = st.selectbox(to_display(columns), ['-'] + list(table.columns), key='analytics_drill_column',
+                                        format_func=to_display)
+    drill = {key: values for key, values in selection.items() if values}
+    drill[rows] = [row_value]
+    if columns and column_value != '-':
+        drill[columns] = [column_value]
+    filters = selection_filters(drill)
+    supported = all(
+        set(values) <= set(get_filter_widget_options(key))
+        for key, values in filters.items()
+    )
+    with drill_cols[2]:
+        st.write("")
+        if st.button(
+            get_text("open_in_list", "查看學校", "查看学校"),
+            key='analytics_open_in_list',
+            use_container_width=True,
+            disabled=not filters or not supported,
+            on_click=open_in_list,
+            args=(filters,)
+        ):
+            # 篩選條件及主視圖都改變了，需要重新運行整個應用
+            st.rerun()
+    if filters and not supported:
+        st.caption(get_text("drill_unsupported", "此組合不能在篩選器中選擇", "此组合不能在筛选器中选择"))
+
 def render_school_detail(school: Dict[str, Any], show_back: bool = True):
     """渲染學校詳細信息"""
+    from utils.facility_cards import card_path
     lang = st.session_state.language
-    school_name = convert_text(str(school.get('學校名稱', '')), lang)
+    # 按需讀取只在詳細資料頁顯示的欄位
+    school = {**school, **load_record_store().get_details(school.get('id'))}
+    school_name = localize(str(school.get('學校名稱', '')), lang)
     
     if show_back:
         st.title(school_name)
         if st.button(get_text("back", "返回", "返回")):
-            st.session_state.detail_school = None
+            st.session_state.detail_school_id = None
             st.rerun()
     else:
         st.header(school_name)
@@ -408,21 +1201,33 @@ def render_school_detail(school: Dict[str, Any], show_back: bool = True):
     ])
     
     with tab1:
-        st.write(f"**{get_text('region', '區域', '区域')}:** {convert_text(str(school.get('區域', '-')), lang)}")
+        st.write(f"**{get_text('region', '區域', '区域')}:** {localize(str(school.get('區域', '-')), lang)}")
         st.write(f"**{get_text('school_net', '校網', '校网')}:** {str(school.get('小一學校網', '-'))}")
-        st.write(f"**{get_text('type', '類型', '类型')}:** {convert_text(str(school.get('學校類別1', '-')), lang)}")
-        st.write(f"**{get_text('gender', '性別', '性别')}:** {convert_text(str(school.get('學生性別', '-')), lang)}")
-        st.write(f"**{get_text('religion', '宗教', '宗教')}:** {convert_text(str(school.get('宗教', '-')), lang)}")
-        st.write(f"**{get_text('language', '教學語言', '教学语言')}:** {convert_text(str(school.get('教學語言', '-')), lang)}")
-        st.write(f"**{get_text('sponsoring_body', '辦學團體', '办学团体')}:** {convert_text(str(school.get('辦學團體', '-')), lang)}")
-    
+        st.write(f"**{get_text('type', '類型', '类型')}:** {localize(str(school.get('學校類別1', '-')), lang)}")
+        st.write(f"**{get_text('gender', '性別', '性别')}:** {localize(str(school.get('學生性別', '-')), lang)}")
+        st.write(f"**{get_text('religion', '宗教', '宗教')}:** {localize(str(school.get('宗教', '-')), lang)}")
+        st.write(f"**{get_text('language', '教學語言', '教学语言')}:** {localize(str(school.get('教學語言', '-')), lang)}")
+        st.write(f"**{get_text('sponsoring_body', '辦學團體', '办学团体')}:** {localize(str(school.get('辦學團體', '-')), lang)}")
+
+        # 與上學年比較（預先計算）
+        changes = load_record_store().get_changes(school.get('id'))
+        if changes:
+            st.divider()
+            st.write(f"**{get_text('changes', '與上學年比較', '与上学年比较')}**")
+            for label, (old_value, new_value) in changes.items():
+                st.write(f"**{localize(label, lang)}:** {localize(str(old_value), lang)} → {localize(str(new_value), lang)}")
+
     with tab2:
-        st.write(f"**{get_text('special_rooms', '特別室', '特别室')}:** {convert_text(str(school.get('特別室', '-')), lang)}")
-        st.write(f"**{get_text('other_facilities', '其他學校設施', '其他学校设施')}:** {convert_text(str(school.get('其他學校設施', '-')), lang)}")
-        st.write(f"**{get_text('sen_facilities', '支援有特殊教育需要學生的設施', '支援有特殊教育需要学生的设施')}:** {convert_text(str(school.get('支援有特殊教育需要學生的設施', '-')), lang)}")
+        # 已生成設施卡片時直接顯示
+        facility_card = card_path(school, FACILITY_CARD_DIR)
+        if facility_card.exists():
+            st.image(str(facility_card), use_container_width=True)
+        st.write(f"**{get_text('special_rooms', '特別室', '特别室')}:** {localize(str(school.get('特別室', '-')), lang)}")
+        st.write(f"**{get_text('other_facilities', '其他學校設施', '其他学校设施')}:** {localize(str(school.get('其他學校設施', '-')), lang)}")
+        st.write(f"**{get_text('sen_facilities', '支援有特殊教育需要學生的設施', '支援有特殊教育需要学生的设施')}:** {localize(str(school.get('支援有特殊教育需要學生的設施', '-')), lang)}")
     
     with tab3:
-        st.write(f"**{get_text('address', '地址', '地址')}:** {convert_text(str(school.get('學校地址', '-')), lang)}")
+        st.write(f"**{get_text('address', '地址', '地址')}:** {localize(str(school.get('學校地址', '-')), lang)}")
         st.write(f"**{get_text('phone', '電話', '电话')}:** {str(school.get('學校電話', '-'))}")
         st.write(f"**{get_text('email', '電郵', '电邮')}:** {str(school.get('學校電郵', '-'))}")
         st.write(f"**{get_text('website', '網址', '网址')}:** {str(school.get('學校網址', '-'))}")
@@ -432,8 +1237,20 @@ def render_school_detail(school: Dict[str, Any], show_back: bool = True):
         st.write(f"**{get_text('other_fees', '其他收費', '其他收费')}:** {str(school.get('其他收費_費用', '-'))}")
     
     with tab5:
-        st.write(f"**{get_text('philosophy', '辦學宗旨', '办学宗旨')}:** {convert_text(str(school.get('辦學宗旨', '-')), lang)}")
-        st.write(f"**{get_text('school_style', '校風', '校风')}:** {convert_text(str(school.get('校風', '-')), lang)}")
+        st.write(f"**{get_text('philosophy', '辦學宗旨', '办学宗旨')}:** {localize(str(school.get('辦學宗旨', '-')), lang)}")
+        st.write(f"**{get_text('school_style', '校風', '校风')}:** {localize(str(school.get('校風', '-')), lang)}")
+
+def render_session_memory_report():
+    """渲染所有會話的內存統計（設置 SESSION_MEMORY_REPORT=1 時顯示，供部署時監察）"""
+    registry = load_session_registry()
+    report = registry.report()
+    with st.expander(f"會話內存：{len(report)} 個會話，共 {registry.total_bytes() / 1024:.0f} KB"):
+        for row in report:
+            st.caption(
+                f"{row['session'][:8]}：狀態 {row['state_bytes'] / 1024:.1f} KB，"
+                f"派生數據 {row['derived_bytes'] / 1024:.1f} KB，閒置 {row['idle_seconds']:.0f}s，"
+                f"已清除 {row['evictions']} 項"
+            )
 
 # 主應用
 def main():
@@ -451,73 +1268,55 @@ def main():
         )
         st.session_state.language = 'tc' if lang == "繁體" else 'sc'
     
-    # 加載學校數據
-    if not st.session_state.schools:
+    # 加載學校數據（所有會話共用；SQLite 後端只打開文件）
+    if 'loaded' not in st.session_state:
         with st.spinner(get_text("loading", "正在加載學校數據...", "正在载入学校数据...")):
-            st.session_state.schools = load_data()
-            if st.session_state.schools:
-                st.success(f"✅ {get_text('loaded', '已加載', '已载入')} {len(st.session_state.schools)} {get_text('schools', '所學校', '所学校')}")
+            count = count_schools()
+            if count:
+                st.session_state.loaded = True
+                st.success(f"✅ {get_text('loaded', '已加載', '已载入')} {count} {get_text('schools', '所學校', '所学校')}")
     
-    if not st.session_state.schools:
+    if not count_schools():
         st.error(get_text("error_loading", "無法加載學校數據", "无法载入学校数据"))
         return
     
-    # 獲取篩選選項
-    filter_options = get_filter_options(st.session_state.schools)
+    # 會話內存統計及閒置會話清除
+    track_session()
+    
+    # 獲取篩選選項（每個數據版本只計算一次）
+    filter_options = load_filter_options()
+    
+    # 記錄本次運行使用的篩選條件，側邊欄片段據此判斷是否需要重新運行整個應用
+    st.session_state.applied_filters_key = get_filters_key(get_current_filters())
     
     # 側邊欄：篩選條件
     with st.sidebar:
-        render_filter_section(st.session_state.schools, filter_options)
+        render_filter_section(filter_options)
+        if os.environ.get('SESSION_MEMORY_REPORT'):
+            render_session_memory_report()
     
     # 主內容區域
     if st.session_state.show_comparison:
         render_comparison_view()
-    elif st.session_state.detail_school:
-        render_school_detail(st.session_state.detail_school)
+    elif get_school(st.session_state.detail_school_id) is not None:
+        render_detail_pane()
     else:
-        # 檢查是否有篩選條件
-        has_filter = has_any_filter()
-        
-        if not has_filter:
-            st.info(get_text("no_filter", "請輸入搜尋條件或選擇篩選器", "请输入搜索条件或选择筛选器"))
-            return
-        
-        # 應用篩選
-        filters = {
-            'search_query': st.session_state.get('search_query', ''),
-            'feature_search_query': st.session_state.get('feature_search_query', ''),
-            '區域': st.session_state.get('filters_區域', []),
-            '校網': st.session_state.get('filters_校網', []),
-            '辦學團體': st.session_state.get('filters_辦學團體', []),
-            '資助類型': st.session_state.get('filters_資助類型', []),
-            '學生性別': st.session_state.get('filters_學生性別', []),
-            '宗教': st.session_state.get('filters_宗教', []),
-            '教學語言': st.session_state.get('filters_教學語言', []),
-            '關聯學校': st.session_state.get('filters_關聯學校', []),
-            '課業安排': st.session_state.get('filters_課業安排', []),
-            'feature_tags': st.session_state.get('selected_tags', []),
-        }
-        
-        filtered_schools = apply_filters(st.session_state.schools, filters)
-        sorted_schools = sort_schools(filtered_schools)
-        
-        # 顯示結果數量
-        st.write(f"**{len(sorted_schools)} {get_text('schools_found', '所學校符合條件', '所学校符合条件')}**")
-        
-        # 比較按鈕
-        if st.session_state.selected_schools:
-            col1, col2 = st.columns([1, 4])
-            with col1:
-                if st.button(
-                    get_text("compare_selected", f"比較已選 ({len(st.session_state.selected_schools)})", f"比较已选 ({len(st.session_state.selected_schools)})"),
-                    use_container_width=True
-                ):
-                    st.session_state.show_comparison = True
-                    st.rerun()
-        
-        # 顯示學校列表
-        for i, school in enumerate(sorted_schools):
-            render_school_card(school, i)
+        st.radio(
+            "",
+            ['學校列表', '數據分析', '已儲存搜尋'],
+            horizontal=True,
+            key='main_view',
+            format_func=lambda view: localize(view, st.session_state.language),
+            label_visibility="collapsed"
+        )
+        if st.session_state.main_view == '數據分析':
+            render_analytics_view()
+        elif st.session_state.main_view == '已儲存搜尋':
+            render_saved_searches()
+        else:
+            # 比較欄在結果列表片段之外，勾選比較時只更新比較欄
+            render_comparison_tray()
+            render_result_list()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,10 @@
+"""pytest 共用的測試數據"""
+import pytest
+
+from test_app import CSV_PATH
+from utils.csv_parser import load_schools
+
+@pytest.fixture(scope='session')
+def schools():
+    """本學年學校數據（所有測試共用一份，測試不應修改）"""
+    return load_schools(CSV_PATH)
@@ -1,110 +1,779 @@
 """測試腳本：驗證應用核心功能是否正常"""
 import sys
+import traceback
 from pathlib import Path
 
 # 添加 utils 到路徑
 sys.path.insert(0, str(Path(__file__).parent))
 
-from utils.csv_parser import load_schools
+from utils.csv_parser import load_schools, column_memory_usage
 from utils.filters import apply_filters, get_filter_options
 from utils.sorting import sort_schools
 from utils.i18n import convert_text
+from utils import store as store_module
+from utils.store import SchoolStore, load_store, open_snapshot
+from utils.startup_profile import profile_startup, check_budget, memory_profile
+from utils.equivalence import run_suite, format_report, random_filters, QUERY_CLASSES
+from utils.saved_searches import SavedSearchStore, canonical_spec, evaluate_searches, dataset_fingerprint
+from utils.export import export_schools, has_xlsx_support
+from utils.session_memory import SessionCache, SessionRegistry, deep_size
+from utils.fields import SEARCH_FIELDS, HOT_FIELDS, DETAIL_FIELDS, LOADED_FIELDS, DEFAULT_EXPORT_FIELDS
+from utils.comparison import build_comparison_matrix, find_extremes, differing_rows
+from utils.facility_cards import render_all, card_path
+from utils.static_export import export_site, page_names
+from utils.sqlite_store import POOL_SIZE, build_from_csv, build_sqlite_store, open_sqlite_store
+from utils.feature_query import parse_query, query_error, FeatureIndex, tag_query, TERM_CACHE_SIZE
+from utils.tags import POPULAR_TAGS, TagIndex, tag_keywords, mine_tags
+from utils.flags import POLICY_FLAGS, FLAG_BITS, FLAG_FILTERS, FlagIndex, pack_flags
+from utils.analytics import FacetCube, selection_filters
+from utils.typeahead import build_typeahead, KIND_NAME, KIND_TERM
+from utils.geo import GeoIndex, geocode, place_location, distance_km
+from utils.entities import EntityIndex, entity_key, split_names
+
+CSV_PATH = Path(__file__).parent.parent / "attached_assets" / "database_school_info_1763020452726.csv"
 
 def test_csv_loading():
     """測試 CSV 加載"""
     print("測試 CSV 加載...")
-    csv_path = Path(__file__).parent.parent / "attached_assets" / "database_school_info_1763020452726.csv"
-    
-    if not csv_path.exists():
-        print(f"[ERROR] CSV 文件不存在: {csv_path}")
-        return None
-    
-    print(f"[OK] CSV 文件存在: {csv_path}")
+    assert CSV_PATH.exists(), f"CSV 文件不存在: {CSV_PATH}"
+    print(f"[OK] CSV 文件存在: {CSV_PATH}")
     
-    try:
-        schools = load_schools(csv_path)
-        print(f"[OK] 成功加載 {len(schools)} 所學校")
-        if len(schools) > 0:
-            print(f"   示例學校: {schools[0].get('學校名稱', 'N/A')}")
-        return schools
-    except Exception as e:
-        print(f"[ERROR] 加載失敗: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+    schools = load_schools(CSV_PATH)
+    assert schools
+    print(f"[OK] 成功加載 {len(schools)} 所學校")
+    print(f"   示例學校: {schools[0].get('學校名稱', 'N/A')}")
 
 def test_filter_options(schools):
     """測試篩選選項提取"""
     print("\n測試篩選選項提取...")
-    try:
-        options = get_filter_options(schools)
-        print(f"[OK] 成功提取篩選選項")
-        print(f"   區域數量: {len(options.get('區域', []))}")
-        print(f"   校網數量: {len(options.get('校網', []))}")
-        print(f"   辦學團體數量: {len(options.get('辦學團體', []))}")
-        return options
-    except Exception as e:
-        print(f"[ERROR] 提取失敗: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+    options = get_filter_options(schools)
+    assert options.get('區域') and options.get('校網') and options.get('辦學團體')
+    print(f"[OK] 成功提取篩選選項")
+    print(f"   區域數量: {len(options.get('區域', []))}")
+    print(f"   校網數量: {len(options.get('校網', []))}")
+    print(f"   辦學團體數量: {len(options.get('辦學團體', []))}")
 
 def test_filtering(schools):
     """測試篩選功能"""
     print("\n測試篩選功能...")
-    try:
-        filters = {
-            'search_query': '',
-            'feature_search_query': '',
-            '區域': ['香港東區'],
-            '校網': [],
-            '辦學團體': [],
-            '資助類型': [],
-            '學生性別': [],
-            '宗教': [],
-            '教學語言': [],
-            '關聯學校': [],
-            '課業安排': [],
-            'feature_tags': [],
-        }
-        
-        filtered = apply_filters(schools, filters)
-        print(f"[OK] 篩選成功: {len(filtered)} 所學校符合條件")
-        return filtered
-    except Exception as e:
-        print(f"[ERROR] 篩選失敗: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+    filters = {
+        'search_query': '',
+        'feature_search_query': '',
+        '區域': ['香港東區'],
+        '校網': [],
+        '辦學團體': [],
+        '資助類型': [],
+        '學生性別': [],
+        '宗教': [],
+        '教學語言': [],
+        '關聯學校': [],
+        '課業安排': [],
+        'feature_tags': [],
+    }
+    
+    filtered = apply_filters(schools, filters)
+    assert filtered and all(s['區域'] == '香港東區' for s in filtered)
+    print(f"[OK] 篩選成功: {len(filtered)} 所學校符合條件")
 
 def test_sorting(schools):
     """測試排序功能"""
     print("\n測試排序功能...")
-    try:
-        sorted_schools = sort_schools(schools[:10])  # 只排序前10所
-        print(f"[OK] 排序成功: {len(sorted_schools)} 所學校")
-        if len(sorted_schools) > 0:
-            print(f"   第一所學校: {sorted_schools[0].get('學校名稱', 'N/A')}")
-        return sorted_schools
-    except Exception as e:
-        print(f"[ERROR] 排序失敗: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+    sorted_schools = sort_schools(schools[:10])  # 只排序前10所
+    assert sorted(s['id'] for s in sorted_schools) == sorted(s['id'] for s in schools[:10])
+    print(f"[OK] 排序成功: {len(sorted_schools)} 所學校")
+    print(f"   第一所學校: {sorted_schools[0].get('學校名稱', 'N/A')}")
 
 def test_i18n():
     """測試雙語轉換"""
     print("\n測試雙語轉換...")
+    test_text = "香港小學選校器"
+    simplified = convert_text(test_text, 'sc')
+    assert simplified == "香港小学选校器"
+    print(f"[OK] 轉換成功")
+    print(f"   繁體: {test_text}")
+    print(f"   簡體: {simplified}")
+
+def test_multi_year_store(schools):
+    """測試多年度數據存儲及變化計算"""
+    print("\n測試多年度數據存儲...")
+    # 模擬上一年度：第一所學校的教師人數不同
+    previous = [dict(s) for s in schools]
+    previous[0]['教師總人數'] = '-'
+    
+    store = SchoolStore()
+    store.add_version('上學年', previous)
+    single_year_values = store.count_values()
+    store.add_version('本學年', schools)
+    
+    assert store.get_schools() == schools
+    assert store.get_schools('上學年') == previous
+    # 未變化的值跨年度只保存一次
+    assert store.count_values() - single_year_values <= 1
+    
+    name = schools[0]['學校名稱']
+    changes = store.get_changes(schools[0]['id'])
+    assert changes.get('教師人數') == ('-', schools[0]['教師總人數'])
+    print(f"[OK] 兩個年度共 {store.count_values()} 個不重複值")
+    print(f"   {name} 的變化: {changes}")
+
+    # 名稱重複或空白的學校不會因名稱索引而丟失
+    duplicates = [dict(schools[0]), dict(schools[0]), dict(schools[1], 學校名稱='')]
+    store.add_version('重複名稱', duplicates)
+    assert store.get_schools('重複名稱') == duplicates
+    
+    # 同名學校（不同區域）各自對應上一年度的同一所學校；改名的學校按地址對應
+    twin = next(s for s in schools if s['區域'] != schools[0]['區域'] and s['學校地址'] != schools[0]['學校地址'])
+    before = [dict(schools[0], 教師總人數=10), dict(twin, 學校名稱=schools[0]['學校名稱'], 教師總人數=20),
+              dict(schools[1], 教師總人數=30)]
+    after = [dict(school, id=i + 1, 教師總人數=school['教師總人數'] + 1) for i, school in enumerate(before)]
+    after[2]['學校名稱'] = after[2]['學校名稱'] + '（新校名）'
+    history = SchoolStore()
+    history.add_version('上學年', before)
+    history.add_version('本學年', after)
+    assert [history.get_changes(i + 1).get('教師人數') for i in range(3)] == [(10, 11), (20, 21), (30, 31)]
+def test_dictionary_encoding(schools):
+    """測試字典編碼及內存統計"""
+    print("\n測試字典編碼...")
+    assert all(isinstance(s['id'], int) for s in schools)
+    # 重複值共用同一個對象
+    regions = {id(s['區域']) for s in schools}
+    assert len(regions) == len({s['區域'] for s in schools})
+    
+    usage = column_memory_usage(schools)
+    total = sum(column['bytes'] for column in usage.values())
+    print(f"[OK] 所有欄位共佔用 {total / 1024:.0f} KB")
+    for key in ['區域', '辦學團體', '學校類別2', '校風']:
+        column = usage[key]
+        print(f"   {key}: {column['distinct']}/{column['cells']} 個對象, {column['bytes']} bytes")
+
+def test_projected_loading():
+    """測試按欄位分組加載及詳細資料按需讀取"""
+    print("\n測試投影加載...")
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        detail_path = Path(tmp_dir) / "details.bin"
+        store = load_store(
+            {'本學年': CSV_PATH},
+            columns=HOT_FIELDS,
+            detail_fields=DETAIL_FIELDS,
+            detail_path=detail_path
+        )
+        schools = store.get_schools()
+        assert schools and '學校發展計劃' not in schools[0]
+        assert '特別室' not in schools[0]
+        
+        full = load_schools(CSV_PATH)
+        details = store.get_details(schools[0]['id'])
+        assert details['特別室'] == full[0]['特別室']
+        print(f"[OK] 常駐內存 {len(schools[0])} 個欄位，詳細資料文件 {detail_path.stat().st_size // 1024} KB")
+        store.details.close()
+
+def test_comparison_matrix(schools):
+    """測試學校比較表"""
+    print("\n測試學校比較表...")
+    store = SchoolStore()
+    store.add_version('本學年', schools)
+    ids = [s['id'] for s in schools[:3]]
+    matrix = build_comparison_matrix(store, ids)
+    assert list(matrix.columns) == [s['學校名稱'] for s in schools[:3]]
+    
+    best, worst = find_extremes(matrix)
+    row = '碩士／博士或以上人數百分率'
+    values = [float(v) for v in matrix.loc[row]]
+    if max(values) != min(values):
+        assert best.loc[row].tolist() == [v == max(values) for v in values]
+        assert worst.loc[row].tolist() == [v == min(values) for v in values]
+    
+    diff = differing_rows(matrix)
+    assert len(diff) <= len(matrix)
+    print(f"[OK] 比較表 {matrix.shape[0]} 個欄位，其中 {len(diff)} 個有差異")
+
+def test_facility_cards():
+    """測試設施卡片批量生成及緩存"""
+    print("\n測試設施卡片生成...")
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = load_store(
+            {'本學年': CSV_PATH},
+            columns=HOT_FIELDS,
+            detail_fields=DETAIL_FIELDS,
+            detail_path=Path(tmp_dir) / "details.bin"
+        )
+        schools = [
+            {**school, **store.get_details(school['id'])}
+            for school in store.get_schools()[:4]
+        ]
+        cache_dir = Path(tmp_dir) / "cards"
+        
+        stats = render_all(schools, cache_dir, workers=2)
+        assert stats == {'rendered': 4, 'skipped': 0, 'removed': 0}
+        # 內容未改變時跳過
+        stats = render_all(schools, cache_dir, workers=2)
+        assert stats == {'rendered': 0, 'skipped': 4, 'removed': 0}
+        # 只有改變了的學校會重新生成，舊卡片被刪除
+        old_card = card_path(schools[0], cache_dir)
+        schools[0] = {**schools[0], '特別室': '音樂室、視藝室'}
+        stats = render_all(schools, cache_dir, workers=2)
+        assert stats == {'rendered': 1, 'skipped': 3, 'removed': 1}
+        assert card_path(schools[0], cache_dir).exists() and not old_card.exists()
+        # 學校減少時刪除其卡片
+        stats = render_all(schools[:3], cache_dir, workers=2)
+        assert stats == {'rendered': 0, 'skipped': 3, 'removed': 1}
+        assert len(list(cache_dir.glob('*.png'))) == 3
+        store.details.close()
+    print(f"[OK] 卡片按內容哈希緩存，只重新生成改變了的學校，並刪除過期卡片")
+
+def test_static_export(schools):
+    """測試靜態頁面導出及增量更新"""
+    print("\n測試靜態頁面導出...")
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_dir = Path(tmp_dir) / "site"
+        store = SchoolStore()
+        store.add_version('本學年', schools[:20])
+        
+        stats = export_site(store, out_dir, workers=1)
+        assert stats['written'] > 0 and stats['skipped'] == 0
+        pages = page_names(store.get_schools())
+        page = pages[schools[0]['id']]
+        assert (out_dir / "tc" / "schools" / f"{page}.html").exists()
+        assert (out_dir / "sc" / "schools" / f"{page}.json").exists()
+        
+        # 數據未改變時不重新生成
+        stats = export_site(store, out_dir, workers=1)
+        assert stats['written'] == 0
+        
+        # 學校減少時刪除過期頁面
+        smaller = SchoolStore()
+        smaller.add_version('本學年', schools[:19])
+        stats = export_site(smaller, out_dir, workers=1)
+        assert stats['removed'] >= 4
+        assert not (out_dir / "tc" / "schools" / f"{pages[schools[19]['id']]}.html").exists()
+        
+        # 刪除第一所學校後其後學校的 id（CSV 行號）全部改變，但頁面名稱及內容不變，不會重新生成
+        mtimes = {path: path.stat().st_mtime_ns for path in (out_dir / "tc" / "schools").iterdir()}
+        shifted = SchoolStore()
+        shifted.add_version('本學年', [dict(s, id=i + 1) for i, s in enumerate(schools[1:19])])
+        stats = export_site(shifted, out_dir, workers=1)
+        assert stats['removed'] >= 4
+        remaining = {path: path.stat().st_mtime_ns for path in (out_dir / "tc" / "schools").iterdir()}
+        assert len(remaining) == len(mtimes) - 2
+        assert all(mtimes[path] == mtime for path, mtime in remaining.items())
+    print(f"[OK] 導出及增量更新正常")
+
+def test_feature_query(schools):
+    """測試學校特色查詢語法"""
+    print("\n測試特色查詢語法...")
+    assert parse_query('english day') == ('term', None, 'english day')
+    assert parse_query('校風:關愛') == ('term', '校風', '關愛')
+    assert parse_query('STEAM AND (音樂 OR 藝術) NOT 寄宿') == ('and', [
+        ('term', None, 'steam'),
+        ('or', [('term', None, '音樂'), ('term', None, '藝術')]),
+        ('not', ('term', None, '寄宿')),
+    ])
+    
+    index = FeatureIndex(schools)
+    music = index.filter(schools, parse_query('音樂'))
+    art = index.filter(schools, parse_query('藝術'))
+    either = index.filter(schools, parse_query('音樂 OR 藝術'))
+    both = index.filter(schools, parse_query('音樂 AND 藝術'))
+    assert len(either) == len({s['id'] for s in music} | {s['id'] for s in art})
+    assert len(both) == len({s['id'] for s in music} & {s['id'] for s in art})
+    assert len(index.filter(schools, parse_query('NOT 音樂'))) == len(schools) - len(music)
+    
+    # 指定欄位只搜索該欄位
+    scoped = apply_filters(schools, {'feature_search_query': '校風:關愛'})
+    assert scoped and all('關愛' in str(s.get('校風', '')) for s in scoped)
+    
+    # 校訓只能以「校訓:」前綴搜索，不限欄位的搜索及標籤不會匹配校訓
+    texts = [' '.join(str(s.get(field, '')) for field in SEARCH_FIELDS).lower() for s in schools]
+    motto = next(m for m in (str(s.get('校訓', '')).strip() for s in schools)
+                 if len(m) >= 4 and m not in ('-', '') and not any(m.lower() in text for text in texts))
+    assert apply_filters(schools, {'feature_search_query': motto}) == []
+    assert apply_filters(schools, {'feature_search_query': f'校訓:{motto}'})
+    
+    # 語法錯誤時整句作為子字符串，錯誤信息另外返回供界面提示
+    assert apply_filters(schools, {'feature_search_query': '(音樂'}) == []
+    assert '括號' in str(query_error('(音樂'))
+    assert query_error('音樂 AND') is not None and query_error('校風:') is not None
+    assert query_error('音樂 OR 藝術') is None and query_error('') is None
+    
+    # 過深的嵌套按語法錯誤處理，不會超出遞歸深度
+    for deep in ['(' * 3000 + 'a', 'NOT ' * 3000 + 'a', '(' * 3000 + 'a' + ')' * 3000]:
+        assert '嵌套' in str(query_error(deep))
+        apply_filters(schools, {'feature_search_query': deep})
+    assert query_error('(' * 10 + '音樂' + ')' * 10) is None
+    
+    # 詞位圖緩存有上限
+    for i in range(TERM_CACHE_SIZE + 10):
+        index.term_bits(None, f'詞{i}')
+    assert len(index._term_bits) == TERM_CACHE_SIZE
+    print(f"[OK] 音樂 OR 藝術: {len(either)} 所，音樂 AND 藝術: {len(both)} 所，校風:關愛: {len(scoped)} 所")
+
+def test_tag_index(schools):
+    """測試標籤位圖及標籤挖掘"""
+    print("\n測試標籤位圖...")
+    assert tag_keywords('愉快/Happy School') == ['愉快', 'happy school']
+    
+    tag_index = TagIndex(schools, POPULAR_TAGS)
+    feature_index = FeatureIndex(schools)
+    coverage = tag_index.coverage()
+    for tag in POPULAR_TAGS:
+        assert coverage[tag] == len(feature_index.filter(schools, tag_query(tag))), tag
+    
+    tags = ['STEAM', '音樂']
+    expected = apply_filters(schools, {'feature_tags': tags})
+    assert apply_filters(schools, {'feature_tags': tags}, tag_index=tag_index) == expected
+    
+    suggestions = mine_tags(schools, limit=10, exclude=POPULAR_TAGS)
+    assert suggestions and all(count > 0 for _, count in suggestions)
+    print(f"[OK] STEAM + 音樂: {len(expected)} 所，建議標籤: {', '.join(gram for gram, _ in suggestions[:5])}")
+
+def test_policy_flags(schools):
+    """測試有 / 無欄位位圖篩選"""
+    print("\n測試政策標記位圖...")
+    flag_index = FlagIndex(schools)
+    for name, field in POLICY_FLAGS.items():
+        key = '課業安排' if name in FLAG_FILTERS['課業安排'] else '校車及家校組織'
+        expected = [s for s in schools if str(s.get(field, '')).strip() == '有']
+        assert apply_filters(schools, {key: [name]}, flag_index=flag_index) == expected, name
+    
+    filters = {'課業安排': ['下午安排導修時間', '小一不設測考'], '校車及家校組織': ['校車', '家長教師會']}
+    required = FLAG_BITS['下午安排導修時間'] | FLAG_BITS['小一不設測考'] | FLAG_BITS['校車'] | FLAG_BITS['家長教師會']
+    combined = apply_filters(schools, filters, flag_index=flag_index)
+    assert combined == [s for s in schools if pack_flags(s) & required == required]
+    assert combined == apply_filters(schools, filters)
+    afternoon = apply_filters(schools, {'課業安排': ['下午安排導修時間']})
+    print(f"[OK] 下午安排導修時間: {len(afternoon)} 所，組合篩選: {len(combined)} 所")
+
+def test_facet_cube(schools):
+    """測試分析數據立方的透視及鑽取"""
+    print("\n測試分析數據立方...")
+    import pandas as pd
+    cube = FacetCube(schools)
+    counts = cube.pivot('區域', columns='資助類型')
+    assert counts.to_numpy().sum() == len(schools)
+    
+    # 任何彙總層級的平均值都與直接計算一致
+    frame = pd.DataFrame(schools)
+    masters = cube.pivot('區域', measure='碩士／博士比例（平均 %）')
+    expected = frame.groupby('區域')['碩士／博士或以上人數百分率'].mean().round(1)
+    assert (masters.iloc[:, 0] - expected.reindex(masters.index)).abs().max() < 0.051
+    
+    # 鑽取結果與學校列表篩選一致
+    selection = {'區域': ['香港東區'], '資助類型': ['資助']}
+    drilled = cube.pivot('宗教', selection=selection)
+    filtered = apply_filters(schools, selection_filters(selection))
+    assert drilled.to_numpy().sum() == len(filtered)
+    print(f"[OK] {len(cube.cells)} 個格子，香港東區資助學校: {len(filtered)} 所")
+
+def test_typeahead(schools):
+    """測試輸入補全"""
+    print("\n測試輸入補全...")
+    import time
+    typeahead = build_typeahead(schools)
+    
+    # 名稱中間的字也能補全，與名稱搜索一致
+    names = typeahead.complete('培正', kinds=[KIND_NAME])
+    assert names and all('培正' in display for display, _ in names)
+    
+    # 簡體輸入補全繁體詞
+    assert ('電子學習', KIND_TERM) in typeahead.complete('电子', kinds=[KIND_TERM])
+    assert typeahead.complete('stea', kinds=[KIND_TERM])[0] == ('STEAM', KIND_TERM)
+    
+    start = time.perf_counter()
+    for prefix in ['學', '聖', '天主教', '敬', 'a']:
+        typeahead.complete(prefix)
+    elapsed = (time.perf_counter() - start) / 5 * 1000
+    assert elapsed < 5
+    print(f"[OK] {len(typeahead)} 個索引鍵，每次補全 {elapsed:.3f} ms")
+
+def test_entities(schools):
+    """測試辦學團體及關聯中學的規範化"""
+    print("\n測試名稱規範化...")
+    # 括號寫法、有限公司後綴、異體字及別名都對應同一個實體
+    assert entity_key('基督教中華傳道會﹝香港﹞有限公司') == entity_key('基督教中華傳道會（香港）有限公司')
+    assert entity_key('培僑教育機構有限公司') == entity_key('培僑教育機構')
+    assert entity_key('香港基督教循道衞理聯合教會') == entity_key('香港基督教循道衛理聯合教會')
+    assert entity_key('香港天主教教區') == entity_key('天主教') == entity_key('天主教香港教區')
+    assert split_names('新界鄉議局元朗區中學、趙聿修紀念中學、<br>天水圍官立中學')[2] == '天水圍官立中學'
+    assert split_names('香港九龍塘基督教<br>中華宣道會') == ['香港九龍塘基督教中華宣道會']
+    
+    entity_index = EntityIndex(schools)
+    options = get_filter_options(schools, entity_index=entity_index)
+    assert len(set(map(entity_key, options['辦學團體']))) == len(options['辦學團體'])
+    assert '天主教' not in options['辦學團體'] and '香港天主教教區' not in options['辦學團體']
+    
+    catholic = apply_filters(schools, {'辦學團體': ['天主教香港教區']}, entity_index=entity_index)
+    assert catholic == apply_filters(schools, {'辦學團體': ['香港天主教教區']})
+    linked = apply_filters(schools, {'關聯中學': ['金文泰中學']}, entity_index=entity_index)
+    assert linked and all(
+        any('金文泰中學' in split_names(s.get(field)) for field in ['一條龍中學', '直屬中學', '聯繫中學'])
+        for s in linked
+    )
+    print(f"[OK] {len(options['辦學團體'])} 個辦學團體，{len(options['關聯中學'])} 所關聯中學，"
+          f"天主教香港教區: {len(catholic)} 所，金文泰中學: {len(linked)} 所")
+
+def test_geo_index(schools):
+    """測試離線地址定位及距離篩選"""
+    print("\n測試距離篩選...")
+    # 優先使用與學校區域一致的地名；地址中沒有地名時退回區域中心點
+    assert geocode('新界葵涌大白田街99號', '葵青區')[2] == '葵涌'
+    assert geocode('九龍觀塘油塘村第二期', '觀塘區')[2] == '油塘'
+    assert geocode('香港醫院道2號', '中西區')[2] == '中西區'
+    
+    geo_index = GeoIndex(schools)
+    lat, lng = place_location('沙田')
+    located = sorted(
+        (distance_km(*point, lat, lng), i) for i, point in enumerate(geo_index.points) if point
+    )
+    assert len(located) == len(schools)
+    assert geo_index.within(lat, lng, 2) == [item for item in located if item[0] <= 2]
+    assert geo_index.nearest(lat, lng, 10) == located[:10]
+    
+    # 與其他篩選條件組合：最近的 5 所天主教學校
+    filters = {'宗教': ['天主教'], '附近地點': '沙田', '最近數目': 5}
+    nearest = apply_filters(schools, filters, geo_index=geo_index)
+    catholic = [s for s in schools if s.get('宗教') == '天主教']
+    expected = sorted(catholic, key=lambda s: (geo_index.distance(s, lat, lng), s['id']))[:5]
+    assert sorted(s['id'] for s in nearest) == sorted(s['id'] for s in expected)
+    nearby = apply_filters(schools, {'附近地點': '沙田', '距離': 2})
+    print(f"[OK] 沙田 2 公里內: {len(nearby)} 所，最近的天主教學校: {geo_index.sort(nearest, '沙田')[0]['學校名稱']}")
+
+def test_sqlite_store():
+    """測試 SQLite 存儲的篩選結果與內存篩選一致"""
+    print("\n測試 SQLite 存儲...")
+    import tempfile
+    schools = load_schools(CSV_PATH, LOADED_FIELDS)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = Path(tmp_dir) / "schools.sqlite"
+        store = build_sqlite_store(db_path, schools, LOADED_FIELDS)
+        assert store.load_schools() == sort_schools(schools)
+        
+        options = get_filter_options(schools)
+        cases = [
+            {'區域': options['區域'][:2]},
+            {'校網': ['11', '12'], '宗教': options['宗教'][:1]},
+            {'辦學團體': options['辦學團體'][:3], '關聯學校': ['直屬', '聯繫']},
+            {'search_query': '天主教', '課業安排': ['小一不設測考']},
+            {'課業安排': ['下午安排導修時間', '網上公開評估政策'], '校車及家校組織': ['保姆車']},
+            {'feature_search_query': 'STEM'},
+            {'feature_search_query': '英'},
+            {'feature_tags': ['AI/人工智能', '閱讀']},
+            {'feature_search_query': 'STEAM AND (音樂 OR 藝術) NOT 寄宿'},
+            {'feature_search_query': '校風:愛 OR 宗旨:全人', 'feature_tags': ['音樂']},
+            {'辦學團體': ['天主教', '香港基督教循道衛理聯合教會'], '關聯中學': options['關聯中學'][:5]},
+            {'附近地點': '沙田', '距離': 3},
+            {'附近地點': '旺角', '距離': 2, '最近數目': 5, '宗教': ['天主教']},
+        ]
+        for filters in cases:
+            expected = [s['id'] for s in sort_schools(apply_filters(schools, filters))]
+            actual = [s['id'] for s in store.apply_filters(filters, ['id'])]
+            assert actual == expected, filters
+        
+        # 按距離排列與 GeoIndex.sort 一致
+        geo_index = GeoIndex(schools)
+        filters = {'附近地點': '沙田', '距離': 5, '宗教': options['宗教'][:2]}
+        expected = [s['id'] for s in geo_index.sort(sort_schools(apply_filters(schools, filters)), '沙田')]
+        nearest = store.apply_filters(filters, ['id', 'lat', 'lng'], by_distance=True)
+        assert [s['id'] for s in nearest] == expected
+        assert nearest[0]['lat'] is not None
+        
+        # 應用不加載內存數據時需要的讀取：篩選選項、按 ID 讀取及與 SchoolStore 相同的 select / get_details
+        assert store.get_filter_options() == options
+        ids = [schools[5]['id'], schools[0]['id'], -1, schools[3]['id']]
+        assert [s['id'] for s in store.get_schools(ids, ['學校名稱'])] == [ids[0], ids[1], ids[3]]
+        assert store.select(ids, ['學校名稱', '不存在'])['學校名稱'] == [schools[i]['學校名稱'] for i in (5, 0, 3)]
+        assert store.get_details(schools[0]['id']) == {field: schools[0].get(field, '-') for field in store.fields}
+        assert store.get_details(-1) == {}
+        
+        # 多個線程同時查詢時從連接池借出連接，結果不變，打開的連接不超過 POOL_SIZE
+        import threading
+        expected = [s['id'] for s in store.apply_filters({'區域': options['區域'][:1]}, ['id'])]
+        results = []
+        def query():
+            for _ in range(20):
+                results.append([s['id'] for s in store.apply_filters({'區域': options['區域'][:1]}, ['id'])])
+        threads = [threading.Thread(target=query) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(results) == 160 and all(result == expected for result in results)
+        assert 1 <= store._opened <= POOL_SIZE and len(store._idle) == store._opened
+        
+        # 保存的搜尋可以直接由 SQLite 重新計算
+        spec = canonical_spec({'宗教': options['宗教'][:1], '課業安排': ['小一不設測考']})
+        saved = SavedSearchStore(Path(tmp_dir) / "saved.json")
+        saved.add('owner', '測試', spec, [], 'v1')
+        saved.refresh([], 'v2', backend=store)
+        expected = {s['學校名稱'] for s in apply_filters(schools, spec)}
+        assert set(saved.list('owner')[0]['results']) == expected
+        
+        assert open_sqlite_store(db_path, LOADED_FIELDS, versions={'本學年': CSV_PATH}) is not None
+        assert open_sqlite_store(db_path, HOT_FIELDS) is None
+        store.close()
+        
+        # 與上學年比較及歷年分析數據立方在建立時保存，讀取時與內存存儲一致
+        import pandas as pd
+        previous_csv = Path(tmp_dir) / "previous.csv"
+        frame = pd.read_csv(CSV_PATH, encoding='utf-8')
+        frame = frame.drop(index=0)
+        frame.loc[frame.index[:10], '教師總人數'] = 1
+        frame.to_csv(previous_csv, index=False, encoding='utf-8')
+        versions = {'上學年': previous_csv, '本學年': CSV_PATH}
+        memory = load_store(versions, HOT_FIELDS)
+        history = build_from_csv(Path(tmp_dir) / "history.sqlite", versions, LOADED_FIELDS)
+        assert history.labels == memory.labels and history.latest == '本學年'
+        changed = [s['id'] for s in schools if memory.get_changes(s['id'])]
+        assert len(changed) >= 10
+        assert all(history.get_changes(s['id']) == memory.get_changes(s['id']) for s in schools)
+        for label in versions:
+            expected_cube = FacetCube(memory.get_schools(label))
+            cube = history.get_facet_cube(label)
+            for measure in ['學校數目', '教師人數（總數）', '碩士／博士比例（平均 %）']:
+                assert cube.pivot('區域', measure=measure, columns='資助類型').equals(
+                    expected_cube.pivot('區域', measure=measure, columns='資助類型')), (label, measure)
+        assert open_sqlite_store(Path(tmp_dir) / "history.sqlite", LOADED_FIELDS, versions=versions) is not None
+        assert open_sqlite_store(Path(tmp_dir) / "history.sqlite", LOADED_FIELDS, versions={'本學年': CSV_PATH}) is None
+        history.close()
+    print(f"[OK] {len(cases)} 組篩選條件結果與內存篩選一致")
+
+def test_equivalence(schools):
+    """測試優化的篩選及排序引擎與參考實現結果一致（隨機篩選條件，原始及放大的合成數據）"""
+    print("\n測試引擎一致性...")
+    reports = run_suite(schools, cases=10, scales=[1, 2], seed=0)
+    for report in reports:
+        assert not report['mismatches'], report['mismatches'][:3]
+    print(format_report(reports[-1]))
+    total = sum(timing['queries'] for report in reports for timing in report['classes'].values())
+    print(f"[OK] {total} 組篩選條件結果與參考實現一致")
+
+def test_saved_searches(schools):
+    """測試保存的搜尋：規範形式、批量計算與逐個計算一致、數據更新後的差異"""
+    print("\n測試保存的搜尋...")
+    import random
+    import tempfile
+    import threading
+    # 次序不同或用了別名的條件得到相同的規範形式
+    assert canonical_spec({'宗教': ['天主教'], '校網': ['41', '41 '], '辦學團體': ['天主教'], '附近地點': '', '距離': 2.0}) == \
+        canonical_spec({'辦學團體': ['天主教香港教區'], '校網': ['41'], '宗教': ['天主教'], 'search_query': ' '})
+    
+    indexes = {
+        'index': FeatureIndex(schools),
+        'tag_index': TagIndex(schools, POPULAR_TAGS),
+        'flag_index': FlagIndex(schools),
+        'geo_index': GeoIndex(schools),
+        'entity_index': EntityIndex(schools),
+    }
+    options = get_filter_options(schools, entity_index=indexes['entity_index'])
+    rng = random.Random(0)
+    specs = []
+    for i in range(300):
+        filters = {'校網': [rng.choice(options['校網'])], '宗教': [rng.choice(options['宗教'])]}
+        filters.update(random_filters(rng, QUERY_CLASSES[i % len(QUERY_CLASSES)], schools, options))
+        specs.append(canonical_spec(filters))
+    stats = {}
+    results = evaluate_searches(schools, specs, stats, **indexes)
+    for spec, result in zip(specs, results):
+        assert [s['id'] for s in result] == [s['id'] for s in apply_filters(schools, spec, **indexes)], spec
+    assert stats['steps'] < stats['naive_steps']
+    
+    # 數據更新：一所學校改為天主教，另一所天主教學校不再符合
+    filters = {'宗教': ['天主教'], '課業安排': ['小一不設測考']}
+    before = apply_filters(schools, filters)
+    updated = [dict(s) for s in schools]
+    changed = next(s for s in updated if s.get('宗教') != '天主教' and s['id'] not in {b['id'] for b in before}
+                   and apply_filters([{**s, '宗教': '天主教'}], filters))
+    changed['宗教'] = '天主教'
+    dropped = next(s for s in updated if s['id'] == before[0]['id'])
+    dropped['宗教'] = '佛教'
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "saved_searches.json"
+        store = SavedSearchStore(path)
+        store.add('alice', '天主教不測考', filters, before, dataset_fingerprint(schools))
+        assert store.refresh(schools, dataset_fingerprint(schools)) == []
+        diffs = SavedSearchStore(path).refresh(updated, dataset_fingerprint(updated))
+        assert len(diffs) == 1
+        assert diffs[0]['added'] == [changed['學校名稱']] and diffs[0]['removed'] == [dropped['學校名稱']]
+        assert SavedSearchStore(path).list('alice')[0]['version'] == dataset_fingerprint(updated)
+        
+        # 其他擁有者看不到也刪除不了；文件中不保存擁有者標記本身
+        assert SavedSearchStore(path).list('bob') == []
+        SavedSearchStore(path).remove('bob', diffs[0]['id'])
+        assert len(store.list('alice')) == 1
+        assert 'alice' not in path.read_text(encoding='utf-8')
+        
+        # 多個存儲實例（對應多個進程）同時保存，不會覆蓋彼此的修改
+        def save_many(owner):
+            instance = SavedSearchStore(path)
+            for net in options['校網'][:10]:
+                instance.add(owner, '', {'校網': [net]}, [], dataset_fingerprint(schools))
+        threads = [threading.Thread(target=save_many, args=(f'user{n}',)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(SavedSearchStore(path)) == 1 + 4 * 10
+        assert all(len(store.list(f'user{n}')) == 10 for n in range(4))
+    print(f"[OK] {len(specs)} 個搜尋批量計算 {stats['steps']} 步（逐個計算 {stats['naive_steps']} 步），"
+          f"數據更新後 +{len(diffs[0]['added'])} / -{len(diffs[0]['removed'])}")
+
+def test_export():
+    """測試導出：CSV / JSON / XLSX 內容與存儲一致，簡體按批轉換，內存峰值低於還原完整學校字典"""
+    print("\n測試導出...")
+    import csv
+    import io
+    import json
+    import tempfile
+    import tracemalloc
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = load_store({'本學年': CSV_PATH}, HOT_FIELDS, DETAIL_FIELDS, Path(tmp_dir) / "details.bin")
+        schools = store.get_schools()
+        ids = [s['id'] for s in schools]
+        fields = DEFAULT_EXPORT_FIELDS
+        expected = [[str(s[f]) if f in s else str(store.get_details(s['id']).get(f, '-')) for f in fields] for s in schools]
+        
+        text = export_schools(store, ids, fields, 'CSV').getvalue().decode('utf-8-sig')
+        rows = list(csv.reader(io.StringIO(text)))
+        assert rows[0] == fields and rows[1:] == expected
+        
+        # 只導出部分學校時保持傳入的次序，未知 ID 被跳過
+        subset = ids[10:0:-1] + ['不存在']
+        records = json.loads(export_schools(store, subset, fields, 'JSON').getvalue())
+        assert [r['學校名稱'] for r in records] == [row[fields.index('學校名稱')] for row in expected[10:0:-1]]
+        
+        # 簡體：按批轉換與逐個單元格轉換一致
+        records = json.loads(export_schools(store, ids[:300], fields, 'JSON', lang='sc').getvalue())
+        header = [convert_text(f, 'sc') for f in fields]
+        assert list(records[0]) == header
+        assert [[str(v) for v in r.values()] for r in records] == [[convert_text(v, 'sc') for v in row] for row in expected[:300]]
+        
+        if has_xlsx_support():
+            from openpyxl import load_workbook
+            sheet = load_workbook(export_schools(store, ids, fields, 'XLSX')).active
+            values = [[str(v) for v in row] for row in sheet.iter_rows(values_only=True)]
+            assert values[0] == fields and len(values) == len(ids) + 1
+        
+        # 內存峰值：逐批投影 vs 先還原所有學校的完整字典再寫出
+        tracemalloc.start()
+        export_schools(store, ids, fields, 'CSV')
+        streamed = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        full = [{**s, **store.get_details(s['id'])} for s in schools]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        writer.writerows([[s.get(f, '-') for f in fields] for s in full])
+        naive = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert streamed < naive, (streamed, naive)
+    print(f"[OK] 導出 {len(ids)} 所學校，內存峰值 {streamed / 1024:.0f}KB（完整字典 {naive / 1024:.0f}KB）")
+
+def test_session_memory(schools):
+    """測試會話內存：共用對象不計入，派生數據按預算清除，閒置會話清除後總內存保持平穩"""
+    print("\n測試會話內存...")
+    import gc
+    import random
+    shared = frozenset([id(schools)] + [id(s) for s in schools])
+    # 引用共用學校字典的狀態不計入學校字典本身
+    assert deep_size({'selected': schools[:4]}, shared) < deep_size({'selected': [dict(s) for s in schools[:4]]}, shared) / 10
+    
+    # 超出預算時清除最久未用的結果，取不到時由調用者重新計算
+    cache = SessionCache(budget=4096)
+    for i in range(20):
+        cache.put(('filters', i), tuple(range(i * 20, i * 20 + 100)))
+    assert cache.nbytes <= 4096 and cache.evictions > 0
+    assert cache.get(('filters', 0)) is None and cache.get(('filters', 19)) is not None
+    
+    # 模擬長時間運行：會話不斷加入、活動一段時間後閒置或關閉
+    rng = random.Random(0)
+    registry = SessionRegistry(idle_timeout=60)
+    sessions = {}
+    totals = []
+    for minute in range(240):
+        now = minute * 60.0
+        for n in range(5):
+            sessions[f's{minute}-{n}'] = SessionCache()
+        for session_id in rng.sample(sorted(sessions), min(10, len(sessions))):
+            ids = rng.sample(range(len(schools)), rng.randint(1, len(schools)))
+            sessions[session_id].put(('filters', rng.randint(0, 3)), tuple(ids))
+            registry.touch(session_id, sessions[session_id], 2048, now)
+        # 部分會話關閉，Streamlit 丟棄其狀態
+        for session_id in rng.sample(sorted(sessions), len(sessions) // 20):
+            del sessions[session_id]
+        gc.collect()
+        registry.sweep(now)
+        totals.append(sum(row['derived_bytes'] for row in registry.report(now)))
+    report = registry.report(now)
+    # 已關閉的會話不再出現，閒置會話的派生數據已清除
+    assert {row['session'] for row in report} <= set(sessions)
+    assert all(row['derived_bytes'] == 0 for row in report if row['idle_seconds'] >= 60)
+    # 後半段的派生數據總量不再增長
+    assert max(totals[120:]) <= max(totals[:120]) * 1.5, (max(totals[:120]), max(totals[120:]))
+    print(f"[OK] {len(sessions)} 個會話仍打開，派生數據穩定在 {max(totals[120:]) / 1024:.0f} KB 以內")
+
+def test_startup():
+    """測試快照加載與冷啟動：快照還原的數據與解析 CSV 一致，首次渲染不加載重型模組"""
+    print("\n測試冷啟動...")
+    import subprocess
+    import tempfile
+    versions = {'本學年': CSV_PATH}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        detail_path = Path(tmp_dir) / "details.bin"
+        snapshot_path = Path(tmp_dir) / "schools.snapshot"
+        loaded = load_store(versions, HOT_FIELDS, DETAIL_FIELDS, detail_path, snapshot_path)
+        assert snapshot_path.exists()
+        restored = load_store(versions, HOT_FIELDS, DETAIL_FIELDS, detail_path, snapshot_path)
+        schools = restored.get_schools()
+        assert schools == loaded.get_schools()
+        assert all(restored.get_changes(s['id']) == loaded.get_changes(s['id']) for s in schools)
+        assert restored.get_details(schools[0]['id']) == loaded.get_details(schools[0]['id'])
+        assert open_snapshot(snapshot_path, versions, HOT_FIELDS) is not None
+        # 快照版本不同（解析規則已改動）時不使用快照
+        store_module.SNAPSHOT_VERSION += 1
+        try:
+            assert open_snapshot(snapshot_path, versions, HOT_FIELDS) is None
+        finally:
+            store_module.SNAPSHOT_VERSION -= 1
+        # 欄位不同時不使用快照
+        projected = load_store(versions, HOT_FIELDS[:5], DETAIL_FIELDS, detail_path, snapshot_path)
+        assert len(projected.get_schools()[0]) < len(schools[0])
+        
+        # 讀取快照及繁體界面的轉換都不需要 pandas / OpenCC
+        script = (
+            "import sys; from pathlib import Path; sys.path.insert(0, '.');"
+            "from utils.store import load_store; from utils.i18n import localize;"
+            "from utils.fields import HOT_FIELDS;"
+            f"store = load_store({{'本學年': Path({str(CSV_PATH)!r})}}, HOT_FIELDS[:5], "
+            f"snapshot_path=Path({str(snapshot_path)!r}));"
+            "assert store.get_schools() and localize('學校', 'tc') == '學校';"
+            "print(','.join(m for m in ('pandas', 'opencc') if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', script], capture_output=True, text=True,
+            cwd=str(Path(__file__).parent), check=True
+        )
+        assert result.stdout.strip() == '', result.stdout
+    
+    # 常駐欄位的內存統計只包含常駐內存的欄位
+    memory = memory_profile(CSV_PATH)
+    assert memory['total'] == sum(column['bytes'] for _, column in memory['columns'])
+    assert {field for field, _ in memory['columns']} <= set(HOT_FIELDS) | {'id'}
+    
+    profile = profile_startup(runs=1)
+    problems = check_budget(profile, import_budget=3.0, render_budget=8.0)
+    assert not problems, problems
+    print(f"[OK] 快照還原 {len(schools)} 所學校，導入 {profile['import']:.2f}s，"
+          f"首次渲染 {profile['first_render']:.2f}s")
+
+def run_test(test, *args) -> bool:
+    """運行一個測試；失敗時打印錯誤並返回 False"""
     try:
-        test_text = "香港小學選校器"
-        simplified = convert_text(test_text, 'sc')
-        print(f"[OK] 轉換成功")
-        print(f"   繁體: {test_text}")
-        print(f"   簡體: {simplified}")
+        test(*args)
         return True
     except Exception as e:
-        print(f"[ERROR] 轉換失敗: {e}")
-        import traceback
+        print(f"[ERROR] {test.__name__} 失敗: {e!r}")
         traceback.print_exc()
         return False
 
@@ -114,39 +783,70 @@ def main():
     print("=" * 50)
     
     # 測試 CSV 加載
-    schools = test_csv_loading()
-    if not schools:
+    if not run_test(test_csv_loading):
         print("\n[ERROR] 測試失敗：無法加載數據")
-        return
-    
-    # 測試篩選選項
-    options = test_filter_options(schools)
-    if not options:
-        print("\n[WARNING] 警告：篩選選項提取失敗，但繼續測試...")
-    
-    # 測試篩選
-    filtered = test_filtering(schools)
-    if not filtered:
-        print("\n[WARNING] 警告：篩選失敗，但繼續測試...")
+        sys.exit(1)
+    schools = load_schools(CSV_PATH)
     
-    # 測試排序
-    sorted_schools = test_sorting(schools)
-    if not sorted_schools:
-        print("\n[WARNING] 警告：排序失敗，但繼續測試...")
-    
-    # 測試雙語
-    i18n_ok = test_i18n()
+    results = [
+        # 測試篩選選項
+        run_test(test_filter_options, schools),
+        # 測試篩選
+        run_test(test_filtering, schools),
+        # 測試排序
+        run_test(test_sorting, schools),
+        # 測試雙語
+        run_test(test_i18n),
+        # 測試多年度數據存儲
+        run_test(test_multi_year_store, schools),
+        # 測試字典編碼
+        run_test(test_dictionary_encoding, schools),
+        # 測試投影加載
+        run_test(test_projected_loading),
+        # 測試學校比較表
+        run_test(test_comparison_matrix, schools),
+        # 測試設施卡片生成
+        run_test(test_facility_cards),
+        # 測試靜態頁面導出
+        run_test(test_static_export, schools),
+        # 測試特色查詢語法
+        run_test(test_feature_query, schools),
+        # 測試標籤位圖
+        run_test(test_tag_index, schools),
+        # 測試政策標記位圖
+        run_test(test_policy_flags, schools),
+        # 測試分析數據立方
+        run_test(test_facet_cube, schools),
+        # 測試輸入補全
+        run_test(test_typeahead, schools),
+        # 測試名稱規範化
+        run_test(test_entities, schools),
+        # 測試距離篩選
+        run_test(test_geo_index, schools),
+        # 測試 SQLite 存儲
+        run_test(test_sqlite_store),
+        # 測試引擎一致性
+        run_test(test_equivalence, schools),
+        # 測試保存的搜尋
+        run_test(test_saved_searches, schools),
+        # 測試導出
+        run_test(test_export),
+        # 測試會話內存
+        run_test(test_session_memory, schools),
+        # 測試冷啟動
+        run_test(test_startup),
+    ]
     
     print("\n" + "=" * 50)
     print("測試完成！")
     print("=" * 50)
     
-    if schools and i18n_ok:
-        print("\n[OK] 核心功能正常，可以運行 Streamlit 應用")
-        print("\n運行命令: streamlit run app.py")
-    else:
-        print("\n[WARNING] 部分功能可能有問題，請檢查錯誤信息")
+    failed = results.count(False)
+    if failed:
+        print(f"\n[ERROR] {failed} 個測試失敗，請檢查錯誤信息")
+        sys.exit(1)
+    print("\n[OK] 核心功能正常，可以運行 Streamlit 應用")
+    print("\n運行命令: streamlit run app.py")
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,140 @@
+
+from typing import List, Dict, Any, Optional
+
+import pandas as pd
+
+from .sorting import extract_school_net_number
+
+# 分析維度：顯示名稱 -> (欄位, 篩選鍵)
+DIMENSIONS = {
+    '區域': ('區域', '區域'),
+    '校網': ('小一學校網', '校網'),
+    '資助類型': ('學校類別1', '資助類型'),
+    '學生性別': ('學生性別', '學生性別'),
+    '宗教': ('宗教', '宗教'),
+    '教學語言': ('教學語言', '教學語言'),
+}
+
+# 分析指標：顯示名稱 -> (欄位, 聚合方式)；聚合方式為 'count'、'sum' 或 'mean'
+MEASURES = {
+    '學校數目': (None, 'count'),
+    '碩士／博士比例（平均 %）': ('碩士／博士或以上人數百分率', 'mean'),
+    '學士比例（平均 %）': ('學士人數百分率', 'mean'),
+    '師資培訓比例（平均 %）': ('已接受師資培訓人數百分率', 'mean'),
+    '10年年資或以上比例（平均 %）': ('10年年資或以上人數百分率', 'mean'),
+    '小一班數（總數）': ('本學年小一班數', 'sum'),
+    '總班數（總數）': ('本學年總班數', 'sum'),
+    '教師人數（總數）': ('教師總人數', 'sum'),
+}
+
+MEASURE_FIELDS = [field for field, _ in MEASURES.values() if field]
+
+# 建立數據立方需要的欄位
+ANALYTICS_FIELDS = [field for field, _ in DIMENSIONS.values()] + MEASURE_FIELDS
+
+EMPTY_VALUES = ['-', '', '—', '－', '/']
+
+def _dimension_value(value: Any) -> str:
+    value = str(value).strip()
+    return '-' if value in EMPTY_VALUES else value
+
+class FacetCube:
+    """按維度組合預先聚合的數據立方
+
+    建立時對學校數據做一次 group-by，得到所有維度組合（最細粒度）的學校數目、
+    各數值欄位的總和及有效數量。任何行 × 列的透視表及鑽取都只需要對立方的
+    格子做切片和彙總，不需要重新掃描學校數據。平均值由總和除以有效數量得出，
+    所以在任何彙總層級都是準確的。
+    """
+
+    def __init__(self, schools: List[Dict[str, Any]]):
+        data = {
+            name: [_dimension_value(school.get(field, '-')) for school in schools]
+            for name, (field, _) in DIMENSIONS.items()
+        }
+        for field in MEASURE_FIELDS:
+            data[field] = pd.to_numeric(pd.Series([school.get(field) for school in schools], dtype=object), errors='coerce')
+        frame = pd.DataFrame(data)
+
+        aggregations = {'__count': (list(DIMENSIONS)[0], 'size')}
+        for field in MEASURE_FIELDS:
+            aggregations[f'{field}__sum'] = (field, 'sum')
+            aggregations[f'{field}__n'] = (field, 'count')
+        self.cells = frame.groupby(list(DIMENSIONS), sort=False).agg(**aggregations).reset_index()
+        self.total = len(schools)
+
+    @classmethod
+    def from_cells(cls, cells: pd.DataFrame) -> 'FacetCube':
+        """從已聚合的格子（例如 SQLite 文件中保存的 cells）還原數據立方，不需要學校數據"""
+        cube = cls.__new__(cls)
+        cube.cells = cells
+        cube.total = int(cells['__count'].sum())
+        return cube
+
+    def values(self, dimension: str) -> List[str]:
+        """維度的所有取值（校網按編號，其餘按學校數目降序）"""
+        counts = self.cells.groupby(dimension)['__count'].sum()
+        if dimension == '校網':
+            return sorted(counts.index, key=lambda value: (extract_school_net_number(value), value))
+        return sorted(counts.index, key=lambda value: (value == '-', -counts[value], value))
+
+    def slice(self, selection: Optional[Dict[str, List[str]]] = None) -> pd.DataFrame:
+        """按維度取值切片，返回符合的格子"""
+        cells = self.cells
+        for dimension, values in (selection or {}).items():
+            if values:
+                cells = cells[cells[dimension].isin(values)]
+        return cells
+
+    def pivot(
+        self,
+        rows: str,
+        measure: str = '學校數目',
+        columns: Optional[str] = None,
+        selection: Optional[Dict[str, List[str]]] = None
+    ) -> pd.DataFrame:
+        """透視表
+
+        Args:
+            rows: 行維度
+            measure: 指標（MEASURES 的鍵）
+            columns: 列維度；None 表示只有一列
+            selection: 先按這些維度取值切片（鑽取）
+
+        Returns:
+            行為 rows 的取值、列為 columns 的取值（或指標名稱）的 DataFrame
+        """
+        field, how = MEASURES[measure]
+        keys = [rows] + ([columns] if columns and columns != rows else [])
+        cells = self.slice(selection)
+        if how == 'count':
+            result = cells.groupby(keys)['__count'].sum()
+        else:
+            grouped = cells.groupby(keys)[[f'{field}__sum', f'{field}__n']].sum()
+            result = grouped[f'{field}__sum']
+            if how == 'mean':
+                result = (result / grouped[f'{field}__n'].where(grouped[f'{field}__n'] > 0)).round(1)
+
+        if len(keys) == 2:
+            table = result.unstack(keys[1])
+            if how != 'mean':
+                table = table.fillna(0).astype(int)
+            table = table[[value for value in self.values(keys[1]) if value in table.columns]]
+        else:
+            table = result.to_frame(measure)
+        table = table.loc[[value for value in self.values(rows) if value in table.index]]
+        table.index.name = rows
+        return table
+
+def selection_filters(selection: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """把鑽取的維度取值轉換為學校列表的篩選條件"""
+    filters = {}
+    for dimension, values in selection.items():
+        _, key = DIMENSIONS[dimension]
+        values = [value for value in values if value != '-']
+        if dimension == '校網':
+            # 「11/12」屬於兩個校網
+            values = sorted({net.strip() for value in values for net in value.split('/') if net.strip()})
+        if values:
+            filters[key] = values
+    return filters
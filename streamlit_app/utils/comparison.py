@@ -0,0 +1,131 @@
+
+import io
+from typing import List, Any, Callable, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .fields import COMPARISON_FIELDS
+from .export import has_xlsx_support
+
+# 比較表的欄位（按顯示順序）
+MATRIX_FIELDS = [
+    '區域',
+    '小一學校網',
+    '學校類別1',
+    '學生性別',
+    '宗教',
+    '教學語言',
+    '辦學團體',
+    '學費',
+] + COMPARISON_FIELDS
+
+# 數值欄位的較佳方向：'max' 表示越大越好，'min' 表示越小越好，None 表示不標示
+NUMERIC_DIRECTIONS = {
+    '教師總人數': None,
+    '已接受師資培訓人數百分率': 'max',
+    '學士人數百分率': 'max',
+    '碩士／博士或以上人數百分率': 'max',
+    '特殊教育培訓人數百分率': 'max',
+    '10年年資或以上人數百分率': 'max',
+    '本學年小一班數': None,
+    '本學年總班數': None,
+    '課室數目': 'max',
+    '全年全科測驗次數_一年級': 'min',
+    '全年全科考試次數_一年級': 'min',
+    '全年全科測驗次數_二至六年級': 'min',
+    '全年全科考試次數_二至六年級': 'min',
+}
+
+BEST_STYLE = 'background-color: #d4edda'
+WORST_STYLE = 'background-color: #f8d7da'
+
+def build_comparison_matrix(store, school_ids: List[Any], fields: List[str] = None) -> pd.DataFrame:
+    """從數據存儲中讀取一個投影切片，構建比較表
+
+    Args:
+        store: SchoolStore
+        school_ids: 要比較的學校 ID
+        fields: 比較的欄位，默認為 MATRIX_FIELDS
+
+    Returns:
+        行為欄位、列為學校名稱的 DataFrame
+    """
+    fields = fields or MATRIX_FIELDS
+    columns = store.select(school_ids, ['id', '學校名稱'] + fields)
+    if not columns:
+        return pd.DataFrame()
+
+    # 不在內存中的欄位（如學費）從詳細資料存儲補充
+    missing = [field for field in fields if field not in columns]
+    if missing:
+        details = [store.get_details(school_id) for school_id in columns['id']]
+        for field in missing:
+            columns[field] = [detail.get(field, '-') for detail in details]
+
+    matrix = pd.DataFrame(
+        [columns[field] for field in fields],
+        index=fields,
+        columns=columns['學校名稱'],
+        dtype=object
+    )
+    return matrix
+
+def find_extremes(matrix: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """一次過計算每個數值欄位的最佳及最差值
+
+    Returns:
+        (best, worst) 兩個與 matrix 形狀相同的布爾 DataFrame
+    """
+    best = pd.DataFrame(False, index=matrix.index, columns=matrix.columns)
+    worst = best.copy()
+
+    rows = [field for field in matrix.index if NUMERIC_DIRECTIONS.get(field)]
+    if not rows or matrix.shape[1] < 2:
+        return best, worst
+
+    numeric = matrix.loc[rows].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    # 非數值（如 '-'）不參與比較
+    row_max = np.where(np.isnan(numeric), -np.inf, numeric).max(axis=1, keepdims=True)
+    row_min = np.where(np.isnan(numeric), np.inf, numeric).min(axis=1, keepdims=True)
+    is_max = numeric == row_max
+    is_min = numeric == row_min
+    # 所有學校數值相同（或沒有數值）時不標示
+    varies = (row_max != row_min) & np.isfinite(row_max) & np.isfinite(row_min)
+
+    higher_is_better = np.array([NUMERIC_DIRECTIONS[field] == 'max' for field in rows])[:, None]
+    best.loc[rows] = np.where(higher_is_better, is_max, is_min) & varies
+    worst.loc[rows] = np.where(higher_is_better, is_min, is_max) & varies
+    return best, worst
+
+def differing_rows(matrix: pd.DataFrame) -> pd.DataFrame:
+    """只保留學校之間數值不同的欄位"""
+    if matrix.empty:
+        return matrix
+    values = matrix.astype(str).apply(lambda column: column.str.strip())
+    return matrix[values.nunique(axis=1) > 1]
+
+def style_matrix(matrix: pd.DataFrame, formatter: Callable[[str], str] = None):
+    """標示最佳（綠色）及最差（紅色）的數值
+
+    Args:
+        matrix: build_comparison_matrix 返回的比較表
+        formatter: 顯示時套用在欄位名稱、學校名稱和數值上的轉換（例如繁簡轉換）
+    """
+    best, worst = find_extremes(matrix)
+    styles = pd.DataFrame('', index=matrix.index, columns=matrix.columns)
+    styles = styles.mask(best, BEST_STYLE).mask(worst, WORST_STYLE)
+    styler = matrix.astype(str).style.apply(lambda _: styles, axis=None)
+    if formatter:
+        styler = styler.format(formatter).format_index(formatter, axis=0).format_index(formatter, axis=1)
+    return styler
+
+def matrix_to_csv(matrix: pd.DataFrame) -> bytes:
+    """導出 CSV（帶 BOM，方便 Excel 直接打開中文）"""
+    return matrix.to_csv(index_label='欄位').encode('utf-8-sig')
+
+def matrix_to_xlsx(matrix: pd.DataFrame) -> bytes:
+    """導出 XLSX，需要 openpyxl"""
+    buffer = io.BytesIO()
+    matrix.to_excel(buffer, index_label='欄位', sheet_name='學校比較')
+    return buffer.getvalue()
@@ -1,13 +1,28 @@
-import pandas as pd
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import re
+import sys
+
+# 不重複值佔比不高於此值的欄位視為重複值多的欄位，會做字典編碼
+DICTIONARY_ENCODE_RATIO = 0.5
+
+def load_schools(csv_path: Path, columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """加載並解析 CSV 文件
+    
+    Args:
+        csv_path: CSV 文件路徑
+        columns: 只讀取這些欄位，其餘欄位在讀取時直接跳過；None 表示讀取所有欄位
+    """
+    # pandas 只在解析 CSV 時需要，讀取快照的啟動路徑不會導入
+    import pandas as pd
 
-def load_schools(csv_path: Path) -> List[Dict[str, Any]]:
-    """加載並解析 CSV 文件"""
     try:
         # 讀取 CSV 文件
-        df = pd.read_csv(csv_path, encoding='utf-8')
+        usecols = None
+        if columns is not None:
+            wanted = set(columns) | {'學校名稱'}
+            usecols = lambda column: column in wanted
+        df = pd.read_csv(csv_path, encoding='utf-8', usecols=usecols)
         
         # 清理數據：將 NaN 和空值轉換為 '-'
         df = df.fillna('-')
@@ -18,8 +33,8 @@ def load_schools(csv_path: Path) -> List[Dict[str, Any]]:
         
         # 清理和處理數據
         for i, school in enumerate(schools):
-            # 添加 ID
-            school['id'] = str(i + 1)
+            # 添加 ID（整數）
+            school['id'] = i + 1
             
             # 清理所有字段：去除 HTML 標籤
             for key, value in school.items():
@@ -45,10 +60,60 @@ def load_schools(csv_path: Path) -> List[Dict[str, Any]]:
             if school.get('學校名稱') and str(school.get('學校名稱')).strip() != '' and str(school.get('學校名稱')).strip() != '-'
         ]
         
+        _dictionary_encode(valid_schools)
+        
         return valid_schools
         
     except Exception as e:
         print(f"Error loading CSV: {e}")
         return []
 
+def _dictionary_encode(schools: List[Dict[str, Any]]):
+    """對重複值多的欄位做字典編碼
+
+    同一欄位中相同的值改為共用同一個對象，字符串另外做 intern，
+    讓 '-'、'是'、區域名稱等在不同欄位之間也只保存一份。
+    """
+    if not schools:
+        return
+    
+    for key in schools[0]:
+        if key == 'id':
+            continue
+        dictionary = {}
+        for school in schools:
+            value = school.get(key)
+            if isinstance(value, str):
+                value = sys.intern(value)
+            dictionary.setdefault((type(value), value), value)
+        
+        if len(dictionary) > len(schools) * DICTIONARY_ENCODE_RATIO:
+            continue
+        
+        for school in schools:
+            value = school.get(key)
+            school[key] = dictionary[(type(value), value)]
+
+def column_memory_usage(schools: List[Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
+    """統計每個欄位的內存佔用
+
+    共用的對象在同一欄位內只計算一次。
+
+    Returns:
+        欄位 -> {'bytes': 佔用字節數, 'cells': 單元格數, 'distinct': 不重複對象數}
+    """
+    usage = {}
+    for school in schools:
+        for key, value in school.items():
+            column = usage.setdefault(key, {'bytes': 0, 'cells': 0, 'objects': set()})
+            column['cells'] += 1
+            if id(value) not in column['objects']:
+                column['objects'].add(id(value))
+                column['bytes'] += sys.getsizeof(value)
+    
+    return {
+        key: {'bytes': column['bytes'], 'cells': column['cells'], 'distinct': len(column['objects'])}
+        for key, column in usage.items()
+    }
+
 
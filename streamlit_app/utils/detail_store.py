@@ -0,0 +1,107 @@
+
+import json
+import mmap
+import struct
+import zlib
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+# 文件格式：魔數 + 索引長度 + JSON 索引 + 每所學校壓縮後的 JSON 記錄
+# 索引為 {'fields': [欄位], 'records': {id: [偏移, 長度]}}
+MAGIC = b'SSDS1'
+HEADER = struct.Struct('<5sI')
+
+class DetailStore:
+    """按學校 ID 讀取詳細資料的壓縮存儲
+
+    每所學校的詳細欄位單獨壓縮後寫入同一個文件，讀取時通過內存映射
+    只解壓所需學校的記錄，不需要把所有學校的詳細資料留在內存中。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, index_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a detail store file: {self.path}")
+        index_start = HEADER.size
+        self._data_start = index_start + index_length
+        index = json.loads(self._mmap[index_start:self._data_start].decode('utf-8'))
+        self.fields: List[str] = index['fields']
+        self._index = {int(key): tuple(value) for key, value in index['records'].items()}
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, school_id: Any) -> bool:
+        return int(school_id) in self._index
+
+    def get(self, school_id: Any) -> Dict[str, Any]:
+        """讀取一所學校的詳細資料，找不到時返回空字典"""
+        entry = self._index.get(int(school_id))
+        if entry is None:
+            return {}
+        offset, length = entry
+        start = self._data_start + offset
+        return json.loads(zlib.decompress(self._mmap[start:start + length]).decode('utf-8'))
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+def build_detail_store(path: Path, schools: List[Dict[str, Any]], fields: List[str]) -> DetailStore:
+    """把學校的詳細欄位寫入壓縮存儲文件
+
+    Args:
+        path: 輸出文件路徑
+        schools: 學校列表（需包含 'id'）
+        fields: 要寫入的欄位
+
+    Returns:
+        打開的 DetailStore
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    index = {}
+    blobs = []
+    offset = 0
+    for school in schools:
+        record = {field: school[field] for field in fields if field in school}
+        blob = zlib.compress(json.dumps(record, ensure_ascii=False).encode('utf-8'))
+        index[str(school['id'])] = [offset, len(blob)]
+        blobs.append(blob)
+        offset += len(blob)
+
+    index_bytes = json.dumps({'fields': fields, 'records': index}, ensure_ascii=False).encode('utf-8')
+    # 先寫臨時文件再替換，避免其他進程讀到寫了一半的文件
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(index_bytes)))
+        f.write(index_bytes)
+        for blob in blobs:
+            f.write(blob)
+    tmp_path.replace(path)
+
+    return DetailStore(path)
+
+def open_detail_store(path: Path, fields: List[str], source: Optional[Path] = None) -> Optional[DetailStore]:
+    """打開已有的詳細資料存儲
+
+    如果文件不存在、格式不對、欄位不同或比來源 CSV 舊，返回 None。
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    if source is not None and Path(source).stat().st_mtime > path.stat().st_mtime:
+        return None
+    try:
+        store = DetailStore(path)
+    except (ValueError, KeyError, struct.error, json.JSONDecodeError):
+        return None
+    if store.fields != list(fields):
+        store.close()
+        return None
+    return store
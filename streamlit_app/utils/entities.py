@@ -0,0 +1,157 @@
+
+import re
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+
+# 同一實體的其他寫法 -> 規範名稱（規範化後仍然不同的寫法才需要列出）
+ALIASES = {
+    '天主教': '天主教香港教區',
+    '香港天主教教區': '天主教香港教區',
+    '基督教靈糧世界佈道會香港靈糧堂堂務委員會': '基督教靈糧世界佈道會香港靈糧堂',
+}
+
+# 關聯中學欄位：關聯類型 -> 欄位
+LINK_FIELDS = {
+    '一條龍': '一條龍中學',
+    '直屬': '直屬中學',
+    '聯繫': '聯繫中學',
+}
+
+EMPTY_VALUES = ['-', '', '—', '－', '/']
+
+# 括號統一為全形
+BRACKETS = str.maketrans({'(': '（', ')': '）', '﹝': '（', '﹞': '）', '〔': '（', '〕': '）'})
+
+# 只在比較時統一的異體字（顯示時保留數據中最常見的寫法）
+VARIANT_CHARACTERS = str.maketrans({'衞': '衛', '蕫': '董', '舘': '館'})
+
+def clean_name(text: Any) -> str:
+    """去除 HTML 標籤及實體、多餘空白，統一括號"""
+    text = re.sub(r'<[^>]+>', '', str(text or ''))
+    text = re.sub(r'&nbsp;|&#160;', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.translate(BRACKETS)
+
+def split_names(value: Any) -> List[str]:
+    """把「甲、乙,丙」拆成多個名稱（<br> 只是換行，不是分隔符）"""
+    names = [clean_name(part) for part in re.split(r'[,，、]', re.sub(r'<[^>]+>', '', str(value or '')))]
+    return [name for name in names if name not in EMPTY_VALUES]
+
+def base_key(name: str) -> str:
+    """不查別名表的規範鍵（規範名稱本身的鍵）"""
+    key = clean_name(name).translate(VARIANT_CHARACTERS).lower()
+    key = re.sub(r'（?有限公司）?$', '', key)
+    key = re.sub(r'^(香港|hk\s|hong kong\s)', '', key)
+    return re.sub(r'\s+', '', key)
+
+_ALIAS_KEYS = {base_key(alias): base_key(name) for alias, name in ALIASES.items()}
+
+def entity_key(name: Any) -> str:
+    """比較用的規範鍵：忽略括號寫法、有限公司後綴、香港前綴及異體字，再按別名表合併"""
+    key = base_key(name)
+    return _ALIAS_KEYS.get(key, key)
+
+class EntityTable:
+    """實體表：同一實體的不同寫法對應同一個整數 ID"""
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._forms: List[Counter] = []
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, name: str) -> Optional[int]:
+        """加入一個名稱，返回其實體 ID"""
+        key = entity_key(name)
+        if not key:
+            return None
+        entity_id = self._ids.get(key)
+        if entity_id is None:
+            entity_id = len(self.keys)
+            self._ids[key] = entity_id
+            self.keys.append(key)
+            self._forms.append(Counter())
+        self._forms[entity_id][clean_name(name)] += 1
+        return entity_id
+
+    def lookup(self, name: str) -> Optional[int]:
+        """名稱（任何寫法）對應的實體 ID；未知名稱返回 None"""
+        return self._ids.get(entity_key(name))
+
+    def name(self, entity_id: int) -> str:
+        """顯示名稱：別名表中的規範名稱優先，其次為數據中最常見的寫法（同樣常見時取較完整的）"""
+        forms = self._forms[entity_id]
+        key = self.keys[entity_id]
+        return max(forms, key=lambda form: (base_key(form) == key, forms[form], len(form), form))
+
+    def count(self, entity_id: int) -> int:
+        return sum(self._forms[entity_id].values())
+
+    def options(self) -> List[str]:
+        """所有實體的顯示名稱，按出現次數降序、名稱排序"""
+        order = sorted(range(len(self.keys)), key=lambda i: (-self.count(i), self.name(i)))
+        return [self.name(i) for i in order]
+
+class EntityIndex:
+    """每所學校的辦學團體及關聯中學實體 ID（每個數據集計算一次）
+
+    加載時把自由文本拆分並規範化為整數 ID，篩選時只比較 ID，
+    不需要每次重新拆分字符串。
+    """
+
+    def __init__(self, schools: List[Dict[str, Any]]):
+        self.sponsors = EntityTable()
+        self.secondaries = EntityTable()
+        self.positions = {school.get('id'): i for i, school in enumerate(schools)}
+        self.sponsor_ids: List[Tuple[int, ...]] = []
+        self.link_ids: Dict[str, List[Tuple[int, ...]]] = {kind: [] for kind in LINK_FIELDS}
+        for school in schools:
+            self.sponsor_ids.append(self._add(self.sponsors, school.get('辦學團體')))
+            for kind, field in LINK_FIELDS.items():
+                self.link_ids[kind].append(self._add(self.secondaries, school.get(field)))
+
+    @staticmethod
+    def _add(table: EntityTable, value: Any) -> Tuple[int, ...]:
+        ids = []
+        for name in split_names(value):
+            entity_id = table.add(name)
+            if entity_id is not None and entity_id not in ids:
+                ids.append(entity_id)
+        return tuple(ids)
+
+    @staticmethod
+    def _lookup(table: EntityTable, value: Any) -> Tuple[int, ...]:
+        ids = (table.lookup(name) for name in split_names(value))
+        return tuple(entity_id for entity_id in ids if entity_id is not None)
+
+    def school_sponsors(self, school: Dict[str, Any]) -> Tuple[int, ...]:
+        position = self.positions.get(school.get('id'))
+        if position is not None:
+            return self.sponsor_ids[position]
+        return self._lookup(self.sponsors, school.get('辦學團體'))
+
+    def school_links(self, school: Dict[str, Any], kind: str) -> Tuple[int, ...]:
+        position = self.positions.get(school.get('id'))
+        if position is not None:
+            return self.link_ids[kind][position]
+        return self._lookup(self.secondaries, school.get(LINK_FIELDS[kind]))
+
+    def filter_sponsors(self, schools: List[Dict[str, Any]], names: List[str]) -> List[Dict[str, Any]]:
+        """保留屬於任何一個辦學團體的學校"""
+        wanted = {self.sponsors.lookup(name) for name in names} - {None}
+        return [school for school in schools if wanted.intersection(self.school_sponsors(school))]
+
+    def filter_link_kinds(self, schools: List[Dict[str, Any]], kinds: List[str]) -> List[Dict[str, Any]]:
+        """保留有任何一種關聯中學（一條龍 / 直屬 / 聯繫）的學校"""
+        kinds = [kind for kind in kinds if kind in LINK_FIELDS]
+        return [school for school in schools if any(self.school_links(school, kind) for kind in kinds)]
+
+    def filter_secondaries(self, schools: List[Dict[str, Any]], names: List[str]) -> List[Dict[str, Any]]:
+        """保留與任何一所指定中學有一條龍、直屬或聯繫關係的學校"""
+        wanted = {self.secondaries.lookup(name) for name in names} - {None}
+        return [
+            school for school in schools
+            if any(wanted.intersection(self.school_links(school, kind)) for kind in LINK_FIELDS)
+        ]
@@ -0,0 +1,270 @@
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from .csv_parser import load_schools
+from .fields import SEARCH_FIELDS, SCOPED_SEARCH_FIELDS, SEARCH_FIELD_ALIASES, LOADED_FIELDS
+from .filters import apply_filters, get_filter_options
+from .feature_query import FeatureIndex
+from .tags import POPULAR_TAGS, TagIndex, tag_keywords
+from .flags import FLAG_FILTERS, FlagIndex
+from .geo import GeoIndex, place_names
+from .entities import ALIASES, EntityIndex
+from .sorting import sort_schools
+from .sqlite_store import build_sqlite_store
+from .reference import reference_apply_filters, reference_get_filter_options, reference_sort_schools
+
+# 差異測試：隨機生成篩選條件，比較優化後的引擎（預建索引的 apply_filters、SQLite 存儲）
+# 與 utils.reference 的參考實現返回的學校 ID 列表，並按查詢類別統計速度倍數。
+
+QUERY_CLASSES = ['facet', 'name', 'feature', 'tags', 'flags', 'geo', 'mixed']
+
+# 多值篩選：篩選鍵 -> 篩選選項中的鍵
+FACET_KEYS = ['區域', '校網', '辦學團體', '資助類型', '學生性別', '宗教', '教學語言', '關聯中學']
+
+# 不在數據中的值，確保未知選項的處理一致
+UNKNOWN_VALUE = '不存在的選項'
+
+def scale_schools(schools: List[Dict[str, Any]], factor: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """生成放大 factor 倍的合成數據集
+
+    第一份為原始數據；其餘每份的每個欄位各自從隨機一所學校抽取，
+    保持每個欄位的取值分佈，但組合與原始數據不同。學校 ID 按次序重新編號。
+    """
+    rng = random.Random(seed)
+    fields = list(dict.fromkeys(field for school in schools for field in school))
+    scaled = [dict(school) for school in schools]
+    for copy in range(1, factor):
+        for school in schools:
+            record = {field: rng.choice(schools).get(field, '-') for field in fields}
+            record['學校名稱'] = f"{school.get('學校名稱', '')}（{copy}）"
+            scaled.append(record)
+    for i, school in enumerate(scaled):
+        school['id'] = i + 1
+    return scaled
+
+def _sample(rng: random.Random, values: List[str], most: int = 3) -> List[str]:
+    return rng.sample(values, min(len(values), rng.randint(1, most)))
+
+def _substring(rng: random.Random, text: str, longest: int = 4) -> str:
+    if not text:
+        return ''
+    length = rng.randint(1, min(longest, len(text)))
+    start = rng.randrange(len(text) - length + 1)
+    return text[start:start + length]
+
+def _random_term(rng: random.Random, schools: List[Dict[str, Any]]) -> str:
+    """查詢語法中的一個詞：特色文本片段、標籤關鍵詞或英文詞，可帶欄位前綴或引號"""
+    choice = rng.random()
+    if choice < 0.5:
+        field = rng.choice(SEARCH_FIELDS + SCOPED_SEARCH_FIELDS)
+        text = _substring(rng, str(rng.choice(schools).get(field, '')), 5).replace('"', '')
+    elif choice < 0.8:
+        text = rng.choice(tag_keywords(rng.choice(POPULAR_TAGS)))
+    else:
+        text = rng.choice(['STEM', 'steam', 'AI', 'English', 'e-learning', 'x'])
+    text = text.strip() or '學'
+    if ' ' in text or rng.random() < 0.1:
+        text = f'"{text}"'
+    if rng.random() < 0.2:
+        prefix = rng.choice(list(SEARCH_FIELD_ALIASES) + SEARCH_FIELDS[:3] + ['未知欄位'])
+        text = f"{prefix}{rng.choice([':', '：'])}{text}"
+    return text
+
+def _random_query(rng: random.Random, schools: List[Dict[str, Any]], depth: int = 2) -> str:
+    """隨機查詢語法：AND / OR / NOT、括號、相鄰詞，偶爾為語法錯誤的查詢"""
+    if depth == 0 or rng.random() < 0.35:
+        return _random_term(rng, schools)
+    left = _random_query(rng, schools, depth - 1)
+    right = _random_query(rng, schools, depth - 1)
+    form = rng.choice(['AND', 'OR', 'NOT', ' ', 'paren', 'broken'])
+    if form == 'NOT':
+        return f"{left} NOT {right}"
+    if form == 'paren':
+        return f"({left} OR {right})"
+    if form == 'broken':
+        return rng.choice([f"({left} AND {right}", f"{left} OR", f"NOT", f"{left} ) {right}"])
+    return f"{left} {form} {right}".replace('  ', ' ')
+
+def random_filters(
+    rng: random.Random,
+    query_class: str,
+    schools: List[Dict[str, Any]],
+    options: Dict[str, List[str]]
+) -> Dict[str, Any]:
+    """按查詢類別隨機生成一組篩選條件"""
+    filters: Dict[str, Any] = {}
+    classes = [query_class]
+    if query_class == 'mixed':
+        classes = rng.sample(QUERY_CLASSES[:-1], rng.randint(2, 4))
+
+    for kind in classes:
+        if kind == 'facet':
+            for key in rng.sample(FACET_KEYS + ['關聯學校'], rng.randint(1, 3)):
+                if key == '關聯學校':
+                    filters[key] = _sample(rng, ['一條龍', '直屬', '聯繫', UNKNOWN_VALUE], 2)
+                    continue
+                values = _sample(rng, options[key] or [UNKNOWN_VALUE])
+                if rng.random() < 0.1:
+                    values.append(UNKNOWN_VALUE)
+                if key == '辦學團體' and rng.random() < 0.3:
+                    values.append(rng.choice(list(ALIASES)))
+                filters[key] = values
+        elif kind == 'name':
+            name = str(rng.choice(schools).get('學校名稱', ''))
+            query = _substring(rng, name)
+            if rng.random() < 0.2:
+                query = rng.choice(['ST', ' 聖 ', 'a', '小學', UNKNOWN_VALUE])
+            filters['search_query'] = query
+        elif kind == 'feature':
+            filters['feature_search_query'] = _random_query(rng, schools)
+        elif kind == 'tags':
+            filters['feature_tags'] = _sample(rng, POPULAR_TAGS + ['閱讀', '機械人'], 3)
+        elif kind == 'flags':
+            key = rng.choice(list(FLAG_FILTERS))
+            filters[key] = _sample(rng, FLAG_FILTERS[key] + [UNKNOWN_VALUE], 3)
+        elif kind == 'geo':
+            filters['附近地點'] = rng.choice(place_names() + [UNKNOWN_VALUE])
+            filters['距離'] = rng.choice([0, 0.5, 1, 2, 5])
+            filters['最近數目'] = rng.choice([0, 0, 1, 5, 20])
+            if not filters['距離'] and not filters['最近數目']:
+                filters['距離'] = 3
+    return filters
+
+def _ids(schools: List[Dict[str, Any]]) -> List[Any]:
+    return [school.get('id') for school in schools]
+
+def compare_engines(
+    schools: List[Dict[str, Any]],
+    cases: int = 50,
+    seed: int = 0,
+    sqlite: bool = True
+) -> Dict[str, Any]:
+    """在一個數據集上比較各引擎與參考實現
+
+    Args:
+        schools: 數據集（需包含 'id' 及 LOADED_FIELDS）
+        cases: 每個查詢類別的隨機篩選條件數目
+        seed: 隨機種子（出錯時用於重現）
+        sqlite: 是否一併比較 SQLite 存儲
+
+    Returns:
+        {'schools', 'build', 'classes': {類別: {'queries', 'reference', 'indexed', 'sqlite'}}, 'mismatches'}
+        時間為秒；mismatches 為 [(引擎, 篩選條件), ...]
+    """
+    rng = random.Random(seed)
+    mismatches = []
+
+    started = time.perf_counter()
+    indexes = {
+        'index': FeatureIndex(schools),
+        'tag_index': TagIndex(schools, POPULAR_TAGS),
+        'flag_index': FlagIndex(schools),
+        'geo_index': GeoIndex(schools),
+        'entity_index': EntityIndex(schools),
+    }
+    build = {'indexed': time.perf_counter() - started}
+
+    # 篩選選項及排序
+    options = get_filter_options(schools, entity_index=indexes['entity_index'])
+    if options != reference_get_filter_options(schools):
+        mismatches.append(('get_filter_options', {}))
+    shuffled = list(schools)
+    rng.shuffle(shuffled)
+    if _ids(sort_schools(shuffled)) != _ids(reference_sort_schools(shuffled)):
+        mismatches.append(('sort_schools', {}))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = None
+        if sqlite:
+            started = time.perf_counter()
+            store = build_sqlite_store(Path(tmp_dir) / "schools.sqlite", schools, LOADED_FIELDS)
+            build['sqlite'] = time.perf_counter() - started
+
+        classes = {}
+        for query_class in QUERY_CLASSES:
+            timing = {'queries': cases, 'reference': 0.0, 'indexed': 0.0, 'sqlite': 0.0}
+            for _ in range(cases):
+                filters = random_filters(rng, query_class, schools, options)
+
+                started = time.perf_counter()
+                filtered = reference_apply_filters(schools, filters)
+                expected = _ids(reference_sort_schools(filtered))
+                timing['reference'] += time.perf_counter() - started
+
+                started = time.perf_counter()
+                indexed = apply_filters(schools, filters, **indexes)
+                actual = _ids(sort_schools(indexed))
+                timing['indexed'] += time.perf_counter() - started
+                # 篩選本身須保持原有次序
+                if _ids(indexed) != _ids(filtered) or actual != expected:
+                    mismatches.append(('indexed', filters))
+
+                if store is not None:
+                    started = time.perf_counter()
+                    actual = _ids(store.apply_filters(filters, ['id']))
+                    timing['sqlite'] += time.perf_counter() - started
+                    if actual != expected:
+                        mismatches.append(('sqlite', filters))
+            classes[query_class] = timing
+        if store is not None:
+            store.close()
+
+    return {'schools': len(schools), 'build': build, 'classes': classes, 'mismatches': mismatches}
+
+def run_suite(
+    schools: List[Dict[str, Any]],
+    cases: int = 50,
+    scales: List[int] = (1, 4),
+    seed: int = 0,
+    sqlite: bool = True
+) -> List[Dict[str, Any]]:
+    """在原始數據及每個放大倍數的合成數據上運行 compare_engines"""
+    return [
+        compare_engines(scale_schools(schools, factor, seed + factor), cases, seed + factor, sqlite)
+        for factor in scales
+    ]
+
+def format_report(report: Dict[str, Any]) -> str:
+    """每個查詢類別的平均時間及相對參考實現的速度倍數"""
+    def ratio(reference: float, engine: float) -> str:
+        return f"{reference / engine:7.1f}x" if engine else '      -'
+
+    lines = [f"{report['schools']} 所學校（建立索引 {report['build']['indexed'] * 1000:.0f} ms"
+             + (f"，SQLite {report['build']['sqlite'] * 1000:.0f} ms" if 'sqlite' in report['build'] else '') + "）",
+             f"  {'類別':<8}{'參考 ms':>9}{'索引 ms':>9}{'倍數':>8}{'SQLite ms':>11}{'倍數':>8}"]
+    for query_class, timing in report['classes'].items():
+        count = timing['queries'] or 1
+        reference, indexed, sqlite = (timing[key] / count * 1000 for key in ('reference', 'indexed', 'sqlite'))
+        lines.append(
+            f"  {query_class:<10}{reference:9.2f}{indexed:9.2f}{ratio(reference, indexed)}"
+            f"{sqlite:11.2f}{ratio(reference, sqlite)}"
+        )
+    return '\n'.join(lines)
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='隨機篩選條件的差異測試：優化引擎與參考實現的結果須完全一致')
+    parser.add_argument('csv', type=Path, help='學校資料 CSV 文件')
+    parser.add_argument('--cases', type=int, default=50, help='每個查詢類別的篩選條件數目')
+    parser.add_argument('--scale', type=int, action='append', help='合成數據的放大倍數，可重複（默認 1 及 4）')
+    parser.add_argument('--seed', type=int, default=0, help='隨機種子')
+    parser.add_argument('--no-sqlite', action='store_true', help='不比較 SQLite 存儲')
+    args = parser.parse_args(argv)
+
+    schools = load_schools(args.csv, LOADED_FIELDS)
+    reports = run_suite(schools, args.cases, args.scale or [1, 4], args.seed, not args.no_sqlite)
+    failed = False
+    for report in reports:
+        print(format_report(report))
+        for engine, filters in report['mismatches'][:10]:
+            print(f"  [不一致] {engine}: {filters}")
+        failed = failed or bool(report['mismatches'])
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
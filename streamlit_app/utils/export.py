@@ -0,0 +1,151 @@
+
+import csv
+import importlib.util
+import io
+import json
+from typing import List, Dict, Any, Iterable, Iterator, BinaryIO, Callable
+
+from .i18n import convert_text, localize
+from .store import SchoolStore
+
+# 每次從存儲投影讀取及轉換字體的學校數目
+BATCH_SIZE = 200
+
+# 簡體轉換時把一批單元格連接成一個字符串一次轉換；OpenCC 不會改動這個控制字符
+CELL_SEPARATOR = '\x1f'
+
+def has_xlsx_support() -> bool:
+    """是否已安裝導出 XLSX 所需的 openpyxl"""
+    return importlib.util.find_spec('openpyxl') is not None
+
+def iter_rows(
+    store: SchoolStore,
+    school_ids: List[Any],
+    fields: List[str],
+    batch_size: int = BATCH_SIZE
+) -> Iterator[List[Any]]:
+    """按批從存儲讀取指定學校的指定欄位，逐行產生 [值, ...]
+
+    常駐內存的欄位按列投影讀取，詳細資料欄位只在選擇了時才逐所學校讀取，
+    不會還原包含所有欄位的學校字典。不在存儲中的學校 ID 會被跳過。
+    """
+    for start in range(0, len(school_ids), batch_size):
+        columns = store.select(school_ids[start:start + batch_size], list(fields) + ['id'])
+        for row, school_id in enumerate(columns.get('id', [])):
+            details = None
+            values = []
+            for field in fields:
+                if field in columns:
+                    values.append(columns[field][row])
+                    continue
+                if details is None:
+                    details = store.get_details(school_id) or {}
+                values.append(details.get(field, '-'))
+            yield values
+
+def _convert_batch(rows: List[List[Any]], lang: str) -> List[List[Any]]:
+    """一批行的文字單元格連接後一次轉換，數值保持不變"""
+    cells = [(i, j) for i, row in enumerate(rows) for j, value in enumerate(row) if isinstance(value, str)]
+    if not cells:
+        return rows
+    joined = CELL_SEPARATOR.join(rows[i][j] for i, j in cells)
+    converted = convert_text(joined, lang).split(CELL_SEPARATOR)
+    if len(converted) != len(cells):
+        # 原文本本身含有分隔符時逐個轉換
+        converted = [convert_text(rows[i][j], lang) for i, j in cells]
+    rows = [list(row) for row in rows]
+    for (i, j), value in zip(cells, converted):
+        rows[i][j] = value
+    return rows
+
+def localize_rows(rows: Iterable[List[Any]], lang: str, batch_size: int = BATCH_SIZE) -> Iterator[List[Any]]:
+    """逐批轉換字體；繁體直接返回原行（數據本身為繁體）"""
+    if lang == 'tc':
+        yield from rows
+        return
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield from _convert_batch(batch, lang)
+            batch = []
+    if batch:
+        yield from _convert_batch(batch, lang)
+
+def write_csv(header: List[str], rows: Iterable[List[Any]], buffer: BinaryIO):
+    """寫入 CSV（帶 BOM，方便 Excel 直接打開中文）"""
+    text = io.TextIOWrapper(buffer, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+    text.flush()
+    text.detach()
+
+def write_json(header: List[str], rows: Iterable[List[Any]], buffer: BinaryIO):
+    """寫入 JSON 數組，每所學校一個對象，逐行寫出"""
+    text = io.TextIOWrapper(buffer, encoding='utf-8')
+    text.write('[')
+    for i, row in enumerate(rows):
+        text.write(',\n' if i else '\n')
+        text.write(json.dumps(dict(zip(header, row)), ensure_ascii=False))
+    text.write('\n]\n')
+    text.flush()
+    text.detach()
+
+def write_xlsx(header: List[str], rows: Iterable[List[Any]], buffer: BinaryIO):
+    """寫入 XLSX（openpyxl 的只寫模式，逐行寫出），需要 openpyxl"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('學校')
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(buffer)
+
+# 導出格式：格式 -> (寫入函數, 擴展名, MIME 類型)
+EXPORT_FORMATS: Dict[str, tuple] = {
+    'CSV': (write_csv, 'csv', 'text/csv'),
+    'XLSX': (write_xlsx, 'xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'JSON': (write_json, 'json', 'application/json'),
+}
+
+def available_formats() -> List[str]:
+    """可用的導出格式（未安裝 openpyxl 時沒有 XLSX）"""
+    return [name for name in EXPORT_FORMATS if name != 'XLSX' or has_xlsx_support()]
+
+def export_schools(
+    store: SchoolStore,
+    school_ids: List[Any],
+    fields: List[str],
+    export_format: str = 'CSV',
+    lang: str = 'tc'
+) -> io.BytesIO:
+    """把指定學校的指定欄位導出為 CSV / XLSX / JSON
+
+    行從存儲逐批投影讀取、逐批轉換字體，直接寫入輸出緩衝區，
+    內存中只有輸出文件本身及一批行。
+
+    Returns:
+        已回到開頭的輸出緩衝區
+    """
+    writer = EXPORT_FORMATS[export_format][0]
+    header = [localize(field, lang) for field in fields]
+    rows = localize_rows(iter_rows(store, school_ids, fields), lang)
+    buffer = io.BytesIO()
+    writer(header, rows, buffer)
+    buffer.seek(0)
+    return buffer
+
+def deferred_export(
+    store: SchoolStore,
+    school_ids: List[Any],
+    fields: List[str],
+    export_format: str = 'CSV',
+    lang: str = 'tc'
+) -> Callable[[], io.BytesIO]:
+    """按下下載按鈕時才生成文件的回調（st.download_button 的 data 參數）"""
+    school_ids = list(school_ids)
+    fields = list(fields)
+    return lambda: export_schools(store, school_ids, fields, export_format, lang)
@@ -0,0 +1,248 @@
+
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from .csv_parser import load_schools
+from .store import record_hash
+
+# 設施卡片使用的欄位，任何一個改變都會重新生成卡片
+CARD_FIELDS = [
+    '學校名稱',
+    '學校類別1',
+    '區域',
+    '宗教',
+    '小一學校網',
+    '課室數目',
+    '禮堂數目',
+    '操場數目',
+    '圖書館數目',
+    '特別室',
+    '其他學校設施',
+    '支援有特殊教育需要學生的設施',
+]
+
+# 卡片版面改動時遞增，令所有卡片重新生成
+CARD_VERSION = 1
+
+# 常見的中文字體位置（Windows / macOS / Linux）
+FONT_CANDIDATES = [
+    'C:/Windows/Fonts/msjh.ttc',
+    'C:/Windows/Fonts/mingliu.ttc',
+    '/System/Library/Fonts/PingFang.ttc',
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
+]
+
+WIDTH = 1280
+MARGIN = 48
+TEXT_COLOR = (38, 39, 48)
+LABEL_COLOR = (90, 90, 100)
+LINE_COLOR = (226, 226, 230)
+CHIP_BORDER = (210, 210, 216)
+CHIP_FILL = (236, 236, 240)
+EMPTY_VALUES = ['-', '', '—', '－']
+
+def find_font() -> Optional[str]:
+    """查找系統中可用的中文字體"""
+    for candidate in FONT_CANDIDATES:
+        if Path(candidate).exists():
+            return candidate
+    return None
+
+@lru_cache(maxsize=None)
+def _load_font(font_path: Optional[str], size: int):
+    """加載字體（每個進程按大小緩存）"""
+    if font_path:
+        return ImageFont.truetype(font_path, size)
+    return ImageFont.load_default(size)
+
+def card_path(school: Dict[str, Any], cache_dir: Path) -> Path:
+    """學校設施卡片的緩存路徑（按卡片內容的哈希命名）"""
+    return Path(cache_dir) / f"{record_hash(school, CARD_FIELDS, salt=CARD_VERSION)}.png"
+
+def _wrap(text: str, font, max_width: int) -> List[str]:
+    """按字符寬度換行（中文沒有空格可斷行）"""
+    lines = []
+    line = ''
+    for char in text:
+        if font.getlength(line + char) > max_width and line:
+            lines.append(line)
+            line = char
+        else:
+            line += char
+    if line:
+        lines.append(line)
+    return lines
+
+def _split_items(text: str) -> List[str]:
+    """把「音樂室、視藝室。」拆成獨立項目"""
+    items = [item.strip().rstrip('。；;') for item in str(text).replace('；', '、').split('、')]
+    return [item for item in items if item and item not in EMPTY_VALUES]
+
+def _chip_rows(items: List[str], font, max_width: int) -> List[List[Tuple[str, int]]]:
+    """把標籤排成多行，返回每行的 (文字, 寬度)"""
+    rows = [[]]
+    row_width = 0
+    for item in items:
+        width = int(font.getlength(item)) + 24
+        if row_width + width > max_width and rows[-1]:
+            rows.append([])
+            row_width = 0
+        rows[-1].append((item, width))
+        row_width += width + 8
+    return rows if rows[0] else []
+
+def render_facility_card(school: Dict[str, Any], font_path: Optional[str] = None) -> Image.Image:
+    """生成一所學校的設施卡片"""
+    title_font = _load_font(font_path, 34)
+    label_font = _load_font(font_path, 18)
+    text_font = _load_font(font_path, 20)
+    chip_font = _load_font(font_path, 17)
+    content_width = WIDTH - MARGIN * 2
+
+    # 先計算版面，再按實際高度繪製
+    blocks = []
+    for field in ['課室數目', '禮堂數目', '操場數目', '圖書館數目']:
+        blocks.append(('text', field, _wrap(str(school.get(field, '-')), text_font, content_width)))
+    blocks.append(('chips', '特別室', _chip_rows(_split_items(school.get('特別室', '-')), chip_font, content_width)))
+    for field in ['其他學校設施', '支援有特殊教育需要學生的設施']:
+        blocks.append(('text', field, _wrap(str(school.get(field, '-')), text_font, content_width)))
+
+    height = 150
+    for kind, _, lines in blocks:
+        line_height = 40 if kind == 'chips' else 30
+        height += 34 + max(len(lines), 1) * line_height + 24
+
+    image = Image.new('RGB', (WIDTH, height), 'white')
+    draw = ImageDraw.Draw(image)
+
+    # 標題及標籤
+    draw.text((MARGIN, 28), str(school.get('學校名稱', '')), font=title_font, fill=TEXT_COLOR)
+    net = str(school.get('小一學校網', '-'))
+    tags = [str(school.get('學校類別1', '-')), str(school.get('區域', '-')), str(school.get('宗教', '-'))]
+    if net not in EMPTY_VALUES and net != '/':
+        tags.append(f'校網 {net}')
+    x = MARGIN
+    for tag in tags:
+        width = int(chip_font.getlength(tag)) + 24
+        draw.rounded_rectangle((x, 84, x + width, 112), radius=8, outline=CHIP_BORDER, fill=CHIP_FILL)
+        draw.text((x + 12, 88), tag, font=chip_font, fill=TEXT_COLOR)
+        x += width + 8
+    draw.line((0, 132, WIDTH, 132), fill=LINE_COLOR, width=1)
+
+    y = 150
+    for kind, label, lines in blocks:
+        draw.text((MARGIN, y), label, font=label_font, fill=LABEL_COLOR)
+        y += 34
+        if kind == 'chips':
+            for row in lines or [[('-', 0)]]:
+                x = MARGIN
+                for item, width in row:
+                    if width:
+                        draw.rounded_rectangle((x, y, x + width, y + 30), radius=8, outline=CHIP_BORDER, fill='white')
+                        draw.text((x + 12, y + 5), item, font=chip_font, fill=TEXT_COLOR)
+                    else:
+                        draw.text((x, y), item, font=text_font, fill=TEXT_COLOR)
+                    x += width + 8
+                y += 40
+        else:
+            for line in lines or ['-']:
+                draw.text((MARGIN, y), line, font=text_font, fill=TEXT_COLOR)
+                y += 30
+        y += 12
+        draw.line((MARGIN, y, WIDTH - MARGIN, y), fill=LINE_COLOR, width=1)
+        y += 12
+
+    return image
+
+def _render_to_file(job: Tuple[Dict[str, Any], str, Optional[str]]) -> str:
+    """進程池任務：生成卡片並寫入緩存"""
+    school, path, font_path = job
+    path = Path(path)
+    tmp_path = path.with_suffix('.tmp.png')
+    render_facility_card(school, font_path).save(tmp_path)
+    tmp_path.replace(path)
+    return str(path)
+
+def render_all(
+    schools: List[Dict[str, Any]],
+    cache_dir: Path,
+    font_path: Optional[str] = None,
+    workers: Optional[int] = None,
+    force: bool = False
+) -> Dict[str, int]:
+    """批量生成設施卡片
+
+    卡片以內容哈希命名，來源欄位未改變的學校會直接跳過。
+    生成後刪除目錄中不屬於這些學校當前內容的卡片（已改變或已刪除的學校的舊卡片），
+    因此 schools 應為目錄對應的全部學校。
+
+    Args:
+        schools: 學校列表（需包含 CARD_FIELDS）
+        cache_dir: 卡片輸出目錄
+        font_path: 中文字體路徑，默認自動查找
+        workers: 進程數，默認為 CPU 數
+        force: 忽略已有的卡片，全部重新生成（例如更換字體後）
+
+    Returns:
+        {'rendered': 新生成數量, 'skipped': 跳過數量, 'removed': 刪除的舊卡片數量}
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    font_path = font_path or find_font()
+
+    jobs = []
+    skipped = 0
+    current = set()
+    for school in schools:
+        path = card_path(school, cache_dir)
+        current.add(path.name)
+        if path.exists() and not force:
+            skipped += 1
+            continue
+        jobs.append(({field: school.get(field, '-') for field in CARD_FIELDS}, str(path), font_path))
+
+    if workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            _render_to_file(job)
+    elif jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_render_to_file, jobs, chunksize=16))
+
+    # 刪除沒有任何學校引用的卡片（包括中斷時留下的臨時文件）
+    removed = 0
+    for path in cache_dir.glob('*.png'):
+        if path.name not in current:
+            path.unlink(missing_ok=True)
+            removed += 1
+
+    return {'rendered': len(jobs), 'skipped': skipped, 'removed': removed}
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='批量生成學校設施卡片')
+    parser.add_argument('csv', type=Path, help='學校資料 CSV 文件')
+    parser.add_argument('--out', type=Path, default=Path(__file__).parent.parent / '.cache' / 'facility_cards',
+                        help='卡片輸出目錄')
+    parser.add_argument('--font', help='中文字體路徑（默認自動查找）')
+    parser.add_argument('--workers', type=int, help='進程數（默認為 CPU 數）')
+    parser.add_argument('--force', action='store_true', help='全部重新生成（例如更換字體後）')
+    args = parser.parse_args(argv)
+
+    font_path = args.font or find_font()
+    if not font_path:
+        print("[WARNING] 找不到中文字體，請用 --font 指定，否則中文無法正常顯示", file=sys.stderr)
+
+    schools = load_schools(args.csv, CARD_FIELDS)
+    stats = render_all(schools, args.out, font_path=font_path, workers=args.workers, force=args.force)
+    print(f"生成 {stats['rendered']} 張卡片，跳過 {stats['skipped']} 張未改變的卡片，"
+          f"刪除 {stats['removed']} 張過期卡片 -> {args.out}")
+
+if __name__ == '__main__':
+    main()
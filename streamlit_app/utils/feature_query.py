@@ -0,0 +1,246 @@
+
+import re
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+
+from .fields import SEARCH_FIELDS, SCOPED_SEARCH_FIELDS, SEARCH_FIELD_ALIASES
+from .tags import tag_keywords
+
+# 查詢語法：
+#   STEAM AND (音樂 OR 藝術) NOT 寄宿
+#   校風:關愛
+#   "english day"
+# 相鄰的詞默認為 AND；不含運算符、括號及欄位前綴的查詢整句作為一個子字符串匹配。
+#
+# 解析結果為元組組成的語法樹：
+#   ('term', 欄位或 None, 小寫文字)
+#   ('and', [子節點, ...]) / ('or', [子節點, ...]) / ('not', 子節點)
+
+OPERATORS = {'AND', 'OR', 'NOT'}
+
+# 括號及 NOT 的最大嵌套層數（解析及計算都是遞歸的，過深的查詢按語法錯誤處理）
+MAX_DEPTH = 50
+
+# 每個索引緩存的詞位圖數量上限（索引在進程內共享，用戶輸入的詞不能無限累積）
+TERM_CACHE_SIZE = 256
+
+TOKEN_PATTERN = re.compile(r'"([^"]*)"|([()])|([^\s()"]+)')
+
+class QueryError(ValueError):
+    """查詢語法錯誤（錯誤信息會顯示在搜索框旁）"""
+
+def _resolve_field(prefix: str) -> Optional[str]:
+    if prefix in SEARCH_FIELDS or prefix in SCOPED_SEARCH_FIELDS:
+        return prefix
+    return SEARCH_FIELD_ALIASES.get(prefix)
+
+def _tokenize(query: str) -> List[Tuple[str, Any]]:
+    """拆分為 ('op', 'AND') / ('paren', '(') / ('term', (欄位, 文字)) 記號"""
+    tokens = []
+    for quoted, paren, word in TOKEN_PATTERN.findall(query):
+        if paren:
+            tokens.append(('paren', paren))
+        elif word in OPERATORS:
+            tokens.append(('op', word))
+        elif word:
+            field = None
+            match = re.match(r'([^:：]+)[:：](.*)$', word)
+            if match and _resolve_field(match.group(1)):
+                field = _resolve_field(match.group(1))
+                word = match.group(2)
+            if word:
+                tokens.append(('term', (field, word.lower())))
+            elif field:
+                tokens.append(('field', field))
+        else:
+            tokens.append(('term', (None, quoted.lower())))
+    # 「校風:"愉快 學習"」：欄位前綴後接引號短語
+    merged = []
+    for token in tokens:
+        if merged and merged[-1][0] == 'field' and token[0] == 'term' and token[1][0] is None:
+            merged[-1] = ('term', (merged[-1][1], token[1][1]))
+        else:
+            merged.append(token)
+    return merged
+
+class _Parser:
+    def __init__(self, tokens: List[Tuple[str, Any]]):
+        self.tokens = tokens
+        self.position = 0
+        self.depth = 0
+
+    def peek(self) -> Optional[Tuple[str, Any]]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self) -> Tuple[str, Any]:
+        token = self.peek()
+        self.position += 1
+        return token
+
+    @staticmethod
+    def _describe(token: Tuple[str, Any]) -> str:
+        # 欄位前綴記號顯示為用戶輸入的形式
+        return f"{token[1]}:" if token[0] == 'field' else str(token[1])
+
+    def parse(self):
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise QueryError(f"多餘的「{self._describe(self.peek())}」")
+        return node
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() == ('op', 'OR'):
+            self.take()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ('or', nodes)
+
+    def parse_and(self):
+        nodes = [self.parse_unary()]
+        while True:
+            token = self.peek()
+            if token == ('op', 'AND'):
+                self.take()
+            elif token is None or token == ('op', 'OR') or token == ('paren', ')'):
+                break
+            # 其他情況（相鄰的詞或 NOT）為隱含的 AND
+            nodes.append(self.parse_unary())
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+    def parse_unary(self):
+        token = self.take()
+        if token is None:
+            raise QueryError("查詢不完整，運算符或括號後缺少關鍵詞")
+        if token == ('op', 'NOT') or token == ('paren', '('):
+            self.depth += 1
+            if self.depth > MAX_DEPTH:
+                raise QueryError(f"括號或 NOT 嵌套超過 {MAX_DEPTH} 層")
+            if token == ('op', 'NOT'):
+                node = ('not', self.parse_unary())
+            else:
+                node = self.parse_or()
+                if self.take() != ('paren', ')'):
+                    raise QueryError("括號不成對，缺少「)」")
+            self.depth -= 1
+            return node
+        if token[0] == 'term':
+            field, text = token[1]
+            return ('term', field, text)
+        raise QueryError(f"「{self._describe(token)}」的位置不對")
+
+@lru_cache(maxsize=256)
+def parse_query(query: str):
+    """把查詢解析為語法樹（同一查詢只解析一次）
+
+    不含運算符、括號及欄位前綴的查詢保持原有的子字符串匹配。
+
+    Raises:
+        QueryError: 語法錯誤，例如括號不成對或運算符後沒有詞
+    """
+    query = query.strip()
+    if not query:
+        return None
+    tokens = _tokenize(query)
+    if all(kind == 'term' and token[0] is None for kind, token in tokens) and '"' not in query:
+        return ('term', None, query.lower())
+    return _Parser(tokens).parse()
+
+def parse_query_lenient(query: str):
+    """解析查詢；語法錯誤時退回整句子字符串匹配（用 query_error 取得錯誤以提示用戶）"""
+    try:
+        return parse_query(query)
+    except QueryError:
+        return ('term', None, query.strip().lower())
+
+def query_error(query: str) -> Optional[QueryError]:
+    """查詢的語法錯誤；沒有錯誤時返回 None"""
+    try:
+        parse_query(query)
+    except QueryError as error:
+        return error
+    return None
+
+def tag_query(tag: str):
+    """特色標籤對應的語法樹：符合任何一個關鍵詞"""
+    nodes = [('term', None, keyword) for keyword in tag_keywords(tag)]
+    return nodes[0] if len(nodes) == 1 else ('or', nodes)
+
+def combine(nodes: List[Any]):
+    """把多個語法樹以 AND 合併，忽略空查詢"""
+    nodes = [node for node in nodes if node is not None]
+    if not nodes:
+        return None
+    return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+class FeatureIndex:
+    """學校特色文本的索引，把查詢語法樹計算為學校位圖
+
+    每個欄位的小寫文本只準備一次；每個詞的匹配結果以整數位圖緩存（最近使用的 TERM_CACHE_SIZE 個），
+    AND / OR / NOT 直接對位圖做位運算，複雜查詢不需要重新掃描文本。
+    """
+
+    def __init__(self, schools: List[Dict[str, Any]], fields: List[str] = None):
+        self.fields = fields or SEARCH_FIELDS
+        self.ids = [school.get('id') for school in schools]
+        self.positions = {school_id: i for i, school_id in enumerate(self.ids)}
+        self.all_bits = (1 << len(self.ids)) - 1
+        self._texts: Dict[Optional[str], List[str]] = {
+            field: [str(school.get(field, '')).lower() for school in schools]
+            for field in self.fields + [field for field in SCOPED_SEARCH_FIELDS if field not in self.fields]
+        }
+        # 不限欄位時搜索所有欄位連接起來的文本（不包括只能以前綴搜索的欄位）
+        self._texts[None] = [
+            ' '.join(str(school.get(field, '')) for field in self.fields).lower()
+            for school in schools
+        ]
+        self._term_bits: 'OrderedDict[Tuple[Optional[str], str], int]' = OrderedDict()
+
+    def term_bits(self, field: Optional[str], text: str) -> int:
+        key = (field, text)
+        bits = self._term_bits.get(key)
+        if bits is not None:
+            self._term_bits.move_to_end(key)
+            return bits
+        bits = 0
+        for i, value in enumerate(self._texts.get(field, self._texts[None])):
+            if text in value:
+                bits |= 1 << i
+        self._term_bits[key] = bits
+        if len(self._term_bits) > TERM_CACHE_SIZE:
+            self._term_bits.popitem(last=False)
+        return bits
+
+    def evaluate(self, node) -> int:
+        """計算語法樹，返回符合條件的學校位圖"""
+        if node is None:
+            return self.all_bits
+        kind = node[0]
+        if kind == 'term':
+            return self.term_bits(node[1], node[2])
+        if kind == 'and':
+            bits = self.all_bits
+            for child in node[1]:
+                bits &= self.evaluate(child)
+                if not bits:
+                    break
+            return bits
+        if kind == 'or':
+            bits = 0
+            for child in node[1]:
+                bits |= self.evaluate(child)
+            return bits
+        if kind == 'not':
+            return self.all_bits & ~self.evaluate(node[1])
+        raise QueryError(f"Unknown node: {kind}")
+
+    def filter(self, schools: List[Dict[str, Any]], node) -> List[Dict[str, Any]]:
+        """保留符合語法樹的學校（按學校 ID 對應索引位置）"""
+        if node is None:
+            return schools
+        bits = self.evaluate(node)
+        positions = self.positions
+        return [
+            school for school in schools
+            if school.get('id') in positions and bits >> positions[school.get('id')] & 1
+        ]
@@ -0,0 +1,119 @@
+
+# 欄位分組：決定哪些欄位常駐內存、哪些按需從詳細資料存儲讀取
+
+from .flags import FLAG_FIELDS
+
+# 學校列表卡片顯示的欄位
+LIST_FIELDS = [
+    'id',
+    '學校名稱',
+    '區域',
+    '小一學校網',
+    '學校類別1',
+    '學生性別',
+    '宗教',
+    '教學語言',
+]
+
+# 篩選需要的欄位
+FILTER_FIELDS = [
+    '辦學團體',
+    '一條龍中學',
+    '直屬中學',
+    '聯繫中學',
+    '學校地址',
+] + FLAG_FIELDS
+
+# 單值篩選：篩選鍵 -> 欄位
+FACET_FIELDS = {
+    '區域': '區域',
+    '資助類型': '學校類別1',
+    '學生性別': '學生性別',
+    '宗教': '宗教',
+    '教學語言': '教學語言',
+}
+
+# 學校特色搜索的文本欄位
+SEARCH_FIELDS = [
+    '學校特色_其他',
+    '學習和教學策略',
+    '小學教育課程更新重點的發展',
+    '共通能力的培養',
+    '正確價值觀_態度和行為的培養',
+    '全校參與照顧學生的多樣性',
+    '辦學宗旨',
+    '校風',
+]
+
+# 只能以欄位前綴搜索的文本欄位（例如「校訓:敬主愛人」），不參與不限欄位的特色搜索及特色標籤
+SCOPED_SEARCH_FIELDS = [
+    '校訓',
+]
+
+# 特色搜索中欄位前綴的簡稱，例如「校風:關愛」
+SEARCH_FIELD_ALIASES = {
+    '特色': '學校特色_其他',
+    '教學': '學習和教學策略',
+    '課程': '小學教育課程更新重點的發展',
+    '能力': '共通能力的培養',
+    '價值觀': '正確價值觀_態度和行為的培養',
+    '照顧': '全校參與照顧學生的多樣性',
+    '宗旨': '辦學宗旨',
+    '校風': '校風',
+    '校訓': '校訓',
+    # 簡體界面輸入的簡稱
+    '教学': '學習和教學策略',
+    '课程': '小學教育課程更新重點的發展',
+    '价值观': '正確價值觀_態度和行為的培養',
+    '照顾': '全校參與照顧學生的多樣性',
+    '校风': '校風',
+    '校训': '校訓',
+}
+
+# 學校比較表額外顯示的欄位（以數值為主）
+COMPARISON_FIELDS = [
+    '教師總人數',
+    '已接受師資培訓人數百分率',
+    '學士人數百分率',
+    '碩士／博士或以上人數百分率',
+    '特殊教育培訓人數百分率',
+    '10年年資或以上人數百分率',
+    '本學年小一班數',
+    '本學年總班數',
+    '課室數目',
+    '全年全科測驗次數_一年級',
+    '全年全科考試次數_一年級',
+    '全年全科測驗次數_二至六年級',
+    '全年全科考試次數_二至六年級',
+    '一般上學時間',
+    '一般放學時間',
+]
+
+# 常駐內存的欄位
+HOT_FIELDS = LIST_FIELDS + FILTER_FIELDS + SEARCH_FIELDS + SCOPED_SEARCH_FIELDS + [
+    field for field in COMPARISON_FIELDS if field not in FILTER_FIELDS
+]
+
+# 只在詳細資料頁顯示的欄位，按需讀取
+DETAIL_FIELDS = [
+    '禮堂數目',
+    '操場數目',
+    '圖書館數目',
+    '特別室',
+    '其他學校設施',
+    '支援有特殊教育需要學生的設施',
+    '學校電話',
+    '學校電郵',
+    '學校網址',
+    '學費',
+    '其他收費_費用',
+]
+
+# 加載時需要讀取的欄位，其餘欄位（如學校發展計劃等長文本）不會被解析
+LOADED_FIELDS = HOT_FIELDS + DETAIL_FIELDS
+
+# 導出時可選的欄位（常駐內存的欄位按列投影讀取，詳細資料欄位按需讀取）
+EXPORT_FIELDS = [field for field in LOADED_FIELDS if field != 'id']
+
+# 導出時默認選擇的欄位
+DEFAULT_EXPORT_FIELDS = LIST_FIELDS[1:] + ['辦學團體', '學校地址', '學校電話', '學校網址']
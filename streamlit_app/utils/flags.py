@@ -0,0 +1,84 @@
+
+from typing import List, Dict, Any, Optional
+
+# 有 / 無 欄位：篩選選項 -> 欄位，位置即位圖中的位
+POLICY_FLAGS = {
+    '小一上學期以評估代替測考': '小一上學期以多元化的進展性評估代替測驗及考試',
+    '下午安排導修時間': '按校情靈活編排時間表_盡量在下午安排導修時段_讓學生能在教師指導下完成部分家課',
+    '制定校本課業政策': '制定適切的校本課業政策_讓家長了解相關安排_並定期蒐集教師_學生和家長的意見',
+    '網上公開課業政策': '將校本課業政策上載至學校網頁_讓公眾及持份者知悉',
+    '網上公開評估政策': '將校本評估政策上載至學校網頁_讓公眾及持份者知悉',
+    '長假期後不安排測考': '避免緊接在長假期後安排測考_讓學生在假期有充分的休息',
+    '校車': '校車',
+    '保姆車': '保姆車',
+    '家長教師會': '家長教師會',
+    '舊生會/校友會': '舊生會_校友會',
+}
+
+# 由其他欄位推算的標記
+DERIVED_FLAGS = ['小一不設測考']
+
+FLAG_BITS = {name: 1 << i for i, name in enumerate(list(POLICY_FLAGS) + DERIVED_FLAGS)}
+
+FLAG_FIELDS = list(POLICY_FLAGS.values()) + ['全年全科測驗次數_一年級', '全年全科考試次數_一年級']
+
+# 篩選分組：篩選鍵 -> 選項
+FLAG_FILTERS = {
+    '課業安排': [
+        '下午安排導修時間',
+        '小一不設測考',
+        '小一上學期以評估代替測考',
+        '制定校本課業政策',
+        '網上公開課業政策',
+        '網上公開評估政策',
+        '長假期後不安排測考',
+    ],
+    '校車及家校組織': ['校車', '保姆車', '家長教師會', '舊生會/校友會'],
+}
+
+YES_VALUES = ['有', '是']
+EMPTY_VALUES = ['0', '-', '', '—', '－']
+
+def pack_flags(school: Dict[str, Any]) -> int:
+    """把學校的有 / 無欄位打包為一個整數"""
+    flags = 0
+    for name, field in POLICY_FLAGS.items():
+        if str(school.get(field, '')).strip() in YES_VALUES:
+            flags |= FLAG_BITS[name]
+    test = str(school.get('全年全科測驗次數_一年級', '')).strip()
+    exam = str(school.get('全年全科考試次數_一年級', '')).strip()
+    if test in EMPTY_VALUES and exam in EMPTY_VALUES:
+        flags |= FLAG_BITS['小一不設測考']
+    return flags
+
+def required_flags(filters: Dict[str, Any]) -> int:
+    """所有標記篩選合併為一個位圖，學校須全部符合"""
+    required = 0
+    for key in FLAG_FILTERS:
+        for name in filters.get(key) or []:
+            required |= FLAG_BITS.get(name, 0)
+    return required
+
+class FlagIndex:
+    """每所學校的標記位圖（每個數據集計算一次）"""
+
+    def __init__(self, schools: List[Dict[str, Any]]):
+        self.positions = {school.get('id'): i for i, school in enumerate(schools)}
+        self.flags = [pack_flags(school) for school in schools]
+
+    def get(self, school: Dict[str, Any]) -> Optional[int]:
+        position = self.positions.get(school.get('id'))
+        return None if position is None else self.flags[position]
+
+    def filter(self, schools: List[Dict[str, Any]], required: int) -> List[Dict[str, Any]]:
+        """保留符合所有標記的學校：一次位運算比較"""
+        if not required:
+            return schools
+        result = []
+        for school in schools:
+            flags = self.get(school)
+            if flags is None:
+                flags = pack_flags(school)
+            if flags & required == required:
+                result.append(school)
+        return result
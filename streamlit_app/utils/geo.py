@@ -0,0 +1,196 @@
+
+import csv
+import heapq
+import math
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+# 離線地名表：地名、所屬區域（可多個，以「/」分隔）、緯度、經度。
+# 座標為地區或屋邨的大約中心點，足以按公里計算遠近，不是精確的門牌位置。
+GAZETTEER_PATH = Path(__file__).parent / "gazetteer.csv"
+
+# 香港範圍內把經緯度當作平面座標計算距離（等距圓柱投影），誤差遠小於地名表本身的誤差。
+# SQLite 存儲用同一條公式，兩種後端的距離篩選結果一致。
+REFERENCE_LATITUDE = 22.35
+KM_PER_DEGREE_LAT = 6371.0088 * math.pi / 180
+KM_PER_DEGREE_LNG = KM_PER_DEGREE_LAT * math.cos(math.radians(REFERENCE_LATITUDE))
+
+@lru_cache(maxsize=4)
+def load_gazetteer(path: Path = GAZETTEER_PATH) -> Dict[str, Tuple[float, float, Tuple[str, ...]]]:
+    """讀取地名表：地名 -> (緯度, 經度, 所屬區域)"""
+    with open(path, encoding='utf-8') as file:
+        return {
+            row['地名']: (float(row['緯度']), float(row['經度']), tuple(row['區域'].split('/')))
+            for row in csv.DictReader(file)
+        }
+
+def place_names(gazetteer: Optional[Dict[str, Tuple[float, float, Tuple[str, ...]]]] = None) -> List[str]:
+    """可選作中心點的地名（區域在前，其餘按區域分組）"""
+    gazetteer = gazetteer or load_gazetteer()
+    districts = [name for name, (_, _, regions) in gazetteer.items() if regions == (name,)]
+    order = {district: i for i, district in enumerate(districts)}
+    places = [name for name in gazetteer if name not in order]
+    places.sort(key=lambda name: order.get(gazetteer[name][2][0], len(order)))
+    return districts + places
+
+def place_location(name: str, gazetteer=None) -> Optional[Tuple[float, float]]:
+    """地名的座標；不在地名表中時返回 None"""
+    place = (gazetteer or load_gazetteer()).get(str(name or '').strip())
+    return None if place is None else place[:2]
+
+def geocode(address: str, region: str = '', gazetteer=None) -> Optional[Tuple[float, float, str]]:
+    """按地址中出現的地名估計學校座標
+
+    選擇地址中最長的地名（同樣長度時取較後出現的，通常更具體，例如「觀塘油塘」取油塘）。
+    優先使用所屬區域與學校區域一致的地名，避免「大白田街」被當成深水埗的白田；
+    沒有時才使用其他區域的地名（數據中部分學校的區域與地址不一致），
+    地址中沒有任何地名時退回學校所在區域的中心點。
+
+    Returns:
+        (緯度, 經度, 匹配的地名)；區域也無法確定時返回 None
+    """
+    gazetteer = gazetteer or load_gazetteer()
+    address = str(address or '').strip()
+    region = str(region or '').strip()
+    best = None
+    for name, (lat, lng, regions) in gazetteer.items():
+        position = address.rfind(name)
+        if position >= 0:
+            key = (not region or region in regions, len(name), position)
+            if best is None or key > best[0]:
+                best = (key, (lat, lng, name))
+    if best is not None:
+        return best[1]
+    if region in gazetteer:
+        lat, lng, _ = gazetteer[region]
+        return lat, lng, region
+    return None
+
+def distance_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """兩點之間的距離（公里）"""
+    dy = (lat1 - lat2) * KM_PER_DEGREE_LAT
+    dx = (lng1 - lng2) * KM_PER_DEGREE_LNG
+    return math.hypot(dx, dy)
+
+class GeoIndex:
+    """學校座標的網格索引
+
+    建立時按地址為每所學校估計一次座標，並按固定大小的網格分桶。
+    「X 公里內」只檢查覆蓋圓形範圍的格子；「最近 k 所」從中心格子一圈圈向外擴展，
+    已找到 k 所且下一圈不可能更近時停止。
+    """
+
+    def __init__(self, schools: List[Dict[str, Any]], gazetteer=None, cell_km: float = 1.0):
+        self.gazetteer = gazetteer or load_gazetteer()
+        self.cell_km = cell_km
+        self.ids = [school.get('id') for school in schools]
+        self.positions = {school_id: i for i, school_id in enumerate(self.ids)}
+        self.points: List[Optional[Tuple[float, float]]] = []
+        self.places: List[Optional[str]] = []
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for i, school in enumerate(schools):
+            located = geocode(school.get('學校地址', ''), school.get('區域', ''), self.gazetteer)
+            if located is None:
+                self.points.append(None)
+                self.places.append(None)
+                continue
+            lat, lng, place = located
+            self.points.append((lat, lng))
+            self.places.append(place)
+            self.cells.setdefault(self._cell(lat, lng), []).append(i)
+        rows = [row for row, _ in self.cells] or [0]
+        columns = [column for _, column in self.cells] or [0]
+        self._extent = (min(rows), max(rows), min(columns), max(columns))
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (
+            math.floor(lat * KM_PER_DEGREE_LAT / self.cell_km),
+            math.floor(lng * KM_PER_DEGREE_LNG / self.cell_km)
+        )
+
+    def locate(self, school: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+        """學校的座標（不在索引中時即時估計）"""
+        position = self.positions.get(school.get('id'))
+        if position is not None:
+            return self.points[position]
+        located = geocode(school.get('學校地址', ''), school.get('區域', ''), self.gazetteer)
+        return None if located is None else located[:2]
+
+    def distance(self, school: Dict[str, Any], lat: float, lng: float) -> Optional[float]:
+        point = self.locate(school)
+        return None if point is None else distance_km(point[0], point[1], lat, lng)
+
+    def within(self, lat: float, lng: float, km: float) -> List[Tuple[float, int]]:
+        """距離中心點 km 公里內的學校 [(距離, 位置), ...]，由近到遠"""
+        row, column = self._cell(lat, lng)
+        reach = math.ceil(km / self.cell_km)
+        results = []
+        for r in range(row - reach, row + reach + 1):
+            for c in range(column - reach, column + reach + 1):
+                for position in self.cells.get((r, c), ()):
+                    distance = distance_km(*self.points[position], lat, lng)
+                    if distance <= km:
+                        results.append((distance, position))
+        results.sort()
+        return results
+
+    def nearest(self, lat: float, lng: float, k: int, allowed: Optional[set] = None) -> List[Tuple[float, int]]:
+        """最近的 k 所學校 [(距離, 位置), ...]，由近到遠
+
+        Args:
+            allowed: 只考慮這些位置（例如已按其他條件篩選的學校）；None 表示所有學校
+        """
+        if k <= 0:
+            return []
+        row, column = self._cell(lat, lng)
+        min_row, max_row, min_column, max_column = self._extent
+        max_ring = max(row - min_row, max_row - row, column - min_column, max_column - column, 0)
+        found: List[Tuple[float, int]] = []
+        for ring in range(max_ring + 1):
+            for r in range(row - ring, row + ring + 1):
+                for c in range(column - ring, column + ring + 1):
+                    if max(abs(r - row), abs(c - column)) != ring:
+                        continue
+                    for position in self.cells.get((r, c), ()):
+                        if allowed is None or position in allowed:
+                            found.append((distance_km(*self.points[position], lat, lng), position))
+            # 下一圈的學校距離至少為 ring 個格子
+            if len(found) >= k and heapq.nsmallest(k, found)[-1][0] <= ring * self.cell_km:
+                break
+        return heapq.nsmallest(k, found)
+
+    def filter(
+        self,
+        schools: List[Dict[str, Any]],
+        place: str,
+        km: Optional[float] = None,
+        k: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """保留地點附近的學校（保持原有次序）
+
+        Args:
+            place: 地名表中的地名；不在地名表中時不篩選
+            km: 只保留這個距離（公里）內的學校
+            k: 只保留最近的 k 所（在 schools 及 km 範圍內）
+        """
+        center = place_location(place, self.gazetteer)
+        if center is None or (not km and not k):
+            return schools
+        lat, lng = center
+        allowed = {self.positions.get(school.get('id')) for school in schools}
+        allowed.discard(None)
+        if km:
+            allowed &= {position for _, position in self.within(lat, lng, km)}
+        if k:
+            allowed = {position for _, position in self.nearest(lat, lng, int(k), allowed)}
+        return [school for school in schools if self.positions.get(school.get('id')) in allowed]
+
+    def sort(self, schools: List[Dict[str, Any]], place: str) -> List[Dict[str, Any]]:
+        """按與地點的距離由近到遠排序（穩定排序，距離相同時保持原有次序）"""
+        center = place_location(place, self.gazetteer)
+        if center is None:
+            return schools
+        distances = [self.distance(school, *center) for school in schools]
+        order = sorted(range(len(schools)), key=lambda i: (distances[i] is None, distances[i] or 0.0))
+        return [schools[i] for i in order]
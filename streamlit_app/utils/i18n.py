@@ -1,13 +1,21 @@
-try:
-    from opencc import OpenCC
-    _cc_tc_to_sc = OpenCC('t2s')
-    _cc_sc_to_tc = OpenCC('s2t')
-    _has_opencc = True
-except ImportError:
-    # 如果 opencc 未安裝，使用簡單的映射
-    _cc_tc_to_sc = None
-    _cc_sc_to_tc = None
-    _has_opencc = False
+# OpenCC 轉換器在第一次需要時才建立，只使用繁體界面的會話不會加載 OpenCC
+_converters = {}
+_has_opencc = None
+
+def _converter(config: str):
+    """取得 OpenCC 轉換器；opencc 未安裝時返回 None"""
+    global _has_opencc
+    converter = _converters.get(config)
+    if converter is None and _has_opencc is not False:
+        try:
+            from opencc import OpenCC
+        except ImportError:
+            # 如果 opencc 未安裝，使用原文本
+            _has_opencc = False
+            return None
+        _has_opencc = True
+        converter = _converters[config] = OpenCC(config)
+    return converter
 
 def convert_text(text: str, target_lang: str = 'sc') -> str:
     """轉換文本（繁體 ↔ 簡體）
@@ -22,24 +30,27 @@ def convert_text(text: str, target_lang: str = 'sc') -> str:
     if not text:
         return text
     
-    if not _has_opencc:
+    if target_lang not in ('sc', 'tc'):
+        return text
+    
+    converter = _converter('t2s' if target_lang == 'sc' else 's2t')
+    if converter is None:
         # 如果 opencc 未安裝，返回原文本
         return text
     
     try:
-        if target_lang == 'sc':
-            return _cc_tc_to_sc.convert(text)
-        elif target_lang == 'tc':
-            return _cc_sc_to_tc.convert(text)
+        return converter.convert(text)
     except Exception as e:
         print(f"Error converting text: {e}")
         return text
-    
-    return text
+
+def localize(text: str, lang: str) -> str:
+    """界面顯示用的轉換：學校數據本身為繁體，繁體界面直接返回原文"""
+    if lang == 'tc':
+        return text
+    return convert_text(text, lang)
 
 def get_language() -> str:
     """獲取當前語言設置（從 session state 讀取）"""
     # 這個函數將在 app.py 中通過參數傳遞
     return 'tc'
-
-
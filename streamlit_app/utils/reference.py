@@ -0,0 +1,319 @@
+
+from collections import Counter
+from functools import cmp_to_key
+from typing import List, Dict, Any, Optional, Tuple
+
+from .entities import LINK_FIELDS, base_key, entity_key, split_names
+from .feature_query import MAX_DEPTH, OPERATORS
+from .fields import FACET_FIELDS, SEARCH_FIELDS, SCOPED_SEARCH_FIELDS, SEARCH_FIELD_ALIASES
+from .flags import POLICY_FLAGS, YES_VALUES, EMPTY_VALUES as NO_TEST_VALUES
+from .geo import load_gazetteer, place_location, geocode, distance_km
+from .sorting import extract_school_net_number, compare_names_by_strokes
+from .tags import tag_keywords
+
+# 篩選、篩選選項及排序的參考實現：逐所學校直接按定義計算，不使用任何索引、位圖或緩存。
+# 速度慢但容易核對，用作 utils.equivalence 的對照，不在應用中使用。
+#
+# 欄位、別名、標記等規則表及名稱規範化、地址定位都從應用的模組導入，兩邊只有一份；
+# 這裡只保留最直接的算法：逐所學校線性掃描、整個列表排序，以及每次對整句查詢重新解析
+# （逐字符掃描及調度場算法，與 feature_query 的遞歸下降解析器不同）。
+
+OPTION_EMPTY_VALUES = ['-', '', '—', '－']
+
+# ---------- 特色查詢語法 ----------
+
+class _SyntaxError(Exception):
+    pass
+
+def _prefix_field(prefix: str) -> Optional[str]:
+    if prefix in SEARCH_FIELDS or prefix in SCOPED_SEARCH_FIELDS:
+        return prefix
+    return SEARCH_FIELD_ALIASES.get(prefix)
+
+def _word_token(word: str) -> tuple:
+    """一個未加引號的詞：運算符、帶欄位前綴的詞或普通詞"""
+    if word in OPERATORS:
+        return (word,)
+    for position, char in enumerate(word):
+        if char in ':：':
+            field = _prefix_field(word[:position]) if position else None
+            if field is None:
+                break
+            text = word[position + 1:]
+            return ('term', field, text.lower()) if text else ('field', field)
+    return ('term', None, word.lower())
+
+def _scan(query: str) -> List[tuple]:
+    """逐字符掃描：引號短語、括號、以空白 / 括號 / 引號分隔的詞；沒有配對的引號被忽略"""
+    tokens = []
+    i = 0
+    while i < len(query):
+        char = query[i]
+        if char.isspace():
+            i += 1
+        elif char in '()':
+            tokens.append((char,))
+            i += 1
+        elif char == '"':
+            end = query.find('"', i + 1)
+            if end < 0:
+                i += 1
+                continue
+            tokens.append(('term', None, query[i + 1:end].lower()))
+            i = end + 1
+        else:
+            j = i
+            while j < len(query) and not query[j].isspace() and query[j] not in '()"':
+                j += 1
+            tokens.append(_word_token(query[i:j]))
+            i = j
+    # 單獨的欄位前綴與緊接的不限欄位詞合併，例如「校風: 關愛」「校風:"愉快 學習"」
+    merged = []
+    for token in tokens:
+        if merged and merged[-1][0] == 'field' and token[0] == 'term' and token[1] is None:
+            merged[-1] = ('term', merged[-1][1], token[2])
+        else:
+            merged.append(token)
+    return merged
+
+def _check_depth(stack: List[tuple]) -> None:
+    # 等待運算元時棧上的 NOT 及「(」都還沒有結束，數量即當前的嵌套層數
+    if sum(1 for token in stack if token[0] in ('NOT', '(')) >= MAX_DEPTH:
+        raise _SyntaxError('depth')
+
+def _to_postfix(tokens: List[tuple]) -> List[tuple]:
+    """檢查語法並以調度場算法轉為後綴式；相鄰的運算元之間補上 AND"""
+    precedence = {'OR': 1, 'AND': 2, 'NOT': 3}
+    output, stack = [], []
+    expect_operand = True
+    depth = 0
+    for token in tokens:
+        kind = token[0]
+        if expect_operand:
+            if kind == 'term':
+                output.append(token)
+                expect_operand = False
+            elif kind == 'NOT':
+                _check_depth(stack)
+                stack.append(token)
+            elif kind == '(':
+                _check_depth(stack)
+                stack.append(token)
+                depth += 1
+            else:
+                raise _SyntaxError(token)
+            continue
+        if kind in ('term', 'NOT', '('):
+            # 隱含的 AND，再按運算元處理當前記號
+            tokens_to_push = [('AND',), token]
+        elif kind in ('AND', 'OR', ')'):
+            tokens_to_push = [token]
+        else:
+            raise _SyntaxError(token)
+        for item in tokens_to_push:
+            item_kind = item[0]
+            if item_kind in ('AND', 'OR'):
+                while stack and stack[-1][0] != '(' and precedence[stack[-1][0]] >= precedence[item_kind]:
+                    output.append(stack.pop())
+                stack.append(item)
+                expect_operand = True
+            elif item_kind == ')':
+                if depth == 0:
+                    raise _SyntaxError(item)
+                while stack[-1][0] != '(':
+                    output.append(stack.pop())
+                stack.pop()
+                depth -= 1
+            elif item_kind == 'term':
+                output.append(item)
+                expect_operand = False
+            else:
+                _check_depth(stack)
+                stack.append(item)
+                if item_kind == '(':
+                    depth += 1
+    if expect_operand or depth:
+        raise _SyntaxError('end')
+    while stack:
+        output.append(stack.pop())
+    return output
+
+def feature_program(query: str) -> Optional[Tuple[tuple, ...]]:
+    """特色查詢的後綴式；空查詢返回 None
+
+    不含運算符、括號、欄位前綴及引號的查詢整句作為一個子字符串；語法錯誤時同樣退回整句匹配。
+    """
+    query = query.strip()
+    if not query:
+        return None
+    tokens = _scan(query)
+    if '"' not in query and all(token[0] == 'term' and token[1] is None for token in tokens):
+        return (('term', None, query.lower()),)
+    try:
+        return tuple(_to_postfix(tokens))
+    except _SyntaxError:
+        return (('term', None, query.lower()),)
+
+def _tag_program(tag: str) -> Tuple[tuple, ...]:
+    """特色標籤：符合任何一個關鍵詞"""
+    words = tag_keywords(tag)
+    program = [('term', None, words[0])]
+    for word in words[1:]:
+        program += [('term', None, word), ('OR',)]
+    return tuple(program)
+
+def _run(program: Tuple[tuple, ...], school: Dict[str, Any]) -> bool:
+    """在學校文本上計算後綴式"""
+    combined = ' '.join(str(school.get(field, '')) for field in SEARCH_FIELDS).lower()
+    stack: List[bool] = []
+    for token in program:
+        if token[0] == 'term':
+            _, field, text = token
+            haystack = combined if field is None else str(school.get(field, '')).lower()
+            stack.append(text in haystack)
+        elif token[0] == 'NOT':
+            stack.append(not stack.pop())
+        else:
+            right, left = stack.pop(), stack.pop()
+            stack.append(left and right if token[0] == 'AND' else left or right)
+    return stack[0]
+
+# ---------- 名稱及地址 ----------
+
+def _keys(value: Any) -> set:
+    return {entity_key(name) for name in split_names(value)} - {''}
+
+def _locate(school: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    located = geocode(school.get('學校地址', ''), school.get('區域', ''))
+    return None if located is None else located[:2]
+
+# ---------- 篩選 ----------
+
+def _networks(school: Dict[str, Any]) -> List[str]:
+    school_net = str(school.get('小一學校網', '')).strip()
+    if school_net in ('', '/', '-'):
+        return []
+    return [net.strip() for net in school_net.split('/')]
+
+def _has_flag(school: Dict[str, Any], name: str) -> bool:
+    if name in POLICY_FLAGS:
+        return str(school.get(POLICY_FLAGS[name], '')).strip() in YES_VALUES
+    if name == '小一不設測考':
+        test = str(school.get('全年全科測驗次數_一年級', '')).strip()
+        exam = str(school.get('全年全科考試次數_一年級', '')).strip()
+        return test in NO_TEST_VALUES and exam in NO_TEST_VALUES
+    # 未知選項不限制
+    return True
+
+def _matches(school: Dict[str, Any], filters: Dict[str, Any], programs: List[Tuple[tuple, ...]]) -> bool:
+    """學校是否符合除距離以外的所有篩選條件"""
+    query = str(filters.get('search_query') or '').lower().strip()
+    if query and query not in str(school.get('學校名稱', '')).lower():
+        return False
+
+    for key, field in FACET_FIELDS.items():
+        values = filters.get(key)
+        if values and str(school.get(field, '')).strip() not in values:
+            return False
+
+    networks = filters.get('校網')
+    if networks and not set(networks) & set(_networks(school)):
+        return False
+
+    bodies = filters.get('辦學團體')
+    if bodies and not {entity_key(name) for name in bodies} & _keys(school.get('辦學團體')):
+        return False
+
+    kinds = [kind for kind in filters.get('關聯學校') or [] if kind in LINK_FIELDS]
+    if filters.get('關聯學校') and not any(_keys(school.get(LINK_FIELDS[kind])) for kind in kinds):
+        return False
+
+    secondaries = filters.get('關聯中學')
+    if secondaries:
+        wanted = {entity_key(name) for name in secondaries}
+        if not any(wanted & _keys(school.get(field)) for field in LINK_FIELDS.values()):
+            return False
+
+    for key in ('課業安排', '校車及家校組織'):
+        if not all(_has_flag(school, name) for name in filters.get(key) or []):
+            return False
+
+    return all(_run(program, school) for program in programs)
+
+def reference_apply_filters(schools: List[Dict[str, Any]], filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """apply_filters 的參考實現（保持原有次序）"""
+    programs = [feature_program(str(filters.get('feature_search_query') or ''))]
+    programs += [_tag_program(tag) for tag in filters.get('feature_tags') or []]
+    programs = [program for program in programs if program is not None]
+    matched = [(position, school) for position, school in enumerate(schools) if _matches(school, filters, programs)]
+
+    place = str(filters.get('附近地點') or '').strip()
+    km = filters.get('距離')
+    k = filters.get('最近數目')
+    center = place_location(place) if place in load_gazetteer() else None
+    if center is None or (not km and not k):
+        return [school for _, school in matched]
+
+    # 逐所學校按地址估計座標並計算距離；無法定位的學校不符合距離篩選
+    nearby = []
+    for position, school in matched:
+        located = _locate(school)
+        if located is None:
+            continue
+        distance = distance_km(*located, *center)
+        if not km or distance <= km:
+            nearby.append((distance, position, school))
+    if k:
+        kept = {position for _, position, _ in sorted(nearby, key=lambda item: item[:2])[:int(k)]}
+        nearby = [item for item in nearby if item[1] in kept]
+    return [school for _, _, school in nearby]
+
+# ---------- 篩選選項 ----------
+
+def _entity_options(values: List[Any]) -> List[str]:
+    """規範化名稱選項：每個實體一個顯示名稱，按出現次數降序、名稱排序"""
+    forms: Dict[str, Counter] = {}
+    for value in values:
+        for name in split_names(value):
+            key = entity_key(name)
+            if key:
+                forms.setdefault(key, Counter())[name] += 1
+
+    def display(key: str) -> str:
+        counts = forms[key]
+        return max(counts, key=lambda form: (base_key(form) == key, counts[form], len(form), form))
+
+    names = {key: display(key) for key in forms}
+    order = sorted(forms, key=lambda key: (-sum(forms[key].values()), names[key]))
+    return [names[key] for key in order]
+
+def reference_get_filter_options(schools: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """get_filter_options 的參考實現"""
+    options = {}
+    for key, field in FACET_FIELDS.items():
+        values = {str(school.get(field, '')).strip() for school in schools}
+        options[key] = sorted(values - set(OPTION_EMPTY_VALUES))
+    networks = set()
+    for school in schools:
+        school_net = str(school.get('小一學校網', '')).strip()
+        if school_net not in OPTION_EMPTY_VALUES + ['/']:
+            networks.update(net.strip() for net in school_net.split('/') if net.strip())
+    options['校網'] = sorted(networks)
+    options['辦學團體'] = _entity_options([school.get('辦學團體') for school in schools])
+    options['關聯中學'] = _entity_options([
+        school.get(field) for school in schools for field in LINK_FIELDS.values()
+    ])
+    return options
+
+# ---------- 排序 ----------
+
+def _compare_schools(a: Dict[str, Any], b: Dict[str, Any]) -> int:
+    net_a = extract_school_net_number(a.get('小一學校網', ''))
+    net_b = extract_school_net_number(b.get('小一學校網', ''))
+    if net_a != net_b:
+        return net_a - net_b
+    return compare_names_by_strokes(a.get('學校名稱', ''), b.get('學校名稱', ''))
+
+def reference_sort_schools(schools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """sort_schools 的參考實現：整個列表逐對比較校網編號及學校名稱"""
+    return sorted(schools, key=cmp_to_key(_compare_schools))
@@ -0,0 +1,341 @@
+
+import argparse
+import hashlib
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from .entities import ALIASES, entity_key
+from .fields import HOT_FIELDS
+from .filters import apply_filters
+from .store import record_hash
+
+# 多值篩選鍵，也是批量計算時的步驟次序：靠前的條件更常見、可共用的範圍更大
+LIST_KEYS = [
+    '區域', '校網', '資助類型', '宗教', '學生性別', '教學語言',
+    '辦學團體', '關聯學校', '關聯中學', '課業安排', '校車及家校組織', 'feature_tags',
+]
+
+# 文字篩選鍵（去除首尾空白後保存）
+TEXT_KEYS = ['search_query', 'feature_search_query']
+
+# 距離篩選作為一個步驟，放在最後（最近 k 所在符合其他條件的學校中選取）
+GEO_KEYS = ['附近地點', '距離', '最近數目']
+
+# 按實體比較的篩選：同一實體的不同寫法只保留一個
+ENTITY_KEYS = ['辦學團體', '關聯中學']
+
+# describe_spec 使用的名稱
+SPEC_LABELS = {
+    'search_query': '學校名稱',
+    'feature_search_query': '學校特色',
+    'feature_tags': '標籤',
+}
+
+def canonical_spec(filters: Dict[str, Any]) -> Dict[str, Any]:
+    """把篩選條件轉換為規範形式：去除空條件，多值條件去重並排序
+
+    篩選結果相同的條件（例如選項次序不同、辦學團體用了別名）得到相同的規範形式。
+    """
+    spec: Dict[str, Any] = {}
+    for key in LIST_KEYS:
+        values = sorted({str(value).strip() for value in filters.get(key) or []} - {''})
+        if key in ENTITY_KEYS:
+            seen = {}
+            for value in sorted(ALIASES.get(value, value) for value in values):
+                seen.setdefault(entity_key(value) or value, value)
+            values = sorted(seen.values())
+        if values:
+            spec[key] = values
+    for key in TEXT_KEYS:
+        text = str(filters.get(key) or '').strip()
+        if text:
+            spec[key] = text
+    place = str(filters.get('附近地點') or '').strip()
+    km = float(filters.get('距離') or 0)
+    k = int(filters.get('最近數目') or 0)
+    if place and (km or k):
+        spec['附近地點'] = place
+        if km:
+            spec['距離'] = km
+        if k:
+            spec['最近數目'] = k
+    return spec
+
+def spec_key(spec: Dict[str, Any]) -> str:
+    """規範形式的字符串鍵"""
+    return json.dumps(spec, ensure_ascii=False, sort_keys=True)
+
+def describe_spec(spec: Dict[str, Any]) -> str:
+    """篩選條件的簡短描述，例如「校網: 41；宗教: 天主教；課業安排: 小一不設測考」"""
+    parts = []
+    for key, value in spec.items():
+        if key in ('距離', '最近數目'):
+            continue
+        if key == '附近地點':
+            limits = []
+            if spec.get('距離'):
+                limits.append(f"{spec['距離']:g} 公里內")
+            if spec.get('最近數目'):
+                limits.append(f"最近 {spec['最近數目']} 所")
+            parts.append(f"{value}{'、'.join(limits)}")
+            continue
+        text = '、'.join(value) if isinstance(value, list) else value
+        parts.append(f"{SPEC_LABELS.get(key, key)}: {text}")
+    return '；'.join(parts)
+
+def _steps(spec: Dict[str, Any]) -> Tuple[Tuple[str, Any], ...]:
+    """規範形式拆成按固定次序的步驟，每一步為一個篩選條件"""
+    steps = [(key, tuple(spec[key])) for key in LIST_KEYS if key in spec]
+    steps += [(key, spec[key]) for key in TEXT_KEYS if key in spec]
+    if '附近地點' in spec:
+        steps.append(('附近地點', (spec['附近地點'], spec.get('距離', 0.0), spec.get('最近數目', 0))))
+    return tuple(steps)
+
+def _step_filters(step: Tuple[str, Any]) -> Dict[str, Any]:
+    key, value = step
+    if key == '附近地點':
+        return dict(zip(GEO_KEYS, value))
+    if key in LIST_KEYS:
+        return {key: list(value)}
+    return {key: value}
+
+def evaluate_searches(
+    schools: List[Dict[str, Any]],
+    specs: List[Dict[str, Any]],
+    stats: Optional[Dict[str, int]] = None,
+    **indexes
+) -> List[List[Dict[str, Any]]]:
+    """一次計算多個搜尋的結果（保持 schools 的次序）
+
+    每個搜尋拆成按固定次序的步驟，按步驟排序後相同前綴的搜尋相鄰，
+    共同前綴（例如同一校網、同一宗教）的篩選結果只計算一次，沿著前綴樹深度優先計算。
+    每一步都在上一步的結果上調用 apply_filters，距離篩選固定在最後，結果與一次應用所有條件相同。
+
+    Args:
+        schools: 學校列表
+        specs: canonical_spec 的結果
+        stats: 傳入字典時寫入 'steps'（實際計算的步驟數）及 'naive_steps'（不共用時的步驟數）
+        indexes: 傳給 apply_filters 的預建索引（index、tag_index、flag_index、geo_index、entity_index）
+
+    Returns:
+        與 specs 對應的學校列表
+    """
+    steps = [_steps(spec) for spec in specs]
+    order = sorted(range(len(specs)), key=lambda i: steps[i])
+    results: List[Optional[List[Dict[str, Any]]]] = [None] * len(specs)
+    # 當前路徑上每個前綴的結果
+    stack: List[Tuple[Tuple[Tuple[str, Any], ...], List[Dict[str, Any]]]] = [((), schools)]
+    computed = 0
+    for i in order:
+        path = steps[i]
+        while path[:len(stack[-1][0])] != stack[-1][0]:
+            stack.pop()
+        prefix, current = stack[-1]
+        for step in path[len(prefix):]:
+            current = apply_filters(current, _step_filters(step), **indexes)
+            prefix = prefix + (step,)
+            stack.append((prefix, current))
+            computed += 1
+        results[i] = current
+    if stats is not None:
+        stats['steps'] = computed
+        stats['naive_steps'] = sum(len(path) for path in steps)
+    return results
+
+def dataset_fingerprint(schools: List[Dict[str, Any]], fields: List[str] = HOT_FIELDS) -> str:
+    """數據集的內容指紋：篩選用到的欄位（常駐內存的欄位）有任何改變都會得到不同的指紋"""
+    digest = hashlib.sha256()
+    for school in schools:
+        digest.update(record_hash(school, fields).encode('ascii'))
+    return digest.hexdigest()[:24]
+
+def _names(schools: List[Dict[str, Any]]) -> List[str]:
+    return [str(school.get('學校名稱', '')).strip() for school in schools]
+
+def owner_key(owner: str) -> str:
+    """擁有者標記的哈希：文件中只保存哈希，讀到文件也不能冒充其他用戶"""
+    return hashlib.sha256(str(owner).encode('utf-8')).hexdigest()[:24]
+
+@contextmanager
+def _file_lock(path: Path):
+    """跨進程的排他文件鎖（POSIX 用 fcntl，Windows 用 msvcrt）"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a+b') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+class SavedSearchStore:
+    """保存的搜尋（JSON 文件，按擁有者區分）
+
+    每個搜尋屬於一個擁有者（用戶的隨機標記，文件中只保存其哈希），只有擁有者能列出、打開及刪除。
+    每個搜尋保存規範形式、上次的結果（學校名稱，跨數據版本穩定）及計算時的數據指紋。
+    數據更新後 refresh 一次批量重新計算所有搜尋，並記錄新增及減少的學校。
+
+    多個進程可能同時使用同一文件：每次修改都在文件鎖內重新讀取文件、修改後寫回，
+    不會覆蓋其他進程的修改。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.lock_path = self.path.with_suffix(self.path.suffix + '.lock')
+
+    def _read(self) -> List[Dict[str, Any]]:
+        if not self.path.exists():
+            return []
+        try:
+            return json.loads(self.path.read_text(encoding='utf-8'))['searches']
+        except (ValueError, KeyError):
+            return []
+
+    def _write(self, searches: List[Dict[str, Any]]):
+        # 調用者需持有文件鎖；先寫臨時文件再替換，避免讀取時讀到寫了一半的文件
+        payload = json.dumps({'searches': searches}, ensure_ascii=False, indent=1)
+        tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        tmp_path.write_text(payload, encoding='utf-8')
+        tmp_path.replace(self.path)
+
+    def __len__(self) -> int:
+        return len(self._read())
+
+    def list(self, owner: str) -> List[Dict[str, Any]]:
+        """擁有者的所有搜尋（按保存次序）"""
+        key = owner_key(owner)
+        return [search for search in self._read() if search.get('owner') == key]
+
+    def add(
+        self,
+        owner: str,
+        name: str,
+        filters: Dict[str, Any],
+        results: List[Dict[str, Any]],
+        version: str
+    ) -> Dict[str, Any]:
+        """保存一個搜尋；擁有者已保存相同條件的搜尋時只更新名稱及結果
+
+        Args:
+            owner: 擁有者標記
+            name: 顯示名稱
+            filters: 篩選條件（會轉換為規範形式）
+            results: 當前數據下的結果，作為之後比較的基準
+            version: 當前數據的 dataset_fingerprint
+        """
+        key = owner_key(owner)
+        spec = canonical_spec(filters)
+        search_id = hashlib.sha256((key + spec_key(spec)).encode('utf-8')).hexdigest()[:12]
+        search = {
+            'id': search_id,
+            'owner': key,
+            'name': name.strip() or describe_spec(spec),
+            'spec': spec,
+            'results': _names(results),
+            'version': version,
+            'added': [],
+            'removed': [],
+        }
+        with _file_lock(self.lock_path):
+            self._write([s for s in self._read() if s['id'] != search_id] + [search])
+        return dict(search)
+
+    def remove(self, owner: str, search_id: str):
+        """刪除擁有者的一個搜尋（其他擁有者的搜尋不受影響）"""
+        key = owner_key(owner)
+        with _file_lock(self.lock_path):
+            self._write([
+                s for s in self._read()
+                if not (s['id'] == search_id and s.get('owner') == key)
+            ])
+
+    def refresh(
+        self,
+        schools: List[Dict[str, Any]],
+        version: str,
+        backend=None,
+        **indexes
+    ) -> List[Dict[str, Any]]:
+        """用新版本的數據批量重新計算所有擁有者未按此版本計算的搜尋
+
+        Args:
+            schools: 學校列表（使用 backend 時不需要，可以為空列表）
+            version: 數據集的內容指紋
+            backend: SQLiteSchoolStore；設置時每個搜尋直接由 SQLite 篩選，不需要內存中的學校列表
+            indexes: 傳給 apply_filters 的預建索引
+
+        Returns:
+            結果有改變的搜尋（包含 'added' 及 'removed'）
+        """
+        with _file_lock(self.lock_path):
+            searches = self._read()
+            stale = [search for search in searches if search.get('version') != version]
+            if not stale:
+                return []
+            specs = [search['spec'] for search in stale]
+            if backend is not None:
+                results = [backend.apply_filters(spec, ['學校名稱']) for spec in specs]
+            else:
+                results = evaluate_searches(schools, specs, **indexes)
+            changed = []
+            for search, schools_found in zip(stale, results):
+                names = _names(schools_found)
+                previous = set(search.get('results') or [])
+                current = set(names)
+                search['added'] = [name for name in names if name not in previous]
+                search['removed'] = [name for name in search.get('results') or [] if name not in current]
+                search['results'] = names
+                search['version'] = version
+                if search['added'] or search['removed']:
+                    changed.append(dict(search))
+            self._write(searches)
+            return changed
+
+def main(argv: Optional[List[str]] = None):
+    from .csv_parser import load_schools
+    from .feature_query import FeatureIndex
+    from .tags import POPULAR_TAGS, TagIndex
+    from .flags import FlagIndex
+    from .geo import GeoIndex
+    from .entities import EntityIndex
+
+    parser = argparse.ArgumentParser(description='數據更新後批量重新計算保存的搜尋，列出結果有改變的搜尋')
+    parser.add_argument('csv', type=Path, help='本學年學校資料 CSV 文件')
+    parser.add_argument('--store', type=Path, default=Path(__file__).parent.parent / '.cache' / 'saved_searches.json',
+                        help='保存的搜尋文件')
+    args = parser.parse_args(argv)
+
+    schools = load_schools(args.csv, HOT_FIELDS)
+    store = SavedSearchStore(args.store)
+    started = time.perf_counter()
+    changed = store.refresh(
+        schools,
+        dataset_fingerprint(schools),
+        index=FeatureIndex(schools),
+        tag_index=TagIndex(schools, POPULAR_TAGS),
+        flag_index=FlagIndex(schools),
+        geo_index=GeoIndex(schools),
+        entity_index=EntityIndex(schools)
+    )
+    print(f"{len(store)} 個搜尋，{len(changed)} 個結果有改變（{time.perf_counter() - started:.2f}s）")
+    for search in changed:
+        print(f"  {search['name']}: +{len(search['added'])} -{len(search['removed'])}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Iterable
+
+# 會話閒置多久後清除其派生數據（秒）
+IDLE_TIMEOUT = 15 * 60
+
+# 每個會話派生數據（結果緩存等）的內存預算（字節），超出時清除最久未用的項目
+SESSION_BUDGET = 256 * 1024
+
+def deep_size(value: Any, shared: Iterable[int] = (), seen: Optional[set] = None) -> int:
+    """估計對象及其包含的所有對象佔用的字節數
+
+    Args:
+        value: 要估計的對象（dict / list / tuple / set 會遞歸計算）
+        shared: 所有會話共用的對象的 id()，這些對象不計入（例如共用的學校列表）
+        seen: 已計算的對象 id()，同一對象只計算一次
+    """
+    if seen is None:
+        seen = set(shared)
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += deep_size(key, seen=seen) + deep_size(item, seen=seen)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += deep_size(item, seen=seen)
+    elif isinstance(value, SessionCache):
+        size += value.nbytes
+    return size
+
+class SessionCache:
+    """一個會話的派生數據（可以隨時清除並重新計算的數據，例如篩選結果）
+
+    按最近使用次序保存，總大小超出預算時清除最久未用的項目；
+    會話閒置超時後由 SessionRegistry.sweep 整個清除，使用時取不到再重新計算。
+    """
+
+    def __init__(self, budget: int = SESSION_BUDGET):
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Any, tuple]' = OrderedDict()
+        self.nbytes = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Any) -> Any:
+        """讀取派生數據；不存在（未計算或已被清除）時返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Any, value: Any, shared: Iterable[int] = ()):
+        """保存派生數據；超出預算時清除最久未用的項目（最新的項目總會保留）"""
+        size = deep_size(value, shared)
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.budget and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+
+    def clear(self) -> int:
+        """清除所有派生數據，返回釋放的字節數"""
+        with self._lock:
+            freed = self.nbytes
+            self.evictions += len(self._entries)
+            self._entries.clear()
+            self.nbytes = 0
+            return freed
+
+class SessionRegistry:
+    """所有會話的內存統計及閒置清除（所有會話共用一個）
+
+    每次腳本運行時 touch 一次，記錄會話狀態的大小及最後活動時間；
+    sweep 清除閒置超時會話的派生數據。只保存派生數據的弱引用，
+    Streamlit 丟棄已關閉的會話後，對應記錄會自動消失。
+    """
+
+    def __init__(self, idle_timeout: float = IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+
+    def touch(self, session_id: str, cache: SessionCache, state_bytes: int, now: Optional[float] = None):
+        """記錄會話的一次活動"""
+        with self._lock:
+            self._sessions[session_id] = {
+                'cache': weakref.ref(cache),
+                'state_bytes': state_bytes,
+                'last_active': time.monotonic() if now is None else now,
+            }
+
+    def _live(self) -> List[tuple]:
+        # 調用者需持有鎖；順便移除已被丟棄的會話
+        live = []
+        for session_id, record in list(self._sessions.items()):
+            cache = record['cache']()
+            if cache is None:
+                del self._sessions[session_id]
+            else:
+                live.append((session_id, record, cache))
+        return live
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """清除閒置超過 idle_timeout 的會話的派生數據，返回釋放的字節數"""
+        now = time.monotonic() if now is None else now
+        freed = 0
+        with self._lock:
+            for _, record, cache in self._live():
+                if now - record['last_active'] >= self.idle_timeout and len(cache):
+                    freed += cache.clear()
+        return freed
+
+    def report(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """每個會話的內存統計，按總字節數降序
+
+        Returns:
+            [{'session', 'state_bytes', 'derived_bytes', 'idle_seconds', 'evictions'}, ...]；
+            state_bytes 為上次活動時會話狀態的大小（不含共用對象及派生數據）
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            rows = [
+                {
+                    'session': session_id,
+                    'state_bytes': record['state_bytes'],
+                    'derived_bytes': cache.nbytes,
+                    'idle_seconds': now - record['last_active'],
+                    'evictions': cache.evictions,
+                }
+                for session_id, record, cache in self._live()
+            ]
+        return sorted(rows, key=lambda row: -(row['state_bytes'] + row['derived_bytes']))
+
+    def total_bytes(self) -> int:
+        """所有會話的狀態及派生數據總字節數"""
+        return sum(row['state_bytes'] + row['derived_bytes'] for row in self.report())
@@ -0,0 +1,494 @@
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple, TYPE_CHECKING
+
+from .csv_parser import load_schools
+from .store import compute_changes, load_changes
+from .fields import FACET_FIELDS, SEARCH_FIELDS, SCOPED_SEARCH_FIELDS, LOADED_FIELDS
+from .filters import feature_filter_query, get_filter_options
+from .flags import pack_flags, required_flags
+from .entities import LINK_FIELDS, entity_key, split_names
+from .geo import KM_PER_DEGREE_LAT, KM_PER_DEGREE_LNG, geocode, place_location
+from .sorting import extract_school_net_number
+
+if TYPE_CHECKING:
+    from .analytics import FacetCube
+
+# 文件格式改動時遞增，舊文件會被重建
+SCHEMA_VERSION = 8
+
+# 沒有提供年度時，學校數據的年度標籤
+CURRENT_LABEL = '本學年'
+
+def _plain(value: Any) -> Any:
+    """numpy 標量轉為 Python 值（sqlite3 不接受 numpy 類型）"""
+    return value.item() if hasattr(value, 'item') else value
+
+def _quote(name: str) -> str:
+    """SQL 標識符（欄位名稱為中文，需要加引號）"""
+    return '"' + name.replace('"', '""') + '"'
+
+def _placeholders(values: List[Any]) -> str:
+    return ', '.join('?' for _ in values)
+
+# 按地址估計的學校座標列（無法定位時為 NULL），可以與欄位一起讀取，用於顯示距離
+LOCATION_COLUMNS = ['lat', 'lng']
+
+# 提取篩選選項需要的欄位
+OPTION_FIELDS = ['區域', '小一學校網', '學校類別1', '學生性別', '宗教', '教學語言', '辦學團體'] + list(LINK_FIELDS.values())
+
+# 按學校 ID 讀取時每條 SQL 的 ID 數目（低於 SQLite 的參數數目上限）
+ID_BATCH_SIZE = 500
+
+# 每個進程最多打開的只讀連接數（連接池大小）
+POOL_SIZE = 4
+
+# 特色文本索引中每個欄位一列；不限欄位的搜索只搜 SEARCH_FIELDS 連接起來的文本
+TEXT_FIELDS = SEARCH_FIELDS + SCOPED_SEARCH_FIELDS
+
+def _text_column(field: Optional[str]) -> str:
+    """特色文本索引中的列：text 為 SEARCH_FIELDS 連接起來的文本，f0、f1... 對應 TEXT_FIELDS"""
+    if field is None:
+        return 'text'
+    return f"f{TEXT_FIELDS.index(field)}"
+
+class SQLiteSchoolStore:
+    """以 SQLite 文件保存學校數據，篩選、特色搜索及排序在一條 SQL 中完成
+
+    單值篩選欄位建有索引，校網、辦學團體及關聯中學拆成關聯表（名稱保存為規範鍵），特色搜索使用 FTS5
+    的 trigram 索引。每條查詢從連接池借出一個只讀連接，不同會話的查詢可以同時執行；連接在查詢結束後
+    歸還，不綁定線程（Streamlit 每次重新運行都在新的線程中執行），每個進程最多打開 POOL_SIZE 個連接。
+    多個進程可以共用同一個文件。
+
+    除篩選外也提供與 SchoolStore 相同的 select / get_details / get_changes 及 labels，導出、比較表、
+    詳細資料及數據分析可以直接使用。學校數據只有最新年度；「與上學年比較」的變化及每個年度的分析數據立方
+    在建立文件時預先計算並保存，讀取時不需要歷年數據。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        # 空閒的連接、已打開的連接數及其所屬進程
+        self._available = threading.Condition()
+        self._idle: List[sqlite3.Connection] = []
+        self._opened = 0
+        self._pid: Optional[int] = None
+        meta = dict(self._execute('SELECT key, value FROM meta'))
+        if int(meta.get('schema_version', 0)) != SCHEMA_VERSION:
+            raise ValueError(f"Unsupported school database version: {self.path}")
+        self.fields: List[str] = json.loads(meta['fields'])
+        self._labels: List[str] = json.loads(meta['labels'])
+        self._cell_columns: List[str] = json.loads(meta['cell_columns'])
+
+    def _acquire(self) -> sqlite3.Connection:
+        """借出一個空閒連接；沒有空閒連接時打開新連接，已達 POOL_SIZE 時等待歸還"""
+        with self._available:
+            # fork 出來的子進程不使用父進程的連接
+            if self._pid != os.getpid():
+                self._idle, self._opened, self._pid = [], 0, os.getpid()
+            while not self._idle and self._opened >= POOL_SIZE:
+                self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._opened += 1
+        try:
+            return sqlite3.connect(f"{self.path.absolute().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        except sqlite3.Error:
+            with self._available:
+                self._opened -= 1
+                self._available.notify()
+            raise
+
+    def _release(self, connection: sqlite3.Connection):
+        with self._available:
+            self._idle.append(connection)
+            self._available.notify()
+
+    def _execute(self, sql: str, params: List[Any] = ()) -> List[tuple]:
+        """借出一個只讀連接執行查詢並讀取所有行"""
+        connection = self._acquire()
+        try:
+            return connection.execute(sql, params).fetchall()
+        finally:
+            self._release(connection)
+
+    def __len__(self) -> int:
+        return self._execute('SELECT COUNT(*) FROM schools')[0][0]
+
+    @property
+    def labels(self) -> List[str]:
+        """建立文件時的所有年度標籤（由舊到新）"""
+        return list(self._labels)
+
+    @property
+    def latest(self) -> Optional[str]:
+        """最新年度標籤"""
+        return self._labels[-1] if self._labels else None
+
+    def get_changes(self, school_id: Any) -> Dict[str, Tuple[Any, Any]]:
+        """最新年度一所學校相對上一年度的變化（與 SchoolStore.get_changes 相同）"""
+        rows = self._execute(
+            'SELECT label, old_value, new_value FROM school_changes WHERE school_id = ? ORDER BY position',
+            [int(school_id)]
+        )
+        return {label: (old_value, new_value) for label, old_value, new_value in rows}
+
+    def get_facet_cube(self, label: Optional[str] = None) -> 'FacetCube':
+        """指定年度（默認最新年度）的分析數據立方，從保存的格子還原"""
+        import pandas as pd
+        from .analytics import FacetCube
+        columns = self._cell_columns
+        rows = self._execute(
+            f"SELECT {', '.join(_quote(column) for column in columns)} FROM facet_cells "
+            f"WHERE label = ? ORDER BY position",
+            [label or self.latest]
+        )
+        return FacetCube.from_cells(pd.DataFrame(rows, columns=columns))
+
+    def _columns(self, columns: Optional[List[str]]) -> List[str]:
+        columns = [field for field in (columns or self.fields) if field in self.fields or field in LOCATION_COLUMNS]
+        return columns if 'id' in columns else ['id'] + columns
+
+    def _select(
+        self,
+        columns: Optional[List[str]],
+        where: str = '',
+        params: List[Any] = None,
+        order: str = '',
+        order_params: List[Any] = None
+    ) -> List[Dict[str, Any]]:
+        columns = self._columns(columns)
+        sql = f"SELECT {', '.join(_quote(column) for column in columns)} FROM schools"
+        if where:
+            sql += f" WHERE {where}"
+        sql += f" ORDER BY {order + ', ' if order else ''}sort_net, {_quote('學校名稱')}, id"
+        rows = self._execute(sql, (params or []) + (order_params or []))
+        return [dict(zip(columns, row)) for row in rows]
+
+    def get_schools(self, school_ids: List[Any], columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """按 school_ids 的順序讀取學校；不存在的 ID 會被跳過
+
+        Args:
+            columns: 讀取的欄位（可包括 LOCATION_COLUMNS）；None 表示所有欄位
+        """
+        columns = self._columns(columns)
+        id_position = columns.index('id')
+        found = {}
+        for start in range(0, len(school_ids), ID_BATCH_SIZE):
+            batch = [int(school_id) for school_id in school_ids[start:start + ID_BATCH_SIZE]]
+            sql = (
+                f"SELECT {', '.join(_quote(column) for column in columns)} FROM schools "
+                f"WHERE id IN ({_placeholders(batch)})"
+            )
+            for row in self._execute(sql, batch):
+                found[row[id_position]] = dict(zip(columns, row))
+        return [found[school_id] for school_id in school_ids if school_id in found]
+
+    def select(self, school_ids: List[Any], fields: List[str], label: Optional[str] = None) -> Dict[str, List[Any]]:
+        """按列讀取指定學校的指定欄位（與 SchoolStore.select 相同；SQLite 文件只有最新年度）
+
+        Returns:
+            欄位 -> 按 school_ids 順序排列的值列表；文件中沒有的欄位不會返回
+        """
+        fields = [field for field in fields if field in self.fields]
+        rows = self.get_schools(school_ids, fields)
+        return {field: [row[field] for row in rows] for field in fields}
+
+    def get_details(self, school_id: Any) -> Dict[str, Any]:
+        """一所學校的所有欄位；不存在時返回空字典"""
+        rows = self.get_schools([school_id])
+        return rows[0] if rows else {}
+
+    def get_filter_options(self) -> Dict[str, List[str]]:
+        """篩選選項（與 filters.get_filter_options 相同），只讀取需要的欄位"""
+        return get_filter_options(self._select(OPTION_FIELDS))
+
+    def load_schools(self, columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """讀取所有學校（已排序）
+
+        Args:
+            columns: 只讀取這些欄位；None 表示讀取所有欄位
+        """
+        return self._select(columns)
+
+    def apply_filters(
+        self,
+        filters: Dict[str, Any],
+        columns: Optional[List[str]] = None,
+        by_distance: bool = False
+    ) -> List[Dict[str, Any]]:
+        """篩選並排序學校，篩選條件與 filters.apply_filters 相同
+
+        Args:
+            filters: 篩選條件字典
+            columns: 返回的欄位（可包括 LOCATION_COLUMNS）；None 表示所有欄位
+            by_distance: 選擇了附近地點時按距離由近到遠排列（與 GeoIndex.sort 相同，
+                無法定位的學校在最後，距離相同時按校網、學校名稱）
+
+        Returns:
+            篩選並按校網、學校名稱（或距離）排序後的學校列表
+        """
+        conditions = []
+        params = []
+
+        # 學校名稱搜索
+        query = str(filters.get('search_query') or '').lower().strip()
+        if query:
+            conditions.append('instr(name_lower, ?) > 0')
+            params.append(query)
+
+        for key, column in FACET_FIELDS.items():
+            values = filters.get(key) or []
+            if values:
+                conditions.append(f"{_quote(column)} IN ({_placeholders(values)})")
+                params.extend(values)
+
+        # 校網、辦學團體及關聯中學（一所學校可以有多個）；辦學團體及中學按規範鍵比較
+        for key, table, column, normalize in [
+            ('校網', 'school_networks', 'net', str),
+            ('辦學團體', 'school_bodies', 'body', entity_key),
+            ('關聯學校', 'school_links', 'kind', str),
+            ('關聯中學', 'school_links', 'secondary', entity_key),
+        ]:
+            values = [normalize(value) for value in filters.get(key) or []]
+            if values:
+                conditions.append(f"id IN (SELECT school_id FROM {table} WHERE {column} IN ({_placeholders(values)}))")
+                params.extend(values)
+
+        # 課業安排及校車、家校組織：全部符合
+        required = required_flags(filters)
+        if required:
+            conditions.append('(policy_flags & ?) = ?')
+            params.extend([required, required])
+
+        # 學校特色搜索及特色標籤：語法樹編譯為 SQL 條件
+        feature_query = feature_filter_query(filters)
+        if feature_query is not None:
+            conditions.append(self._compile(feature_query, params))
+
+        # 距離篩選：與 GeoIndex 相同的平面距離公式；最近 k 所在符合其他條件的學校中選取
+        center = place_location(filters.get('附近地點')) if filters.get('附近地點') else None
+        km = filters.get('距離')
+        k = filters.get('最近數目')
+        distance = '((lat - ?) * ?) * ((lat - ?) * ?) + ((lng - ?) * ?) * ((lng - ?) * ?)'
+        distance_params = []
+        if center is not None:
+            lat, lng = center
+            distance_params = [lat, KM_PER_DEGREE_LAT] * 2 + [lng, KM_PER_DEGREE_LNG] * 2
+        if center is not None and (km or k):
+            conditions.append('lat IS NOT NULL')
+            if km:
+                conditions.append(f'{distance} <= ?')
+                params.extend(distance_params + [float(km) * float(km)])
+            if k:
+                inner = ' AND '.join(conditions)
+                conditions = [f'id IN (SELECT id FROM schools WHERE {inner} ORDER BY {distance}, id LIMIT ?)']
+                params.extend(distance_params + [int(k)])
+
+        if by_distance and center is not None:
+            return self._select(columns, ' AND '.join(conditions), params, f'lat IS NULL, {distance}', distance_params)
+        return self._select(columns, ' AND '.join(conditions), params)
+
+    def _compile(self, node, params: List[Any]) -> str:
+        """把特色查詢語法樹編譯為 SQL 條件，參數追加到 params"""
+        kind = node[0]
+        if kind == 'term':
+            _, field, text = node
+            column = _text_column(field)
+            # trigram 索引只能用於三個字符或以上的查詢
+            if len(text) >= 3:
+                params.append(f'{column} : "' + text.replace('"', '""') + '"')
+                return 'id IN (SELECT rowid FROM school_text WHERE school_text MATCH ?)'
+            params.append(text)
+            return f'id IN (SELECT rowid FROM school_text WHERE instr({column}, ?) > 0)'
+        if kind == 'not':
+            return f"NOT ({self._compile(node[1], params)})"
+        joiner = ' AND ' if kind == 'and' else ' OR '
+        return '(' + joiner.join(self._compile(child, params) for child in node[1]) + ')'
+
+    def close(self):
+        """關閉空閒的連接（借出中的連接歸還後仍可使用）"""
+        with self._available:
+            for connection in self._idle:
+                connection.close()
+            self._opened -= len(self._idle)
+            self._idle = []
+
+def build_sqlite_store(
+    path: Path,
+    schools: List[Dict[str, Any]],
+    fields: List[str],
+    versions: Optional[Dict[str, Path]] = None
+) -> SQLiteSchoolStore:
+    """把學校數據寫入 SQLite 文件
+
+    Args:
+        path: 輸出文件路徑
+        schools: 最新年度的學校列表（需包含 'id'）
+        fields: 要寫入的欄位
+        versions: 年度標籤 -> CSV 路徑（由舊到新，最後一個為 schools 的來源），用於計算「與上學年比較」
+            及每個年度的分析數據立方；None 表示只有 schools 一個年度（標籤為 CURRENT_LABEL）
+
+    Returns:
+        打開的 SQLiteSchoolStore
+    """
+    from .analytics import ANALYTICS_FIELDS, FacetCube
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fields = ['id'] + [field for field in fields if field != 'id']
+
+    # 變化及分析數據立方在這裡一次計算；往年的 CSV 只讀取需要的欄位，不建立 SchoolStore
+    if versions:
+        changes = load_changes(versions)
+        labels = list(versions)
+        cubes = {
+            label: FacetCube(schools if label == labels[-1] else load_schools(source, ANALYTICS_FIELDS)).cells
+            for label, source in versions.items()
+        }
+    else:
+        changes = {schools[row]['id']: change for row, change in compute_changes(None, schools).items()}
+        labels = [CURRENT_LABEL]
+        cubes = {CURRENT_LABEL: FacetCube(schools).cells}
+    cell_columns = list(cubes[labels[-1]].columns)
+
+    # 先寫臨時文件再替換，避免其他進程讀到寫了一半的文件
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    tmp_path.unlink(missing_ok=True)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        # 欄位不聲明類型，整數、小數和文字按原樣保存
+        columns = ', '.join(_quote(field) for field in fields[1:])
+        text_columns = ', '.join(_text_column(field) for field in TEXT_FIELDS)
+        connection.executescript(f'''
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE schools (id INTEGER PRIMARY KEY, sort_net INTEGER, name_lower TEXT, policy_flags INTEGER, lat REAL, lng REAL, {columns});
+            CREATE TABLE school_networks (net TEXT, school_id INTEGER);
+            CREATE TABLE school_bodies (body TEXT, school_id INTEGER);
+            CREATE TABLE school_links (secondary TEXT, kind TEXT, school_id INTEGER);
+            CREATE VIRTUAL TABLE school_text USING fts5(text, {text_columns}, tokenize="trigram case_sensitive 1");
+            CREATE TABLE school_changes (school_id INTEGER, position INTEGER, label TEXT, old_value, new_value);
+            CREATE TABLE facet_cells (label TEXT, position INTEGER, {', '.join(_quote(column) for column in cell_columns)});
+        ''')
+        connection.executemany('INSERT INTO meta VALUES (?, ?)', [
+            ('schema_version', str(SCHEMA_VERSION)),
+            ('fields', json.dumps(fields, ensure_ascii=False)),
+            ('labels', json.dumps(labels, ensure_ascii=False)),
+            ('cell_columns', json.dumps(cell_columns, ensure_ascii=False)),
+        ])
+        connection.executemany('INSERT INTO school_changes VALUES (?, ?, ?, ?, ?)', [
+            (int(school_id), position, label, old_value, new_value)
+            for school_id, school_changes in changes.items()
+            for position, (label, (old_value, new_value)) in enumerate(school_changes.items())
+        ])
+        for label, cells in cubes.items():
+            connection.executemany(
+                f"INSERT INTO facet_cells VALUES ({_placeholders(cell_columns + [None, None])})",
+                [[label, position] + [_plain(value) for value in row]
+                 for position, row in enumerate(cells[cell_columns].itertuples(index=False))]
+            )
+
+        insert = (
+            f"INSERT INTO schools (id, sort_net, name_lower, policy_flags, lat, lng, {columns}) "
+            f"VALUES ({_placeholders(fields + [None] * 5)})"
+        )
+        for school in schools:
+            school_id = int(school['id'])
+            located = geocode(school.get('學校地址', ''), school.get('區域', ''))
+            connection.execute(insert, [
+                school_id,
+                extract_school_net_number(school.get('小一學校網', '')),
+                str(school.get('學校名稱', '')).lower(),
+                pack_flags(school),
+            ] + list(located[:2] if located else (None, None)) + [school.get(field, '-') for field in fields[1:]])
+
+            school_net = str(school.get('小一學校網', '')).strip()
+            if school_net and school_net not in ['/', '-']:
+                connection.executemany('INSERT INTO school_networks VALUES (?, ?)', [
+                    (net.strip(), school_id) for net in school_net.split('/')
+                ])
+
+            connection.executemany('INSERT INTO school_bodies VALUES (?, ?)', [
+                (key, school_id) for key in {entity_key(name) for name in split_names(school.get('辦學團體'))} if key
+            ])
+            for kind, field in LINK_FIELDS.items():
+                connection.executemany('INSERT INTO school_links VALUES (?, ?, ?)', [
+                    (key, kind, school_id) for key in {entity_key(name) for name in split_names(school.get(field))} if key
+                ])
+
+            texts = [str(school.get(field, '')) for field in TEXT_FIELDS]
+            connection.execute(
+                f"INSERT INTO school_text (rowid, text, {text_columns}) VALUES ({_placeholders(texts + [None, None])})",
+                [school_id, ' '.join(texts[:len(SEARCH_FIELDS)]).lower()] + [text.lower() for text in texts]
+            )
+
+        statements = [f"CREATE INDEX idx_sort ON schools (sort_net, {_quote('學校名稱')}, id)",
+                      'CREATE INDEX idx_changes ON school_changes (school_id)',
+                      'CREATE INDEX idx_cells ON facet_cells (label)',
+                      'CREATE INDEX idx_networks ON school_networks (net)',
+                      'CREATE INDEX idx_bodies ON school_bodies (body)',
+                      'CREATE INDEX idx_links_secondary ON school_links (secondary)',
+                      'CREATE INDEX idx_links_kind ON school_links (kind)']
+        for column in FACET_FIELDS.values():
+            if column in fields:
+                statements.append(f"CREATE INDEX {_quote('idx_' + column)} ON schools ({_quote(column)})")
+        for statement in statements:
+            connection.execute(statement)
+        connection.commit()
+    finally:
+        connection.close()
+    tmp_path.replace(path)
+
+    return SQLiteSchoolStore(path)
+
+def open_sqlite_store(
+    path: Path,
+    fields: List[str],
+    versions: Optional[Dict[str, Path]] = None
+) -> Optional[SQLiteSchoolStore]:
+    """打開已有的 SQLite 存儲
+
+    如果文件不存在、版本不對、欄位不同、年度與 versions 不同或比任何來源 CSV 舊，返回 None。
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    mtime = path.stat().st_mtime
+    if any(Path(source).stat().st_mtime > mtime for source in (versions or {}).values()):
+        return None
+    try:
+        store = SQLiteSchoolStore(path)
+    except (ValueError, KeyError, sqlite3.Error):
+        return None
+    if store.fields != ['id'] + [field for field in fields if field != 'id'] or \
+            (versions is not None and store.labels != list(versions)):
+        store.close()
+        return None
+    return store
+
+def build_from_csv(path: Path, versions: Dict[str, Path], fields: List[str]) -> SQLiteSchoolStore:
+    """從 CSV 建立 SQLite 存儲：最新年度寫入學校數據，往年只用於計算變化及分析數據立方"""
+    return build_sqlite_store(path, load_schools(list(versions.values())[-1], fields), fields, versions)
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='把學校資料 CSV 轉換為 SQLite 存儲')
+    parser.add_argument('csv', type=Path, help='本學年學校資料 CSV 文件')
+    parser.add_argument('--history', type=Path, help='歷年數據目錄（文件名即年度標籤）')
+    parser.add_argument('--out', type=Path, default=Path(__file__).parent.parent / '.cache' / 'schools.sqlite',
+                        help='輸出文件')
+    args = parser.parse_args(argv)
+
+    versions = {}
+    if args.history and args.history.exists():
+        for path in sorted(args.history.glob('*.csv')):
+            versions[path.stem] = path
+    versions[CURRENT_LABEL] = args.csv
+
+    store = build_from_csv(args.out, versions, LOADED_FIELDS)
+    print(f"寫入 {len(store)} 所學校（年度：{'、'.join(store.labels)}）-> {args.out}")
+
+if __name__ == '__main__':
+    main()
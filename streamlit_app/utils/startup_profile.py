@@ -0,0 +1,158 @@
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+APP_PATH = Path(__file__).parent.parent / "app.py"
+CSV_PATH = Path(__file__).parent.parent.parent / "attached_assets" / "database_school_info_1763020452726.csv"
+
+# 冷啟動渲染第一頁時不應加載的模組（只在比較、分析、詳細資料頁或簡體界面需要）
+HEAVY_MODULES = ['pandas', 'numpy', 'opencc', 'PIL']
+
+# 默認預算（秒），按 CI 機器留有餘量
+IMPORT_BUDGET = 1.0
+RENDER_BUDGET = 2.5
+
+# 在全新的 Python 進程中運行：導入 streamlit，再用 AppTest 渲染第一頁並重新運行一次
+CHILD_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import streamlit
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+app.run()
+rendered = time.perf_counter()
+modules = [name for name in json.loads(sys.argv[2]) if name in sys.modules]
+app.run()
+rerun = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'first_render': rendered - imported,
+    'rerun': rerun - rendered,
+    'errors': [str(e.value) for e in app.exception],
+    'heavy_modules': modules,
+}))
+'''
+
+def _parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """解析 -X importtime 的輸出，返回頂層導入 [{'module', 'seconds'}, ...]"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2][1:]
+        # 縮進表示被其他模組導入，只統計頂層導入
+        if name.startswith(' '):
+            continue
+        imports.append({'module': name.strip(), 'seconds': int(parts[1]) / 1e6})
+    return imports
+
+def run_once(app_path: Path = APP_PATH) -> Dict[str, Any]:
+    """在新進程中測量一次冷啟動"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT, str(app_path), json.dumps(HEAVY_MODULES)],
+        capture_output=True,
+        text=True,
+        cwd=str(Path(app_path).parent),
+        check=True
+    )
+    measurement = json.loads(result.stdout.strip().splitlines()[-1])
+    measurement['imports'] = _parse_importtime(result.stderr)
+    return measurement
+
+def profile_startup(app_path: Path = APP_PATH, runs: int = 3) -> Dict[str, Any]:
+    """測量冷啟動時間（取多次的中位數）
+
+    先運行一次建立快照、詳細資料存儲等緩存文件，之後每次都是全新進程，
+    對應生產環境中新 worker 啟動的情況。
+    """
+    run_once(app_path)
+    measurements = [run_once(app_path) for _ in range(max(runs, 1))]
+    slowest: Dict[str, float] = {}
+    for measurement in measurements:
+        for entry in measurement['imports']:
+            slowest[entry['module']] = max(slowest.get(entry['module'], 0.0), entry['seconds'])
+    return {
+        'runs': len(measurements),
+        'import': statistics.median(m['import'] for m in measurements),
+        'first_render': statistics.median(m['first_render'] for m in measurements),
+        'rerun': statistics.median(m['rerun'] for m in measurements),
+        'errors': sorted({error for m in measurements for error in m['errors']}),
+        'heavy_modules': sorted({name for m in measurements for name in m['heavy_modules']}),
+        'imports': sorted(slowest.items(), key=lambda item: -item[1]),
+    }
+
+def memory_profile(csv_path: Path = CSV_PATH) -> Dict[str, Any]:
+    """常駐內存欄位（HOT_FIELDS）的內存佔用，按字節數降序
+
+    在當前進程中解析 CSV（會導入 pandas），不影響冷啟動的測量。
+
+    Returns:
+        {'total': 總字節數, 'columns': [(欄位, {'bytes', 'cells', 'distinct'}), ...]}
+    """
+    from .csv_parser import load_schools, column_memory_usage
+    from .fields import HOT_FIELDS
+
+    usage = column_memory_usage(load_schools(csv_path, HOT_FIELDS))
+    return {
+        'total': sum(column['bytes'] for column in usage.values()),
+        'columns': sorted(usage.items(), key=lambda item: -item[1]['bytes']),
+    }
+
+def check_budget(
+    profile: Dict[str, Any],
+    import_budget: float = IMPORT_BUDGET,
+    render_budget: float = RENDER_BUDGET
+) -> List[str]:
+    """返回超出預算的項目；空列表表示全部通過"""
+    problems = []
+    if profile['import'] > import_budget:
+        problems.append(f"導入時間 {profile['import']:.2f}s 超過預算 {import_budget:.2f}s")
+    if profile['first_render'] > render_budget:
+        problems.append(f"首次渲染 {profile['first_render']:.2f}s 超過預算 {render_budget:.2f}s")
+    if profile['heavy_modules']:
+        problems.append(f"首次渲染加載了 {', '.join(profile['heavy_modules'])}")
+    if profile['errors']:
+        problems.append(f"首次渲染出錯：{'; '.join(profile['errors'])}")
+    return problems
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='測量應用冷啟動的導入及首次渲染時間，超出預算時返回非零狀態')
+    parser.add_argument('--app', type=Path, default=APP_PATH, help='應用腳本')
+    parser.add_argument('--runs', type=int, default=3, help='測量次數（取中位數）')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET, help='導入 streamlit 的預算（秒）')
+    parser.add_argument('--render-budget', type=float, default=RENDER_BUDGET, help='首次渲染的預算（秒）')
+    parser.add_argument('--top', type=int, default=10, help='列出最慢的頂層導入及佔用內存最多的欄位數目')
+    parser.add_argument('--csv', type=Path, default=CSV_PATH, help='統計欄位內存佔用的學校資料 CSV 文件')
+    parser.add_argument('--no-memory', action='store_true', help='不統計欄位內存佔用')
+    args = parser.parse_args(argv)
+
+    profile = profile_startup(args.app, args.runs)
+    print(f"導入 streamlit: {profile['import']:.3f}s（預算 {args.import_budget:.2f}s）")
+    print(f"首次渲染:      {profile['first_render']:.3f}s（預算 {args.render_budget:.2f}s）")
+    print(f"重新運行:      {profile['rerun']:.3f}s")
+    print(f"重型模組:      {', '.join(profile['heavy_modules']) or '無'}")
+    print("最慢的頂層導入:")
+    for module, seconds in profile['imports'][:args.top]:
+        print(f"  {seconds:7.3f}s  {module}")
+    if not args.no_memory and args.csv.exists():
+        memory = memory_profile(args.csv)
+        print(f"常駐欄位內存:  {memory['total'] / 1024:.0f} KB，佔用最多的欄位:")
+        for field, column in memory['columns'][:args.top]:
+            print(f"  {column['bytes'] / 1024:7.1f} KB  {field}（{column['distinct']}/{column['cells']} 個不重複對象）")
+
+    problems = check_budget(profile, args.import_budget, args.render_budget)
+    for problem in problems:
+        print(f"[超出預算] {problem}")
+    return 1 if problems else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,299 @@
+
+import argparse
+import hashlib
+import html
+import json
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+from .i18n import convert_text
+from .sorting import sort_schools
+from .store import load_store, record_hash, school_key, unique_keys
+
+# 詳細資料頁的分頁及欄位（與 app.py 的 render_school_detail 一致）
+DETAIL_SECTIONS = [
+    ('基本資料', [
+        ('區域', '區域'),
+        ('校網', '小一學校網'),
+        ('類型', '學校類別1'),
+        ('性別', '學生性別'),
+        ('宗教', '宗教'),
+        ('教學語言', '教學語言'),
+        ('辦學團體', '辦學團體'),
+    ]),
+    ('設施', [
+        ('特別室', '特別室'),
+        ('其他學校設施', '其他學校設施'),
+        ('支援有特殊教育需要學生的設施', '支援有特殊教育需要學生的設施'),
+    ]),
+    ('聯絡', [
+        ('地址', '學校地址'),
+        ('電話', '學校電話'),
+        ('電郵', '學校電郵'),
+        ('網址', '學校網址'),
+    ]),
+    ('收費', [
+        ('學費', '學費'),
+        ('其他收費', '其他收費_費用'),
+    ]),
+    ('其他', [
+        ('辦學宗旨', '辦學宗旨'),
+        ('校風', '校風'),
+    ]),
+]
+
+# 頁面內容的欄位（不包括 id：id 是 CSV 行號，頁面按 page_names 的穩定名稱命名）
+PAGE_FIELDS = ['學校名稱'] + [field for _, rows in DETAIL_SECTIONS for _, field in rows]
+
+# 列表頁顯示的欄位
+LISTING_FIELDS = ['學校名稱', '區域', '小一學校網', '學校類別1', '學生性別', '宗教']
+
+LANGUAGES = ['tc', 'sc']
+
+# 頁面模板改動時遞增，令所有頁面重新生成
+EXPORT_VERSION = 1
+
+EMPTY_VALUES = ['-', '', '—', '－', '/']
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="{html_lang}">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; color: #262730; max-width: 960px; margin: 0 auto; padding: 24px; }}
+h2 {{ border-bottom: 1px solid #e2e2e6; padding-bottom: 6px; }}
+dt {{ color: #5a5a64; font-size: 0.9em; margin-top: 12px; }}
+dd {{ margin: 4px 0 0 0; }}
+table {{ border-collapse: collapse; width: 100%; }}
+td, th {{ border-bottom: 1px solid #e2e2e6; padding: 8px; text-align: left; }}
+</style>
+</head>
+<body>
+{body}
+</body>
+</html>
+'''
+
+def _t(text: Any, lang: str) -> str:
+    """轉換語言並轉義 HTML"""
+    text = str(text)
+    if lang != 'tc':
+        text = convert_text(text, lang)
+    return html.escape(text)
+
+def _page(title: str, body: str, lang: str) -> str:
+    return PAGE_TEMPLATE.format(
+        html_lang='zh-Hant-HK' if lang == 'tc' else 'zh-Hans',
+        title=title,
+        body=body
+    )
+
+def render_school_page(school: Dict[str, Any], changes: Dict[str, Tuple[Any, Any]], lang: str) -> str:
+    """生成一所學校的詳細資料頁"""
+    parts = [f"<p><a href=\"../index.html\">{_t('返回', lang)}</a></p>",
+             f"<h1>{_t(school.get('學校名稱', ''), lang)}</h1>"]
+    for section, rows in DETAIL_SECTIONS:
+        parts.append(f"<h2>{_t(section, lang)}</h2><dl>")
+        for label, field in rows:
+            parts.append(f"<dt>{_t(label, lang)}</dt><dd>{_t(school.get(field, '-'), lang)}</dd>")
+        parts.append("</dl>")
+    if changes:
+        parts.append(f"<h2>{_t('與上學年比較', lang)}</h2><dl>")
+        for label, (old_value, new_value) in changes.items():
+            parts.append(f"<dt>{_t(label, lang)}</dt><dd>{_t(old_value, lang)} → {_t(new_value, lang)}</dd>")
+        parts.append("</dl>")
+    return _page(_t(school.get('學校名稱', ''), lang), '\n'.join(parts), lang)
+
+def render_listing_page(title: str, schools: List[Dict[str, Any]], lang: str) -> str:
+    """生成學校列表頁（按校網或區域）"""
+    headers = ['學校名稱', '區域', '校網', '類型', '性別', '宗教']
+    rows = []
+    for school in schools:
+        cells = [f"<a href=\"../schools/{school['page']}.html\">{_t(school.get('學校名稱', ''), lang)}</a>"]
+        cells += [_t(school.get(field, '-'), lang) for field in LISTING_FIELDS[1:]]
+        rows.append('<tr>' + ''.join(f'<td>{cell}</td>' for cell in cells) + '</tr>')
+    body = (
+        f"<p><a href=\"../index.html\">{_t('返回', lang)}</a></p>"
+        f"<h1>{_t(title, lang)}</h1>"
+        f"<p>{len(schools)} {_t('所學校', lang)}</p>"
+        "<table><tr>" + ''.join(f'<th>{_t(h, lang)}</th>' for h in headers) + "</tr>"
+        + '\n'.join(rows) + "</table>"
+    )
+    return _page(_t(title, lang), body, lang)
+
+def render_index_page(networks: List[str], regions: List[str], lang: str) -> str:
+    """生成首頁：列出所有校網及區域"""
+    network_links = ' '.join(f"<a href=\"network/{html.escape(net)}.html\">{html.escape(net)}</a>" for net in networks)
+    region_links = ' '.join(f"<a href=\"region/{html.escape(region)}.html\">{_t(region, lang)}</a>" for region in regions)
+    body = (
+        f"<h1>{_t('香港小學選校器', lang)}</h1>"
+        f"<h2>{_t('校網', lang)}</h2><p>{network_links}</p>"
+        f"<h2>{_t('區域', lang)}</h2><p>{region_links}</p>"
+    )
+    return _page(_t('香港小學選校器', lang), body, lang)
+
+def _school_networks(school: Dict[str, Any]) -> List[str]:
+    """學校所屬校網（處理 "11/12" 格式）"""
+    school_net = str(school.get('小一學校網', '')).strip()
+    if school_net in EMPTY_VALUES:
+        return []
+    return [net.strip() for net in school_net.split('/') if net.strip()]
+
+def page_names(schools: List[Dict[str, Any]]) -> Dict[Any, str]:
+    """學校 ID -> 頁面文件名（不含擴展名）
+
+    文件名取 school_key 的哈希，CSV 中增刪學校不會改變其他學校的網址；
+    名稱及區域都相同的學校按出現次序以 unique_keys 加序號。
+    """
+    keys = unique_keys(school_key(school) for school in schools)
+    return {
+        school['id']: hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+        for school, key in zip(schools, keys)
+    }
+
+def _write_page(job: Tuple[str, str, str, Any]) -> str:
+    """進程池任務：生成頁面並寫入文件"""
+    kind, path, lang, payload = job
+    if kind == 'school':
+        school, changes = payload
+        content = render_school_page(school, changes, lang)
+    elif kind == 'school_json':
+        school, changes = payload
+        data = {field: school.get(field, '-') for field in PAGE_FIELDS}
+        if lang != 'tc':
+            data = {key: convert_text(value, lang) if isinstance(value, str) else value for key, value in data.items()}
+        data['changes'] = {
+            convert_text(label, lang) if lang != 'tc' else label: list(change)
+            for label, change in changes.items()
+        }
+        content = json.dumps(data, ensure_ascii=False, default=str)
+    elif kind == 'listing':
+        title, schools = payload
+        content = render_listing_page(title, schools, lang)
+    else:
+        networks, regions = payload
+        content = render_index_page(networks, regions, lang)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_text(content, encoding='utf-8')
+    tmp_path.replace(path)
+    return str(path)
+
+def export_site(
+    store,
+    out_dir: Path,
+    workers: Optional[int] = None,
+    force: bool = False
+) -> Dict[str, int]:
+    """把所有學校頁面及列表頁導出為靜態 HTML / JSON
+
+    學校頁面按 page_names 的穩定名稱命名；每個頁面按其內容的哈希記錄在 manifest.json 中，
+    數據未改變的頁面不會重新生成，已不存在的學校的頁面會被刪除。
+
+    Args:
+        store: SchoolStore（需包含詳細資料欄位）
+        out_dir: 輸出目錄
+        workers: 進程數，默認為 CPU 數
+        force: 忽略 manifest，全部重新生成
+
+    Returns:
+        {'written': 生成數量, 'skipped': 跳過數量, 'removed': 刪除數量}
+    """
+    out_dir = Path(out_dir)
+    manifest_path = out_dir / 'manifest.json'
+    manifest = {}
+    if manifest_path.exists() and not force:
+        manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+
+    schools = sort_schools([
+        {**school, **store.get_details(school['id'])}
+        for school in store.get_schools()
+    ])
+
+    pages_by_id = page_names(schools)
+
+    networks: Dict[str, List[Dict[str, Any]]] = {}
+    regions: Dict[str, List[Dict[str, Any]]] = {}
+    for school in schools:
+        for net in _school_networks(school):
+            networks.setdefault(net, []).append(school)
+        region = str(school.get('區域', '')).strip()
+        if region not in EMPTY_VALUES:
+            regions.setdefault(region, []).append(school)
+    network_names = sorted(networks, key=lambda net: (len(net), net))
+    region_names = sorted(regions)
+
+    # 收集所有頁面及其內容哈希
+    pages = []
+    for lang in LANGUAGES:
+        for school in schools:
+            changes = store.get_changes(school['id'])
+            digest = record_hash(school, PAGE_FIELDS, salt=[EXPORT_VERSION, lang, sorted(changes.items())])
+            payload = (school, changes)
+            page = pages_by_id[school['id']]
+            pages.append((f"{lang}/schools/{page}.html", digest, ('school', lang, payload)))
+            pages.append((f"{lang}/schools/{page}.json", digest, ('school_json', lang, payload)))
+        for kind, groups in [('network', networks), ('region', regions)]:
+            for name, members in groups.items():
+                rows = [
+                    {'page': pages_by_id[school['id']], **{field: school.get(field, '-') for field in LISTING_FIELDS}}
+                    for school in members
+                ]
+                title = f"校網 {name}" if kind == 'network' else name
+                digest = record_hash({'rows': rows}, ['rows'], salt=[EXPORT_VERSION, lang, title])
+                pages.append((f"{lang}/{kind}/{name}.html", digest, ('listing', lang, (title, rows))))
+        digest = record_hash({'n': network_names, 'r': region_names}, ['n', 'r'], salt=[EXPORT_VERSION, lang])
+        pages.append((f"{lang}/index.html", digest, ('index', lang, (network_names, region_names))))
+
+    jobs = []
+    new_manifest = {}
+    for relative_path, digest, (kind, lang, payload) in pages:
+        new_manifest[relative_path] = digest
+        if manifest.get(relative_path) == digest and (out_dir / relative_path).exists():
+            continue
+        jobs.append((kind, str(out_dir / relative_path), lang, payload))
+
+    if workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            _write_page(job)
+    elif jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_write_page, jobs, chunksize=32))
+
+    # 刪除已不存在的頁面
+    removed = 0
+    for relative_path in manifest:
+        if relative_path not in new_manifest:
+            (out_dir / relative_path).unlink(missing_ok=True)
+            removed += 1
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path.write_text(json.dumps(new_manifest, ensure_ascii=False, indent=0), encoding='utf-8')
+    return {'written': len(jobs), 'skipped': len(pages) - len(jobs), 'removed': removed}
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='導出靜態學校頁面（繁體及簡體）')
+    parser.add_argument('csv', type=Path, help='本學年學校資料 CSV 文件')
+    parser.add_argument('--history', type=Path, help='歷年數據目錄（文件名即年度標籤）')
+    parser.add_argument('--out', type=Path, default=Path('site'), help='輸出目錄')
+    parser.add_argument('--workers', type=int, help='進程數（默認為 CPU 數）')
+    parser.add_argument('--force', action='store_true', help='忽略 manifest，全部重新生成')
+    args = parser.parse_args(argv)
+
+    versions = {}
+    if args.history and args.history.exists():
+        for path in sorted(args.history.glob('*.csv')):
+            versions[path.stem] = path
+    versions['本學年'] = args.csv
+
+    stats = export_site(load_store(versions), args.out, workers=args.workers, force=args.force)
+    print(f"生成 {stats['written']} 個頁面，跳過 {stats['skipped']} 個未改變的頁面，"
+          f"刪除 {stats['removed']} 個過期頁面 -> {args.out}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,437 @@
+import hashlib
+import json
+import re
+import struct
+from array import array
+from pathlib import Path
+from typing import Iterable, List, Dict, Any, Optional, Tuple
+
+from .csv_parser import load_schools
+from .detail_store import DetailStore, build_detail_store, open_detail_store
+from .entities import clean_name, entity_key
+
+# 「與上學年比較」顯示的欄位：顯示名稱 -> CSV 欄位
+CHANGE_FIELDS = {
+    '班數': '本學年總班數',
+    '教師人數': '教師總人數',
+    '學費': '學費',
+}
+
+# 只有一個年度的數據時，班數可以用同一行的上學年欄位作比較
+SAME_ROW_PREVIOUS_FIELDS = {
+    '班數': '上學年總班數',
+}
+
+# 計算變化需要的欄位，無論是否投影都會保留
+CHANGE_SOURCE_FIELDS = list(CHANGE_FIELDS.values()) + list(SAME_ROW_PREVIOUS_FIELDS.values())
+
+# 跨年度識別同一所學校的欄位（school_key 的名稱及區域；改名的學校按地址對應），無論是否投影都會保留
+KEY_FIELDS = ['學校名稱', '區域', '學校地址']
+
+EMPTY_VALUES = ['-', '', '—', '－']
+
+# 快照文件格式：魔數 + 版本 + 索引長度 + JSON 索引 + 每個年度每個欄位的編碼數組
+# 索引為 {'sources', 'columns', 'labels', 'fields', 'rows', 'values'}，
+# 編碼數組按 labels、fields 的順序緊接存放，每個數組 rows[label] 個 uint32
+SNAPSHOT_MAGIC = b'SSSN1'
+SNAPSHOT_HEADER = struct.Struct('<5sII')
+
+# 快照格式或 CSV 解析規則（csv_parser 的欄位清理、類型轉換等）改動時遞增；
+# 版本不同的快照即使比 CSV 新也不會使用，會重新解析 CSV 並覆蓋
+SNAPSHOT_VERSION = 2
+
+class SchoolStore:
+    """多年度學校數據存儲
+
+    每個年度的數據按列存儲，每個單元格只保存一個整數編碼，
+    實際值存放在所有年度共用的值池中，因此跨年度未變的值只保存一次。
+    加入新年度時會預先計算每所學校相對上一年度的變化。
+    """
+
+    def __init__(self):
+        # 所有年度共用的值池
+        self._values: List[Any] = []
+        self._value_codes: Dict[Tuple[type, Any], int] = {}
+        # 年度標籤（按加入順序，最後一個為最新年度）
+        self._labels: List[str] = []
+        # 年度 -> 欄位 -> 編碼數組
+        self._columns: Dict[str, Dict[str, array]] = {}
+        # 年度 -> 學校 ID -> 行號
+        self._ids: Dict[str, Dict[Any, int]] = {}
+        # 最新年度的行號 -> {顯示名稱: (上年度值, 本年度值)}
+        self._changes: Dict[int, Dict[str, Tuple[Any, Any]]] = {}
+        # 最新年度的詳細資料存儲（按需讀取）
+        self.details: Optional[DetailStore] = None
+
+    @property
+    def labels(self) -> List[str]:
+        """所有年度標籤（由舊到新）"""
+        return list(self._labels)
+
+    @property
+    def latest(self) -> Optional[str]:
+        """最新年度標籤"""
+        return self._labels[-1] if self._labels else None
+
+    def _encode(self, value: Any) -> int:
+        """將值放入值池並返回其編碼"""
+        key = (type(value), value)
+        code = self._value_codes.get(key)
+        if code is None:
+            code = len(self._values)
+            self._values.append(value)
+            self._value_codes[key] = code
+        return code
+
+    def add_version(self, label: str, schools: List[Dict[str, Any]], columns: Optional[List[str]] = None):
+        """加入一個年度的學校數據
+
+        Args:
+            label: 年度標籤，例如 '2024/25'
+            schools: load_schools 返回的學校列表
+            columns: 只保留這些欄位（計算變化需要的欄位會額外保留）；None 表示保留所有欄位
+        """
+        if label in self._columns:
+            raise ValueError(f"Dataset version already loaded: {label}")
+
+        fields: List[str] = []
+        for school in schools:
+            for key in school:
+                if key not in fields:
+                    fields.append(key)
+        if columns is not None:
+            kept = set(columns) | set(CHANGE_SOURCE_FIELDS) | set(KEY_FIELDS)
+            fields = [field for field in fields if field in kept]
+
+        missing = self._encode('-')
+        encoded = {field: array('I', [missing]) * len(schools) for field in fields}
+        for row, school in enumerate(schools):
+            for key, codes in encoded.items():
+                if key in school:
+                    codes[row] = self._encode(school[key])
+
+        self._labels.append(label)
+        self._columns[label] = encoded
+        self._index_rows(label)
+        self._changes = self._compute_changes()
+
+    def _row_count(self, label: str) -> int:
+        """年度的行數（取自編碼數組的長度；名稱索引中重複或空白的名稱只佔一項）"""
+        return len(next(iter(self._columns[label].values()), ()))
+
+    def _index_rows(self, label: str):
+        """建立年度的學校 ID 行號索引"""
+        count = self._row_count(label)
+        ids = self._columns[label].get('id')
+        self._ids[label] = {self._values[ids[row]]: row for row in range(count)} if ids else {}
+
+    def get_value(self, label: str, row: int, field: str, default: Any = '-') -> Any:
+        """讀取指定年度某一行的單個欄位"""
+        column = self._columns[label].get(field)
+        if column is None:
+            return default
+        return self._values[column[row]]
+
+    def get_schools(self, label: Optional[str] = None) -> List[Dict[str, Any]]:
+        """還原指定年度（默認最新年度）的學校列表"""
+        label = label or self.latest
+        if label is None:
+            return []
+        columns = self._columns[label]
+        values = self._values
+        return [
+            {field: values[codes[row]] for field, codes in columns.items()}
+            for row in range(self._row_count(label))
+        ]
+
+    def select(self, school_ids: List[Any], fields: List[str], label: Optional[str] = None) -> Dict[str, List[Any]]:
+        """按列讀取指定學校的指定欄位（默認最新年度）
+
+        Returns:
+            欄位 -> 按 school_ids 順序排列的值列表；不在內存中的欄位不會返回
+        """
+        label = label or self.latest
+        if label is None:
+            return {}
+        rows = [self._ids[label][school_id] for school_id in school_ids if school_id in self._ids[label]]
+        columns = self._columns[label]
+        values = self._values
+        return {
+            field: [values[columns[field][row]] for row in rows]
+            for field in fields
+            if field in columns
+        }
+
+    def get_details(self, school_id: Any) -> Dict[str, Any]:
+        """按需讀取最新年度一所學校的詳細資料欄位"""
+        if self.details is None:
+            return {}
+        return self.details.get(school_id)
+
+    def get_changes(self, school_id: Any) -> Dict[str, Tuple[Any, Any]]:
+        """獲取最新年度一所學校（按學校 ID）相對上一年度的變化（預先計算，O(1) 查找）"""
+        row = self._ids[self.latest].get(school_id) if self.latest else None
+        return self._changes.get(row, {}) if row is not None else {}
+
+    def count_values(self) -> int:
+        """值池中不重複值的數量"""
+        return len(self._values)
+
+    def _records(self, label: str, fields: List[str]) -> List[Dict[str, Any]]:
+        """還原年度每一行的指定欄位（不在內存中的欄位不會包括）"""
+        columns = self._columns[label]
+        fields = [field for field in fields if field in columns]
+        values = self._values
+        return [
+            {field: values[columns[field][row]] for field in fields}
+            for row in range(self._row_count(label))
+        ]
+
+    def _compute_changes(self) -> Dict[int, Dict[str, Tuple[Any, Any]]]:
+        """計算最新年度每所學校相對上一年度的變化"""
+        fields = KEY_FIELDS + CHANGE_SOURCE_FIELDS
+        previous = self._records(self._labels[-2], fields) if len(self._labels) > 1 else None
+        return compute_changes(previous, self._records(self.latest, fields))
+
+def _address_key(address: Any) -> str:
+    address = re.sub(r'\s+', '', clean_name(address)).lower()
+    return '' if address in EMPTY_VALUES else address
+
+def school_key(school: Dict[str, Any]) -> str:
+    """學校的穩定鍵：規範化的學校名稱（entity_key）加區域
+
+    id 只是 CSV 的行號，刪除或插入一行就會改變其後所有學校的 id，不能用於跨數據版本識別學校。
+    """
+    return f"{entity_key(school.get('學校名稱', ''))}|{clean_name(school.get('區域', ''))}"
+
+def unique_keys(keys: Iterable[str]) -> List[str]:
+    """重複的鍵按出現次序加「#2」「#3」等序號，令每一行都有不同的鍵"""
+    seen: Dict[str, int] = {}
+    result = []
+    for key in keys:
+        seen[key] = seen.get(key, 0) + 1
+        result.append(key if seen[key] == 1 else f"{key}#{seen[key]}")
+    return result
+
+def match_previous(previous: List[Dict[str, Any]], current: List[Dict[str, Any]]) -> Dict[int, int]:
+    """本年度行號 -> 上一年度行號
+
+    先按學校鍵（school_key，重複的以 unique_keys 加序號）對應；鍵對應不上的學校（例如改了名）
+    再按地址對應，只採用兩個年度中都唯一的地址。
+    """
+    previous_rows = {key: row for row, key in enumerate(unique_keys(school_key(school) for school in previous))}
+    matched = {}
+    for row, key in enumerate(unique_keys(school_key(school) for school in current)):
+        if key in previous_rows:
+            matched[row] = previous_rows[key]
+
+    def unmatched_addresses(schools: List[Dict[str, Any]], skipped) -> Dict[str, Optional[int]]:
+        addresses: Dict[str, Optional[int]] = {}
+        for row, school in enumerate(schools):
+            address = _address_key(school.get('學校地址', ''))
+            if address and row not in skipped:
+                addresses[address] = row if address not in addresses else None
+        return addresses
+
+    previous_addresses = unmatched_addresses(previous, set(matched.values()))
+    for address, row in unmatched_addresses(current, matched).items():
+        prev_row = previous_addresses.get(address)
+        if row is not None and prev_row is not None:
+            matched[row] = prev_row
+    return matched
+
+def compute_changes(
+    previous: Optional[List[Dict[str, Any]]],
+    current: List[Dict[str, Any]]
+) -> Dict[int, Dict[str, Tuple[Any, Any]]]:
+    """計算本年度每所學校相對上一年度的變化
+
+    Args:
+        previous: 上一年度的學校（需包含 KEY_FIELDS 及 CHANGE_FIELDS 的欄位）；None 表示沒有往年數據，
+            此時按 SAME_ROW_PREVIOUS_FIELDS 與同一行的上學年欄位比較
+        current: 本年度的學校
+
+    Returns:
+        本年度行號 -> {顯示名稱: (上年度值, 本年度值)}，沒有變化的學校不包括
+    """
+    matched = match_previous(previous, current) if previous is not None else {}
+    changes = {}
+    for row, school in enumerate(current):
+        old_school = previous[matched[row]] if row in matched else None
+        school_changes = {}
+        for label, field in CHANGE_FIELDS.items():
+            if field not in school:
+                continue
+            if old_school is not None:
+                if field not in old_school:
+                    continue
+                old_value = old_school[field]
+            elif SAME_ROW_PREVIOUS_FIELDS.get(label) in school:
+                old_value = school[SAME_ROW_PREVIOUS_FIELDS[label]]
+            else:
+                continue
+            new_value = school[field]
+            # 與值池的編碼相同：類型及值都相同才算沒有變化
+            if (type(old_value), old_value) == (type(new_value), new_value):
+                continue
+            if str(old_value).strip() in EMPTY_VALUES and str(new_value).strip() in EMPTY_VALUES:
+                continue
+            school_changes[label] = (old_value, new_value)
+        if school_changes:
+            changes[row] = school_changes
+    return changes
+
+def load_changes(versions: Dict[str, Path]) -> Dict[Any, Dict[str, Tuple[Any, Any]]]:
+    """從 CSV 計算最新年度的變化，不建立 SchoolStore（用於 SQLite 文件）
+
+    只讀取最新兩個年度計算變化需要的欄位。
+
+    Returns:
+        最新年度學校 ID -> {顯示名稱: (上年度值, 本年度值)}
+    """
+    fields = ['id'] + KEY_FIELDS + CHANGE_SOURCE_FIELDS
+    years = [load_schools(path, fields) for path in list(versions.values())[-2:]]
+    if not years:
+        return {}
+    current = years[-1]
+    previous = years[0] if len(years) == 2 else None
+    return {current[row]['id']: changes for row, changes in compute_changes(previous, current).items()}
+
+def record_hash(record: Dict[str, Any], fields: List[str], salt: Any = '') -> str:
+    """計算一條記錄中指定欄位的內容哈希，用於判斷衍生文件是否需要重新生成"""
+    payload = json.dumps(
+        [salt] + [record.get(field, '-') for field in fields],
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:24]
+
+def _snapshot_sources(versions: Dict[str, Path]) -> List[List[str]]:
+    return [[label, str(Path(path).resolve())] for label, path in versions.items()]
+
+def save_snapshot(store: SchoolStore, path: Path, versions: Dict[str, Path], columns: Optional[List[str]] = None):
+    """把 SchoolStore 的值池及編碼數組寫入快照文件
+
+    快照只保存常駐內存的部分；詳細資料仍在詳細資料存儲中。
+    讀取快照只需要 json 和 array，不需要導入 pandas。
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fields = {label: list(store._columns[label]) for label in store._labels}
+    index = {
+        'sources': _snapshot_sources(versions),
+        'columns': None if columns is None else list(columns),
+        'labels': store._labels,
+        'fields': fields,
+        'rows': {label: store._row_count(label) for label in store._labels},
+        'values': store._values,
+    }
+    index_bytes = json.dumps(index, ensure_ascii=False).encode('utf-8')
+    # 先寫臨時文件再替換，避免其他進程讀到寫了一半的文件
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(index_bytes)))
+        f.write(index_bytes)
+        for label in store._labels:
+            for field in fields[label]:
+                f.write(store._columns[label][field].tobytes())
+    tmp_path.replace(path)
+
+def open_snapshot(path: Path, versions: Dict[str, Path], columns: Optional[List[str]] = None) -> Optional[SchoolStore]:
+    """從快照文件還原 SchoolStore
+
+    如果文件不存在、格式或版本不對、年度或欄位不同、或比任何來源 CSV 舊，返回 None。
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    mtime = path.stat().st_mtime
+    if any(Path(source).stat().st_mtime > mtime for source in versions.values()):
+        return None
+    try:
+        data = path.read_bytes()
+        magic, version, index_length = SNAPSHOT_HEADER.unpack_from(data, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            return None
+        start = SNAPSHOT_HEADER.size
+        index = json.loads(data[start:start + index_length].decode('utf-8'))
+    except (struct.error, UnicodeDecodeError, json.JSONDecodeError):
+        return None
+    expected_columns = None if columns is None else list(columns)
+    if index.get('sources') != _snapshot_sources(versions) or index.get('columns') != expected_columns:
+        return None
+
+    store = SchoolStore()
+    store._values = index['values']
+    store._value_codes = {(type(value), value): code for code, value in enumerate(store._values)}
+    offset = start + index_length
+    for label in index['labels']:
+        count = index['rows'][label]
+        encoded = {}
+        for field in index['fields'][label]:
+            codes = array('I')
+            size = count * codes.itemsize
+            codes.frombytes(data[offset:offset + size])
+            if len(codes) != count:
+                return None
+            encoded[field] = codes
+            offset += size
+        store._labels.append(label)
+        store._columns[label] = encoded
+        store._index_rows(label)
+    if store._labels:
+        store._changes = store._compute_changes()
+    return store
+
+def load_store(
+    versions: Dict[str, Path],
+    columns: Optional[List[str]] = None,
+    detail_fields: Optional[List[str]] = None,
+    detail_path: Optional[Path] = None,
+    snapshot_path: Optional[Path] = None
+) -> SchoolStore:
+    """按年度加載多個 CSV 文件
+
+    Args:
+        versions: 年度標籤 -> CSV 路徑（由舊到新）
+        columns: 常駐內存的欄位；None 表示所有欄位
+        detail_fields: 寫入詳細資料存儲、按需讀取的欄位（只用於最新年度）
+        detail_path: 詳細資料存儲文件路徑
+        snapshot_path: 快照文件路徑；快照比所有 CSV 新時直接讀取快照，
+            不需要解析 CSV（也不會導入 pandas），否則完整加載後重新寫入快照
+
+    Returns:
+        包含所有年度數據的 SchoolStore
+    """
+    csv_path = list(versions.values())[-1] if versions else None
+
+    if snapshot_path is not None and csv_path is not None:
+        details = None
+        if detail_fields and detail_path:
+            details = open_detail_store(detail_path, detail_fields, source=csv_path)
+        if details is not None or not (detail_fields and detail_path):
+            store = open_snapshot(snapshot_path, versions, columns)
+            if store is not None:
+                store.details = details
+                return store
+            if details is not None:
+                details.close()
+
+    store = SchoolStore()
+    read_columns = None
+    if columns is not None:
+        read_columns = list(columns) + list(detail_fields or []) + CHANGE_SOURCE_FIELDS
+
+    schools: List[Dict[str, Any]] = []
+    for label, path in versions.items():
+        schools = load_schools(path, read_columns)
+        store.add_version(label, schools, columns)
+
+    if detail_fields and detail_path and csv_path is not None:
+        store.details = (
+            open_detail_store(detail_path, detail_fields, source=csv_path)
+            or build_detail_store(detail_path, schools, detail_fields)
+        )
+    if snapshot_path is not None and csv_path is not None:
+        save_snapshot(store, snapshot_path, versions, columns)
+    return store
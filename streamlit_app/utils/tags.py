@@ -0,0 +1,182 @@
+
+import argparse
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+from .csv_parser import load_schools
+from .fields import SEARCH_FIELDS
+
+# 熱門標籤
+POPULAR_TAGS = [
+    'STEAM',
+    'AI/人工智能',
+    '愉快/Happy School',
+    '關愛',
+    '兩文三語/英語教育',
+    '中華文化',
+    '電子學習',
+    '創意',
+    '自主學習',
+    '音樂',
+    '體育',
+    '藝術'
+]
+
+# 需要特別指定關鍵詞的標籤，其餘標籤按「/」拆分，每一部分都是關鍵詞
+TAG_KEYWORDS = {
+    '兩文三語/英語教育': ['兩文三語', '英語學習', '英語活動'],
+}
+
+def tag_keywords(tag: str) -> List[str]:
+    """標籤的關鍵詞（小寫），符合任何一個即算符合"""
+    keywords = TAG_KEYWORDS.get(tag) or [part.strip() for part in tag.split('/') if part.strip()]
+    return [keyword.lower() for keyword in keywords]
+
+def _search_text(school: Dict[str, Any]) -> str:
+    return ' '.join(str(school.get(field, '')) for field in SEARCH_FIELDS).lower()
+
+class TagIndex:
+    """每所學校一個整數位圖，第 j 位表示是否符合第 j 個標籤
+
+    每個數據集只計算一次，篩選多個標籤時只需要一次按位與。
+    """
+
+    def __init__(self, schools: List[Dict[str, Any]], tags: List[str] = None):
+        self.tags = list(tags or POPULAR_TAGS)
+        self.tag_bits = {tag: 1 << j for j, tag in enumerate(self.tags)}
+        self.positions = {school.get('id'): i for i, school in enumerate(schools)}
+        keyword_sets = [tag_keywords(tag) for tag in self.tags]
+        self.masks: List[int] = []
+        for school in schools:
+            text = _search_text(school)
+            mask = 0
+            for j, keywords in enumerate(keyword_sets):
+                if any(keyword in text for keyword in keywords):
+                    mask |= 1 << j
+            self.masks.append(mask)
+
+    def __contains__(self, tag: str) -> bool:
+        return tag in self.tag_bits
+
+    def required_mask(self, tags: List[str]) -> int:
+        """多個標籤合併為一個位圖（只包括已索引的標籤）"""
+        required = 0
+        for tag in tags:
+            required |= self.tag_bits.get(tag, 0)
+        return required
+
+    def filter(self, schools: List[Dict[str, Any]], tags: List[str]) -> List[Dict[str, Any]]:
+        """保留符合所有標籤的學校（tags 須全部已索引）"""
+        required = self.required_mask(tags)
+        if not required:
+            return schools
+        masks = self.masks
+        positions = self.positions
+        return [
+            school for school in schools
+            if school.get('id') in positions and masks[positions[school.get('id')]] & required == required
+        ]
+
+    def coverage(self) -> Dict[str, int]:
+        """每個標籤符合的學校數量"""
+        return {
+            tag: sum(1 for mask in self.masks if mask & bit)
+            for tag, bit in self.tag_bits.items()
+        }
+
+# 不會出現在標籤開頭或結尾的虛詞
+STOP_CHARACTERS = set('的及和與或在為是有了等之以並於其各把由從對將')
+
+def mine_tags(
+    schools: List[Dict[str, Any]],
+    min_length: int = 2,
+    max_length: int = 4,
+    min_coverage: float = 0.03,
+    max_coverage: float = 0.3,
+    limit: int = 50,
+    exclude: Optional[List[str]] = None
+) -> List[Tuple[str, int]]:
+    """從學校特色文本中找出常見而有區分度的詞，作為新標籤的建議
+
+    中文按連續漢字取 n-gram，英文按單詞；每所學校只計一次。出現在太多學校的詞
+    （如「學生」）沒有區分度，會被排除。幾乎總是跟著同一個字出現的片段
+    （如「民教育」之於「公民教育」），以及被較長的詞包含且覆蓋學校數相近的片段
+    （如「子學習」之於「電子學習」）只保留完整的詞。
+
+    Args:
+        schools: 學校列表
+        min_length / max_length: 中文 n-gram 的長度範圍
+        min_coverage / max_coverage: 覆蓋學校的比例範圍
+        limit: 最多返回的數量
+        exclude: 已有標籤，包含或被包含於其關鍵詞的詞不會返回
+
+    Returns:
+        [(詞, 覆蓋學校數量), ...]，按區分度排序
+    """
+    if not schools:
+        return []
+    total = len(schools)
+    document_frequency = Counter()
+    for school in schools:
+        text = _search_text(school)
+        grams = set()
+        for run in re.findall(r'[一-鿿]+', text):
+            # 多取一個長度，用來判斷片段是否總是跟著同一個字
+            for n in range(min_length, max_length + 2):
+                for i in range(len(run) - n + 1):
+                    grams.add(run[i:i + n])
+        grams.update(word for word in re.findall(r'[a-z]{3,}', text))
+        document_frequency.update(grams)
+
+    low = max(2, math.ceil(total * min_coverage))
+    high = total * max_coverage
+    candidates = {
+        gram: count for gram, count in document_frequency.items()
+        if low <= count <= high and len(gram) <= max_length
+        and gram[0] not in STOP_CHARACTERS and gram[-1] not in STOP_CHARACTERS
+    }
+
+    # 向左或向右多取一個字後覆蓋學校數相近：這只是較長詞語的片段
+    extensions = Counter()
+    for gram, count in document_frequency.items():
+        if len(gram) > min_length and re.match(r'[一-鿿]', gram):
+            for part in (gram[1:], gram[:-1]):
+                extensions[part] = max(extensions[part], count)
+
+    # 片段被較長的詞包含且覆蓋相近時，只保留較長的詞
+    redundant = {gram for gram, count in candidates.items() if extensions[gram] >= count * 0.8}
+    for gram, count in candidates.items():
+        for n in range(min_length, len(gram)):
+            for i in range(len(gram) - n + 1):
+                part = gram[i:i + n]
+                if part in candidates and candidates[part] <= count * 1.1:
+                    redundant.add(part)
+
+    known = [keyword for tag in (exclude or []) for keyword in tag_keywords(tag)]
+    results = [
+        (gram, count) for gram, count in candidates.items()
+        if gram not in redundant and not any(gram in keyword or keyword in gram for keyword in known)
+    ]
+    # 類似 TF-IDF：覆蓋越多越常見，但太普遍的詞區分度較低
+    results.sort(key=lambda item: (-item[1] * math.log(total / item[1]), item[0]))
+    return results[:limit]
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='統計標籤覆蓋並建議新的學校特色標籤')
+    parser.add_argument('csv', type=Path, help='學校資料 CSV 文件')
+    parser.add_argument('--limit', type=int, default=30, help='建議標籤的數量')
+    args = parser.parse_args(argv)
+
+    schools = load_schools(args.csv, ['id'] + SEARCH_FIELDS)
+    print(f"標籤覆蓋（共 {len(schools)} 所學校）：")
+    for tag, count in TagIndex(schools).coverage().items():
+        print(f"  {tag}: {count}")
+    print("建議標籤：")
+    for gram, count in mine_tags(schools, limit=args.limit, exclude=POPULAR_TAGS):
+        print(f"  {gram}: {count}")
+
+if __name__ == '__main__':
+    main()
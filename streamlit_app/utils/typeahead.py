@@ -0,0 +1,113 @@
+
+import heapq
+import re
+from bisect import bisect_left
+from typing import List, Dict, Any, Optional, Tuple
+
+from .i18n import convert_text
+from .fields import SEARCH_FIELDS
+from .tags import POPULAR_TAGS, TAG_KEYWORDS, mine_tags
+from .entities import EntityIndex
+
+# 補全類型
+KIND_NAME = 'name'
+KIND_SPONSOR = 'sponsor'
+KIND_MOTTO = 'motto'
+KIND_TERM = 'term'
+
+EMPTY_VALUES = ['-', '', '—', '－']
+
+# 建立補全索引需要的欄位（只讀取部分欄位時使用）
+SOURCE_FIELDS = ['學校名稱', '辦學團體', '校訓'] + SEARCH_FIELDS
+
+def _split_motto(motto: str) -> List[str]:
+    """把「敬誠孝勤　敦品勵學」拆成獨立的句子"""
+    parts = re.split(r'[\s，,、。；;：:！!「」『』()（）　]+', str(motto))
+    return [part for part in parts if len(part) >= 2]
+
+class Typeahead:
+    """輸入補全索引：按鍵排序的數組，前綴查找用二分搜索
+
+    學校名稱及辦學團體的每個後綴都建立索引（與名稱搜索的子字符串匹配一致），
+    校訓及特色詞只按前綴。每個條目同時以繁體及簡體建立鍵，兩種輸入都能補全。
+    """
+
+    def __init__(self, entries: List[Tuple[str, str, int]]):
+        """
+        Args:
+            entries: [(顯示文字, 類型, 權重), ...]；權重通常為相關學校數量
+        """
+        rows = []
+        for display, kind, weight in entries:
+            suffixes = kind in (KIND_NAME, KIND_SPONSOR)
+            for text in {display, convert_text(display, 'sc')}:
+                text = text.lower()
+                starts = range(len(text)) if suffixes else [0]
+                for offset in starts:
+                    rows.append((text[offset:], offset, display, kind, weight))
+        rows.sort(key=lambda row: row[0])
+        self._keys = [row[0] for row in rows]
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def complete(self, prefix: str, k: int = 8, kinds: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+        """返回前 k 個補全 [(顯示文字, 類型), ...]
+
+        權重高的優先；權重相同時，匹配位置靠前、文字較短的優先。
+        """
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        start = bisect_left(self._keys, prefix)
+        # 前綴範圍的結束位置：所有以 prefix 開頭的鍵都小於 prefix + 最大字符
+        end = bisect_left(self._keys, prefix + '\U0010ffff', lo=start)
+        candidates = (
+            row for row in self._rows[start:end]
+            if kinds is None or row[3] in kinds
+        )
+        # 同一條目可能有多個後綴或兩種字體的鍵命中，多取一些再去重
+        best = heapq.nsmallest(
+            k * 4,
+            candidates,
+            key=lambda row: (-row[4], row[1], len(row[2]), row[2])
+        )
+        results = []
+        seen = set()
+        for _, _, display, kind, _ in best:
+            if (display, kind) not in seen:
+                seen.add((display, kind))
+                results.append((display, kind))
+                if len(results) == k:
+                    break
+        return results
+
+def build_typeahead(
+    schools: List[Dict[str, Any]],
+    mined_terms: int = 200,
+    entity_index: Optional[EntityIndex] = None
+) -> Typeahead:
+    """從學校數據建立補全索引：學校名稱、辦學團體（規範化名稱）、校訓及特色詞"""
+    entries = []
+    mottos: Dict[str, int] = {}
+    for school in schools:
+        name = str(school.get('學校名稱', '')).strip()
+        if name and name not in EMPTY_VALUES:
+            entries.append((name, KIND_NAME, 1))
+        for part in _split_motto(school.get('校訓', '')):
+            mottos[part] = mottos.get(part, 0) + 1
+
+    sponsors = (entity_index or EntityIndex(schools)).sponsors
+    entries.extend((sponsors.name(i), KIND_SPONSOR, sponsors.count(i)) for i in range(len(sponsors)))
+    entries.extend((motto, KIND_MOTTO, count) for motto, count in mottos.items())
+
+    # 熱門標籤的關鍵詞及從特色文本挖掘出的詞
+    terms = {gram: count for gram, count in mine_tags(schools, limit=mined_terms)}
+    texts = [' '.join(str(school.get(field, '')) for field in SEARCH_FIELDS).lower() for school in schools]
+    for tag in POPULAR_TAGS:
+        for keyword in TAG_KEYWORDS.get(tag) or tag.split('/'):
+            keyword = keyword.strip()
+            terms.setdefault(keyword, sum(1 for text in texts if keyword.lower() in text))
+    entries.extend((term, KIND_TERM, count) for term, count in terms.items())
+    return Typeahead(entries)